@@ -29,11 +29,16 @@ setup(
             'uadt-usb-reset = uadt.automation.usbreset:main',
             'uadt-splitter = uadt.analysis.splitter:main',
             'uadt-dataset = uadt.analysis.dataset:main',
+            'uadt-dataset-worker = uadt.analysis.remote:main',
+            'uadt-cache = uadt.analysis.cache:main',
+            'uadt-segments = uadt.analysis.segments:main',
             'uadt-timeline = uadt.analysis.timeline:main',
             'uadt-live = uadt.analysis.live:main',
             'uadt-model-svm = uadt.analysis.svm:main',
             'uadt-model-tree = uadt.analysis.tree:main',
             'uadt-model-forest = uadt.analysis.randomforest:main',
+            'uadt-model-approximate-svm = uadt.analysis.approxsvm:main',
+            'uadt-benchmark = uadt.analysis.benchmark:main',
         ]
     },
 )
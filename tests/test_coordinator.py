@@ -0,0 +1,138 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from uadt import config
+from uadt.analysis.coordinator import LeaseQueue
+from uadt.analysis.dataset import DatasetProcessor
+from uadt.analysis.flow import Flow
+from uadt.analysis.journal import format_rows
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The workers produce a single empty row for every file, the captures are
+# never parsed
+WORKER = """
+import sys
+from uadt.analysis.dataset import DatasetProcessor
+from uadt.analysis.remote import main
+
+DatasetProcessor.process_chunk = staticmethod(
+    lambda paths, *arguments: [(path, [{}]) for path in paths])
+sys.argv = ['uadt-dataset-worker'] + sys.argv[1:]
+main()
+"""
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.05)
+
+
+def start_worker(queue_dir, worker):
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [ROOT, environment.get('PYTHONPATH')]))
+    return subprocess.Popen(
+        [sys.executable, '-c', WORKER, queue_dir, '--worker-id', worker],
+        env=environment,
+    )
+
+
+def test_coordinator_with_workers_on_one_host(tmp_path, monkeypatch, capsys):
+    """
+    Runs the coordinator and two worker processes on one host. One task is
+    claimed by a worker which stops renewing its lease, so the lease
+    expires and the task is claimed again, and both claims complete it.
+    Only one of the results is used.
+    """
+
+    monkeypatch.setattr(config, 'NUM_JOBS', 1, raising=False)
+
+    directory = tmp_path / 'captures'
+    directory.mkdir()
+    for number in range(3):
+        capture = directory / 'user_search-2017010{0}_101010.pcap'.format(number)
+        capture.write_bytes(b'capture')
+
+    output = str(tmp_path / 'dataset.csv')
+    queue_dir = str(tmp_path / 'queue')
+    queue = LeaseQueue(queue_dir)
+
+    processor = DatasetProcessor(str(directory), output, use_cache=False,
+                                 chunk_size=1, coordinate=queue_dir,
+                                 lease_timeout=2)
+    coordinator = threading.Thread(target=processor.process)
+    coordinator.start()
+
+    # A worker claims a task and stops responding
+    wait_for(lambda: os.path.isdir(queue.pending)
+             and len(os.listdir(queue.pending)) == 3)
+    task_id, task, stalled_lease = queue.claim('stalled')
+
+    # A worker of an interrupted job completes a task of the same number
+    path = task['arguments'][0][0]
+    data = format_rows([{}], Flow.plan.feature_names).decode('utf-8')
+    queue.complete('000000', 'interrupted', stalled_lease + '.interrupted',
+                   {'result': [0.0, [['removed.pcap', 1, data]], []]})
+
+    # Its lease expires and another worker claims the task again
+    wait_for(lambda: not os.path.exists(stalled_lease))
+    reclaimed_id, _, reclaimed_lease = queue.claim('reclaimed')
+    assert reclaimed_id == task_id
+
+    # Both complete the task
+    for worker, lease in (('reclaimed', reclaimed_lease),
+                          ('stalled', stalled_lease)):
+        queue.complete(task_id, worker, lease,
+                       {'result': [0.0, [[path, 1, data]], []]})
+
+    # The workers process the remaining tasks
+    workers = [start_worker(queue_dir, 'worker{0}'.format(n)) for n in range(2)]
+    coordinator.join(60)
+    assert not coordinator.is_alive()
+    for worker in workers:
+        assert worker.wait(60) == 0
+
+    printed = capsys.readouterr().out
+    assert "Leases expired: 1, duplicate results dropped: 1" in printed
+
+    # Every file produced its row exactly once
+    with open(output) as dataset:
+        lines = dataset.read().splitlines()
+    assert len(lines) == 4
+
+
+def test_claimed_lease_starts_at_the_claim(tmp_path):
+    """
+    Tasks which waited in the queue for longer than the lease timeout do
+    not expire right after they are claimed.
+    """
+
+    queue = LeaseQueue(str(tmp_path / 'queue'))
+    queue.create({'lease_timeout': 5})
+    queue.publish('000000', {'arguments': []})
+
+    # The task was published long before it is claimed
+    published = os.path.join(queue.pending, '000000.json')
+    os.utime(published, (queue.now() - 10, queue.now() - 10))
+
+    task_id, _, lease = queue.claim('worker')
+    assert task_id == '000000'
+    assert list(queue.expire(5)) == []
+    assert os.path.exists(lease)
+
+
+def test_claim_from_finished_job(tmp_path):
+    queue = LeaseQueue(str(tmp_path / 'queue'))
+    queue.create({})
+    queue.publish('000000', {'arguments': []})
+    queue.finish()
+
+    assert queue.finished
+    assert queue.claim('worker') is None
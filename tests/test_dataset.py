@@ -0,0 +1,120 @@
+import os
+import re
+import time
+
+from uadt import config
+from uadt.analysis import schedule, workers
+from uadt.analysis.dataset import DatasetProcessor
+from uadt.analysis.flow import Flow
+from uadt.analysis.journal import format_rows
+
+
+def process_chunk(paths, first_index, files_count, backend=None,
+                  use_cache=True, split=None, memory_limit=None):
+    # Every file produces a single empty row, the capture is never parsed
+    return [(path, [{}]) for path in paths]
+
+
+def build(directory, output, capsys):
+    """
+    Builds the dataset, returns the number of processed files.
+    """
+
+    DatasetProcessor(directory, output, use_cache=False).process()
+    printed = capsys.readouterr().out
+    return int(re.search(r'Processing (\d+) of', printed).group(1))
+
+
+def touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_touched_file_is_skipped(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(config, 'NUM_JOBS', 1, raising=False)
+    monkeypatch.setattr(DatasetProcessor, 'process_chunk',
+                        staticmethod(process_chunk))
+
+    directory = tmp_path / 'captures'
+    directory.mkdir()
+    capture = directory / 'user_search-20170102_101010.pcap'
+    capture.write_bytes(b'capture')
+    output = str(tmp_path / 'dataset.csv')
+
+    assert build(str(directory), output, capsys) == 1
+    assert build(str(directory), output, capsys) == 0
+
+    # The first change of the signature records the content hash
+    touch(str(capture))
+    assert build(str(directory), output, capsys) == 1
+
+    # Files which were only touched are skipped from then on
+    touch(str(capture))
+    assert build(str(directory), output, capsys) == 0
+
+    capture.write_bytes(b'changed capture')
+    assert build(str(directory), output, capsys) == 1
+
+
+def recycling_task(paths, *arguments):
+    # The workers exceed the memory limit before the first five tasks
+    restarts = os.environ['UADT_TEST_RESTARTS']
+    with open(restarts, 'a+') as counter:
+        counter.seek(0)
+        if len(counter.read()) < 5:
+            counter.write('x')
+            counter.close()
+            os._exit(workers.RECYCLE_EXIT_CODE)
+
+    return 0.0, [(path, 1, format_rows([{}], Flow.plan.feature_names))
+                 for path in paths], []
+
+
+def test_recycled_workers_do_not_fail_the_task(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(config, 'NUM_JOBS', 1, raising=False)
+    monkeypatch.setattr(DatasetProcessor, 'process_task',
+                        staticmethod(recycling_task))
+    monkeypatch.setenv('UADT_TEST_RESTARTS', str(tmp_path / 'restarts'))
+
+    directory = tmp_path / 'captures'
+    directory.mkdir()
+    (directory / 'user_search-20170102_101010.pcap').write_bytes(b'capture')
+    output = str(tmp_path / 'dataset.csv')
+
+    DatasetProcessor(str(directory), output, use_cache=False).process()
+    printed = capsys.readouterr().out
+    assert ("Workers restarted over the memory limit: 5, stopped: 0, files "
+            "retried in isolation: 0" in printed)
+
+    # The file is not processed again
+    assert build(str(directory), output, capsys) == 0
+
+
+def hanging_task(paths, *arguments):
+    # The processing of the hung file never finishes
+    if any('hung' in path for path in paths):
+        time.sleep(60)
+
+    return 0.0, [(path, 1, format_rows([{}], Flow.plan.feature_names))
+                 for path in paths], []
+
+
+def test_timed_out_task_loses_only_the_hung_file(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(config, 'NUM_JOBS', 1, raising=False)
+    monkeypatch.setattr(schedule, 'TIMEOUT_FLAT', 1)
+    monkeypatch.setattr(DatasetProcessor, 'process_task',
+                        staticmethod(hanging_task))
+
+    directory = tmp_path / 'captures'
+    directory.mkdir()
+    for name in ('user_hung-20170102_101010', 'user_search-20170102_101010',
+                 'user_search-20170103_101010'):
+        (directory / (name + '.pcap')).write_bytes(b'capture')
+    output = str(tmp_path / 'dataset.csv')
+
+    DatasetProcessor(str(directory), output, use_cache=False).process()
+    printed = capsys.readouterr().out
+    assert "timed out: 1" in printed
+
+    with open(output) as dataset:
+        assert len(dataset.read().splitlines()) == 3
@@ -0,0 +1,85 @@
+import struct
+
+import numpy
+
+from uadt.analysis.pcap import LAYER_BITS, CaptureFile
+
+
+def frame(protocol, source_port, destination_port, payload, flags=0x18,
+          options=b''):
+    """
+    Returns the Ethernet frame of the IPv4 packet carrying the TCP or UDP
+    payload.
+    """
+
+    if protocol == 6:
+        header_length = 20 + len(options)
+        transport = struct.pack('>HHIIBBHHH', source_port, destination_port,
+                                1, 0, (header_length // 4) << 4, flags, 1000,
+                                0, 0) + options
+    else:
+        transport = struct.pack('>HHHH', source_port, destination_port,
+                                8 + len(payload), 0)
+
+    ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(transport) + len(payload),
+                     0, 0, 64, protocol, 0, bytes([10, 0, 0, 1]),
+                     bytes([10, 0, 0, 2]))
+    return b'\x00' * 12 + b'\x08\x00' + ip + transport + payload
+
+
+def capture(frames):
+    data = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+    for number, content in enumerate(frames):
+        data += struct.pack('<IIII', number, 0, len(content), len(content)) + content
+    return CaptureFile(data).read_columns()
+
+
+def dns_query(name, query_type):
+    labels = b''.join(bytes([len(label)]) + label for label in name.split(b'.'))
+    return (struct.pack('>HHHHHH', 1, 0x100, 1, 0, 0, 0) + labels + b'\x00'
+            + struct.pack('>HH', query_type, 1))
+
+
+def client_hello(session_id, suites, methods, extensions):
+    body = (b'\x03\x03' + bytes(32) + bytes([len(session_id)]) + session_id
+            + struct.pack('>H', len(suites)) + suites + bytes([len(methods)])
+            + methods + struct.pack('>H', len(extensions)) + extensions)
+    handshake = b'\x01' + struct.pack('>I', len(body))[1:] + body
+    return b'\x16\x03\x01' + struct.pack('>H', len(handshake)) + handshake
+
+
+def test_application_layers():
+    query = dns_query(b'www.example.com', 28)
+    columns = capture([
+        frame(17, 5353, 53, query),
+        frame(6, 1234, 53, struct.pack('>H', len(query)) + query),
+        frame(6, 1234, 443, b'\x16\x03\x03\x00\x06\x0b\x00\x00\x02ab'
+              + client_hello(bytes(32), bytes(4), b'\x00', bytes(9))),
+        frame(6, 1234, 80, b'GET / HTTP/1.1\r\n'),
+    ])
+
+    assert columns['dns.qry.type'][:2].tolist() == [28, 28]
+    assert numpy.isnan(columns['dns.qry.type'][2:]).all()
+
+    assert columns['ssl.handshake.session_id_length'][2] == 32
+    assert columns['ssl.handshake.comp_methods_length'][2] == 1
+    assert columns['ssl.handshake.extensions_length'][2] == 9
+    assert numpy.isnan(columns['ssl.handshake.extensions_length'][[0, 1, 3]]).all()
+
+    layers = columns['layers']
+    assert (layers[:2] & LAYER_BITS['dns']).all()
+    assert (layers[2] & LAYER_BITS['ssl']) and not (layers[2] & LAYER_BITS['dns'])
+    assert not layers[3] & (LAYER_BITS['ssl'] | LAYER_BITS['dns'])
+
+
+def test_window_scaling():
+    # Maximum segment size, no-operation and window scale options
+    options = b'\x02\x04\x05\xb4\x01\x03\x03\x07'
+    columns = capture([
+        frame(6, 1234, 443, b'', flags=0x02, options=options),
+        frame(6, 443, 1234, b'', flags=0x12, options=b'\x01\x03\x03\x02'),
+        frame(6, 1234, 443, b'', flags=0x10),
+    ])
+
+    assert columns['tcp.window_size'][2] == 1000 << 7
+    assert columns['tcp.window_size_scalefactor'][2] == 128
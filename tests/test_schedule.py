@@ -0,0 +1,29 @@
+from uadt.analysis.schedule import (FILE_COST, TIMEOUT_FLAT, TIMEOUT_MINIMUM,
+                                    Task, WorkScheduler)
+
+
+MB = 1024 ** 2
+
+
+def test_timeouts_without_a_rate_are_flat():
+    scheduler = WorkScheduler({'a': MB, 'b': MB}, 2)
+    task = Task(['a', 'b'], scheduler.cost('a') + scheduler.cost('b'))
+
+    assert scheduler.timeout(task) == 2 * TIMEOUT_FLAT
+    assert scheduler.makespan([task]) is None
+
+
+def test_files_larger_than_the_measured_ones_keep_the_flat_timeout():
+    sizes = {'small': MB, 'large': 1024 * MB}
+    scheduler = WorkScheduler(sizes, 2, rate=100 * MB,
+                              largest=sizes['small'] + FILE_COST)
+
+    assert scheduler.timeout(Task(['small'], scheduler.cost('small'))) == TIMEOUT_MINIMUM
+    assert scheduler.timeout(Task(['large'], scheduler.cost('large'))) == TIMEOUT_FLAT
+
+
+def test_makespan_at_the_given_rate():
+    scheduler = WorkScheduler({'a': 10 * MB - FILE_COST}, 1)
+    tasks = scheduler.tasks(['a'])
+
+    assert scheduler.makespan(tasks, 5 * MB) == 2.0
@@ -0,0 +1,45 @@
+import os
+
+from uadt.analysis.segments import SegmentContainer, read_buffer
+
+
+def write(path, segments):
+    with SegmentContainer(path, writable=True) as container:
+        for name, contents in segments:
+            with container.writer(name, 'event', 0) as target:
+                target.write(contents)
+
+
+def test_index_is_parsed_once_per_container(tmp_path, monkeypatch):
+    path = str(tmp_path / 'session.segments')
+    write(path, [('first.pcap', b'first'), ('second.pcap', b'second')])
+
+    parsed = []
+    read_index = SegmentContainer.read_index
+    monkeypatch.setattr(SegmentContainer, 'read_index',
+                        lambda self: parsed.append(self.path) or read_index(self))
+
+    for _ in range(3):
+        assert bytes(read_buffer(os.path.join(path, 'first.pcap'))) == b'first'
+        assert bytes(read_buffer(os.path.join(path, 'second.pcap'))) == b'second'
+    assert parsed == [path]
+
+    # Containers are opened again once they change
+    write(path, [('third.pcap', b'third')])
+    assert bytes(read_buffer(os.path.join(path, 'third.pcap'))) == b'third'
+    assert bytes(read_buffer(os.path.join(path, 'first.pcap'))) == b'first'
+
+
+def test_duplicate_names_are_made_unique(tmp_path):
+    path = str(tmp_path / 'session.segments')
+    write(path, [('event.pcap', b'first'), ('event.pcap', b'second')])
+
+    with SegmentContainer(path) as container:
+        assert [s.name for s in container] == ['event.pcap', 'event-1.pcap']
+        assert bytes(container.read('event-1.pcap')) == b'second'
+
+    # Segments written again replace the segments of the previous writes
+    write(path, [('event.pcap', b'third')])
+    with SegmentContainer(path) as container:
+        assert len(container) == 2
+        assert bytes(container.read('event.pcap')) == b'third'
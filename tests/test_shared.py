@@ -0,0 +1,29 @@
+import os
+import weakref
+
+import numpy
+
+from uadt.analysis.shared import SharedArrays, attach
+
+
+def test_attach_maps_the_shared_arrays():
+    X = numpy.arange(12, dtype=float).reshape(4, 3)
+    y = numpy.arange(4)
+
+    with SharedArrays(X, y) as shared:
+        attached_X, attached_y = attach(shared.handle)
+        assert numpy.array_equal(attached_X, X)
+        assert numpy.array_equal(attached_y, y)
+        assert attach(shared.handle)[0] is attached_X
+
+    assert not os.path.exists(shared.directory)
+
+
+def test_attach_releases_the_previous_arrays():
+    with SharedArrays(numpy.zeros(10)) as first:
+        reference = weakref.ref(attach(first.handle)[0])
+
+    with SharedArrays(numpy.ones(10)) as second:
+        assert numpy.array_equal(attach(second.handle)[0], numpy.ones(10))
+
+    assert reference() is None
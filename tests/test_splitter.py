@@ -0,0 +1,46 @@
+import numpy
+
+from uadt.analysis.pcap import TCP_SYN
+from uadt.analysis.splitter import AutoSplitter
+
+
+def retransmissions(segments, flags=None):
+    """
+    Returns the retransmission mask of the (conversation, sequence, length)
+    segments.
+    """
+
+    conversation, sequence, length = (numpy.array(column, dtype=float)
+                                      for column in zip(*segments))
+    if flags is None:
+        flags = numpy.zeros(len(segments))
+    return AutoSplitter.retransmissions(
+        conversation, sequence, length, numpy.array(flags, dtype=float)).tolist()
+
+
+def test_retransmitted_segments():
+    segments = [(1, 1000, 100), (1, 1100, 100), (1, 1000, 100), (1, 1200, 100),
+                (2, 1000, 100)]
+    assert retransmissions(segments) == [False, False, True, False, False]
+
+
+def test_sequence_wraparound():
+    start = 2 ** 32 - 150
+    segments = [(1, start, 100), (1, start + 100, 100), (1, 50, 100),
+                (1, 50, 100), (1, 150, 100)]
+    assert retransmissions(segments) == [False, False, False, True, False]
+
+
+def test_streams_longer_than_the_sequence_space():
+    segments = [(1, (k * 2 ** 30) % 2 ** 32, 2 ** 30) for k in range(10)]
+    assert not any(retransmissions(segments))
+
+
+def test_segments_reordered_before_the_first():
+    segments = [(1, 1000, 100), (1, 900, 100), (1, 1100, 100), (1, 1200, 100)]
+    assert retransmissions(segments)[2:] == [False, False]
+
+
+def test_syn_occupies_a_sequence_number():
+    segments = [(1, 999, 0), (1, 999, 0), (1, 1000, 100)]
+    assert retransmissions(segments, [TCP_SYN, TCP_SYN, 0]) == [False, True, False]
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+"""
+Approximate SVM - train and evaluate linear support vector machine on an
+approximation of the RBF kernel feature space on a given dataset.
+
+Usage:
+  approxsvm.py <dataset> (--optimize | -C=<value> --gamma=<value>) [--method=<name>] [--components=<n>] [--train=<fraction>] [--confusion] [--outfile=<path>] [--search=<method>]
+
+Options:
+  --optimize          Specify that the SVM should find optimal parameters for C and gamma.
+  --search=<method>   The search method of --optimize: grid, or the faster halving or hyperband [default: grid].
+  -C=<value>          Manual value for C (must be used together with --gamma)
+  --gamma=<value>     Manual value for gamma (must be used together with -C)
+  --method=<name>     The approximation of the kernel: nystroem, or rff for random Fourier features [default: nystroem].
+  --components=<n>    The number of features of the approximation [default: 500].
+  --train=<fraction>  Specifies the portion of the data set that should be used for training [default: 0.7].
+  --confusion         Displays the confusion matrix.
+  --outfile=<path>    Save the trained model at the given path.
+
+Examples:
+$ python approxsvm.py data10000.csv --optimize --search=halving
+$ python approxsvm.py data10000.csv -C 32 --gamma 0.125 --method rff --components 1000
+"""
+
+from docopt import docopt
+from sklearn import kernel_approximation, pipeline, preprocessing, svm
+
+from uadt import config
+from uadt.analysis.model import Model
+
+
+# The maps of the samples into the approximate RBF kernel feature spaces
+APPROXIMATIONS = {
+    'nystroem': kernel_approximation.Nystroem,
+    'rff': kernel_approximation.RBFSampler,
+}
+
+
+def approximate_svc(C=1.0, gamma=1.0, method='nystroem', n_components=500,
+                    random_state=None):
+    """
+    Returns the classifier mapping the samples into an approximation of the
+    RBF kernel feature space and separating them by a linear SVM. Unlike the
+    exact SVM, its training scales linearly with the number of samples and
+    its prediction cost does not depend on the number of support vectors.
+
+    The samples are scaled by the classifier itself, so that the saved
+    model can be applied to the raw features. The approximation is seeded by
+    RANDOM_STATE from the config unless given, so that the success rates
+    can be reproduced.
+    """
+
+    if random_state is None:
+        random_state = getattr(config, 'RANDOM_STATE', 0)
+
+    return pipeline.make_pipeline(
+        preprocessing.StandardScaler(),
+        APPROXIMATIONS[method](gamma=gamma, n_components=n_components,
+                               random_state=random_state),
+        svm.LinearSVC(C=C, random_state=random_state),
+    )
+
+
+class ApproximateMachine(Model):
+
+    classifier_cls = staticmethod(approximate_svc)
+
+    search_space = {
+        'C': [2.0**(2*p-1) for p in range(-2, 7)],
+        'gamma': [2.0**(2*p-1) for p in range(-8, 3)],
+    }
+
+
+def main():
+    arguments = docopt(__doc__)
+
+    machine = ApproximateMachine(arguments['<dataset>'],
+                                 train_size=float(arguments['--train']))
+    machine.search_space = dict(
+        machine.search_space,
+        method=[arguments['--method']],
+        n_components=[int(arguments['--components'])],
+    )
+    machine.prepare_data()
+
+    if arguments.get('--optimize'):
+        print("Searching for optimal parameters..")
+        machine.optimize_paramters(arguments['--search'])
+    elif arguments.get('-C') and arguments.get('--gamma'):
+        machine.hyperparameters = {
+            'C': float(arguments.get('-C')),
+            'gamma': float(arguments.get('--gamma')),
+            'method': arguments['--method'],
+            'n_components': int(arguments['--components']),
+        }
+
+    machine.initialize_classifier()
+
+    print("Success rate: {0}".format(machine.evaluate()))
+
+    if arguments.get('--confusion'):
+        machine.plot_confusion_matrix()
+
+    outfile_path = arguments.get('--outfile')
+    if outfile_path:
+        machine.save(outfile_path)
+
+
+if __name__ == '__main__':
+    main()
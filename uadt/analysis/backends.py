@@ -0,0 +1,252 @@
+"""
+Packet sources - the mechanisms turning a capture file into a Flow.
+"""
+
+import abc
+import csv
+import subprocess
+
+import numpy
+import pandas
+import pyshark
+
+from uadt import config
+from uadt.analysis.pcap import (CaptureFile, CaptureFormatError, FIELDS,
+                                INTEGER_FIELDS, TCPWindowTracker)
+from uadt.analysis.segments import materialized
+from uadt.analysis.stream import ColumnBuffer
+from uadt.plugins import PluginBase, PluginMount
+
+
+class PacketSource(PluginBase, metaclass=PluginMount):
+    """
+    An object that represents a mechanism for reading the packets of a capture
+    file and building the flow out of them.
+    """
+
+    identifier = None
+
+    def __init__(self, flow_cls, chunk_size=None):
+        if not self.identifier:
+            raise ValueError("Backend idenfitier must be specified")
+
+        self.flow_cls = flow_cls
+        self.chunk_size = chunk_size or getattr(config, 'PACKET_CHUNK_SIZE', 4096)
+
+    @property
+    def parameter_fields(self):
+        """
+        Returns the list of (parameter name, tshark field) pairs the flow
+        class expects. The field is None for parameters that do not declare
+        it.
+        """
+
+        return [(p.name, p.field) for p in self.flow_cls.plan.parameters]
+
+    @property
+    def parameter_version(self):
+        """
+        Returns the version of the parameter set, which changes whenever any
+        of the parameter methods or the packet source changes.
+        """
+
+        return '{0}{1}'.format(self.identifier, self.flow_cls.plan.parameter_version)
+
+    def load(self, path, cache=None):
+        """
+        Builds the flow out of the capture file at the given path, reusing the
+        packet table stored in the given cache if available.
+        """
+
+        if cache is None:
+            return self.read(path)
+
+        entry = cache.entry(path, self.parameter_version)
+        data = cache.load(entry)
+        if data is not None:
+            return self.flow_cls(path=path, data=data)
+
+        flow = self.read(path)
+        cache.store(entry, flow.data)
+        return flow
+
+    @staticmethod
+    def convert(field, values):
+        """
+        Converts the extracted column of the given tshark field into the same
+        representation the parameter methods produce.
+        """
+
+        if field == 'ip.src':
+            local = pandas.Series(values).str.startswith(
+                tuple(config.LOCAL_SUBNETS), na=False)
+            return numpy.where(local, 'forward', 'backward')
+
+        # Columns without missing values hold plain integers
+        if field in INTEGER_FIELDS and len(values) and not numpy.isnan(values).any():
+            return values.astype(numpy.int64)
+
+        return values
+
+    def assemble(self, path, tables):
+        """
+        Builds the flow out of the packet tables of consecutive chunks of
+        packets. Only one chunk is held in memory besides the resulting table.
+        """
+
+        buffer = ColumnBuffer()
+        for table in tables:
+            buffer.append(table)
+
+        data = buffer.table(self.flow_cls.plan.parameter_names)
+        return self.flow_cls(path=path, data=data)
+
+    def fallback_read(self, path, reason):
+        """
+        Reads the file using the fallback packet source.
+        """
+
+        self.warning("{0}, using {1}".format(reason, self.fallback))
+        source = self.get_plugin(self.fallback)(self.flow_cls, self.chunk_size)
+        return source.read(path)
+
+    @abc.abstractmethod
+    def read(self, path):
+        """
+        Builds the flow out of the capture file at the given path.
+        """
+        pass
+
+
+class PysharkSource(PacketSource):
+    """
+    Dissects the packets using tshark via pyshark, applying each parameter
+    method on each packet.
+    """
+
+    identifier = 'pyshark'
+
+    def read(self, path):
+        # Do not keep the dissected packets around, they are consumed in chunks
+        with materialized(path) as source:
+            capture = pyshark.FileCapture(source, keep_packets=False)
+            try:
+                return self.flow_cls.from_packets(capture, path=path,
+                                                  chunk_size=self.chunk_size)
+            finally:
+                capture.close()
+
+
+class NativeSource(PacketSource):
+    """
+    Decodes the capture file directly using the native pcap reader. Falls back
+    to pyshark for capture formats or parameters it does not support.
+    """
+
+    identifier = 'native'
+    fallback = 'pyshark'
+
+    @property
+    def unsupported(self):
+        """
+        Returns the names of the parameters the native reader cannot extract.
+        """
+
+        return [name for name, field in self.parameter_fields if field not in FIELDS]
+
+    def table(self, decoded):
+        """
+        Builds the packet table out of the decoded columns of one chunk.
+        """
+
+        return pandas.DataFrame({
+            name: self.convert(field, decoded[field])
+            for name, field in self.parameter_fields
+        })
+
+    def read(self, path):
+        if self.unsupported:
+            return self.fallback_read(path, "Parameters {0} not supported "
+                                      "natively".format(', '.join(self.unsupported)))
+
+        try:
+            capture = CaptureFile.open(path)
+            return self.assemble(path, (
+                self.table(decoded)
+                for decoded in capture.stream_columns(self.chunk_size)
+            ))
+        except CaptureFormatError as exc:
+            return self.fallback_read(path, "Unable to read '{0}' natively "
+                                      "({1})".format(path, exc))
+
+    def read_records(self, path, capture, records):
+        """
+        Builds the flow out of the given packet records of an open capture
+        file, decoded as if they were the only records of a file at the given
+        path (i.e. a segment of a session file).
+        """
+
+        tracker = TCPWindowTracker()
+        return self.assemble(path, (
+            self.table(capture.decode(records[start:start + self.chunk_size], tracker))
+            for start in range(0, len(records), self.chunk_size)
+        ))
+
+
+class TsharkSource(PacketSource):
+    """
+    Extracts all the declared fields of the parameters using a single tshark
+    invocation, streaming its tab-separated output into typed columns.
+    """
+
+    identifier = 'tshark'
+    fallback = 'pyshark'
+
+    def read(self, path):
+        parameters = self.parameter_fields
+        undeclared = [name for name, field in parameters if field is None]
+        if undeclared:
+            return self.fallback_read(path, "Parameters {0} do not declare "
+                                      "tshark field".format(', '.join(undeclared)))
+
+        options = [
+            '-n', '-T', 'fields',
+            '-E', 'separator=/t', '-E', 'occurrence=f',
+            '-E', 'header=n', '-E', 'quote=n',
+        ]
+        for _, field in parameters:
+            options.extend(['-e', field])
+
+        names = [name for name, _ in parameters]
+        dtypes = {
+            name: numpy.float64 for name, field in parameters
+            if field in INTEGER_FIELDS or field == 'frame.time_epoch'
+        }
+
+        # Segments stored in a container are exported for tshark
+        with materialized(path) as source:
+            command = ['tshark', '-r', source] + options
+            process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                       stderr=subprocess.DEVNULL)
+            try:
+                reader = pandas.read_csv(
+                    process.stdout, sep='\t', header=None, names=names,
+                    dtype=dtypes, quoting=csv.QUOTE_NONE, na_values=[''],
+                    keep_default_na=False, chunksize=self.chunk_size
+                )
+                flow = self.assemble(path, (
+                    pandas.DataFrame({
+                        name: self.convert(field, table[name].values)
+                        for name, field in parameters
+                    })
+                    for table in reader
+                ))
+            except pandas.errors.EmptyDataError:
+                flow = self.assemble(path, [])
+            finally:
+                process.stdout.close()
+
+            if process.wait() != 0:
+                raise subprocess.CalledProcessError(process.returncode, command)
+
+        return flow
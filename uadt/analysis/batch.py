@@ -0,0 +1,183 @@
+"""
+Batch feature engine computing the features of many flows at once.
+"""
+
+import numpy
+import pandas
+
+from uadt.logger import LoggerMixin
+
+
+class FlowBatch(LoggerMixin):
+    """
+    Represents a batch of non-empty flows of the same class. The packet tables
+    of the flows are concatenated, and every feature declared as vectorized
+    is computed for all the flows using one segmented numpy reduction.
+    Remaining features are computed by calling the feature method of each
+    flow.
+    """
+
+    def __init__(self, flows):
+        self.flows = list(flows)
+        self.flow_cls = type(self.flows[0]) if self.flows else None
+
+        lengths = [len(flow.data) for flow in self.flows]
+        self.flow_id = numpy.repeat(numpy.arange(len(self.flows)), lengths)
+
+        if self.flows:
+            self.data = pandas.concat([flow.data for flow in self.flows],
+                                      ignore_index=True, sort=False)
+        else:
+            self.data = pandas.DataFrame()
+
+        self.columns = {}
+        self.scopes = {}
+
+    def __len__(self):
+        return len(self.flows)
+
+    def integral(self, column):
+        """
+        Returns a boolean array determining for each flow whether the given
+        column holds integers.
+        """
+
+        if column == 'timeshift':
+            return numpy.zeros(len(self.flows), dtype=bool)
+
+        return numpy.array([
+            flow.data[column].dtype.kind in 'iu' for flow in self.flows
+        ])
+
+    def scope(self, name):
+        """
+        Returns the boolean mask of the packets in the given scope.
+        """
+
+        if name not in self.scopes:
+            if name == 'all':
+                mask = numpy.ones(len(self.data), dtype=bool)
+            else:
+                mask = (self.data['direction'] == name).values
+            self.scopes[name] = mask
+
+        return self.scopes[name]
+
+    def column(self, name, scope):
+        """
+        Returns the values of the given parameter column of the packets in
+        the scope as a float array, together with their flow ids.
+        """
+
+        mask = self.scope(scope)
+        groups = self.flow_id[mask]
+
+        if name == 'timeshift':
+            # Time difference to the previous packet of the same flow and scope
+            timestamps = self.column('timestamp', scope)[0]
+            values = numpy.full(len(timestamps), numpy.nan)
+            continued = groups[1:] == groups[:-1]
+            values[1:][continued] = (timestamps[1:] - timestamps[:-1])[continued]
+            return values, groups
+
+        if name not in self.columns:
+            self.columns[name] = pandas.to_numeric(
+                self.data[name], errors='coerce').values.astype(numpy.float64)
+
+        return self.columns[name][mask], groups
+
+    def reduce(self, reduction, column, scope, value):
+        """
+        Computes the given reduction for all the flows. Returns the array of
+        results, with NaN standing for missing values.
+        """
+
+        count = len(self.flows)
+
+        if reduction == 'count':
+            return numpy.bincount(self.flow_id[self.scope(scope)], minlength=count)
+
+        values, groups = self.column(column, scope)
+        valid = ~numpy.isnan(values)
+        values, groups = values[valid], groups[valid]
+        present = numpy.bincount(groups, minlength=count)
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            if reduction == 'present':
+                return numpy.where(present > 0, present, numpy.nan)
+
+            if reduction == 'equal':
+                equal = numpy.bincount(groups, weights=(values == value),
+                                       minlength=count)
+                return numpy.where(equal > 0, equal, numpy.nan)
+
+            if reduction == 'sum':
+                return numpy.bincount(groups, weights=values, minlength=count)
+
+            mean = numpy.bincount(groups, weights=values, minlength=count) / present
+            if reduction == 'mean':
+                return mean
+
+            if reduction in ('var', 'std'):
+                squares = numpy.bincount(groups, weights=(values - mean[groups]) ** 2,
+                                         minlength=count)
+                variance = numpy.where(present > 1, squares / (present - 1), numpy.nan)
+                return variance if reduction == 'var' else numpy.sqrt(variance)
+
+        if reduction in ('min', 'max'):
+            result = numpy.full(count, numpy.nan)
+            nonempty = present > 0
+            starts = numpy.searchsorted(groups, numpy.arange(count))[nonempty]
+            ufunc = numpy.minimum if reduction == 'min' else numpy.maximum
+            result[nonempty] = ufunc.reduceat(values, starts)
+            return result
+
+        raise ValueError("Unknown reduction: {0}".format(reduction))
+
+    @staticmethod
+    def convert(reduction, result, integral):
+        """
+        Converts the reduced value of one flow into the same type the feature
+        method would return.
+        """
+
+        if reduction == 'count':
+            return int(result)
+
+        if reduction in ('present', 'equal'):
+            return None if numpy.isnan(result) else numpy.int64(result)
+
+        if reduction in ('sum', 'min', 'max') and integral and not numpy.isnan(result):
+            return numpy.int64(result)
+
+        return numpy.float64(result)
+
+    @property
+    def features(self):
+        """
+        Returns the list of feature dictionaries, one for each flow. The
+        dictionaries match the ones produced by Flow.features (up to floating
+        point rounding).
+        """
+
+        feature_data = [{} for _ in self.flows]
+        if not self.flows:
+            return feature_data
+
+        for feature in self.flow_cls.plan.features:
+            key = feature.name
+
+            if feature.vectorized is None:
+                for flow, data in zip(self.flows, feature_data):
+                    data[key] = feature.function(flow)
+                continue
+
+            reduction, column, scope, value = feature.vectorized
+            results = self.reduce(reduction, column, scope, value)
+            integral = (self.integral(column) if column
+                        else numpy.zeros(len(self.flows), dtype=bool))
+
+            for index, data in enumerate(feature_data):
+                data[key] = self.convert(reduction, results[index], integral[index])
+
+        return feature_data
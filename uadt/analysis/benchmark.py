@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+
+"""
+benchmark - measure the performance of the model training on given datasets
+
+Usage:
+  uadt-benchmark dispatch <dataset>... [--model=<name>] [--candidates=<n>] [--train=<fraction>]
+  uadt-benchmark kernel <dataset>... [-C=<value>] [--gamma=<value>] [--components=<n>] [--train=<fraction>]
+
+Options:
+  --model=<name>      The model to benchmark: svm, tree or forest [default: tree].
+  --candidates=<n>    The number of candidates of the search space evaluated [default: 17].
+  --train=<fraction>  The portion of the data set used for training [default: 0.7].
+  -C=<value>          The value of C of the compared SVMs [default: 32].
+  --gamma=<value>     The value of gamma of the compared SVMs [default: 0.125].
+  --components=<n>    The number of features of the kernel approximations [default: 500].
+
+Commands:
+  dispatch  Compares passing the training set to the workers of the
+            hyperparameter search with each candidate (pickling the model)
+            against sharing it in memory-mapped files. The pickled size is
+            an upper bound, as joblib memory maps large arrays itself. The
+            peak RSS is the largest of the workers, shared pages included.
+  kernel    Compares the accuracy and the training and prediction times of
+            the exact SVM against the SVMs on approximate kernels.
+
+Examples:
+$ uadt-benchmark dispatch trainingsets/*.csv
+$ uadt-benchmark dispatch trainingsets/dataset10000.csv --model=svm --candidates=22
+$ uadt-benchmark kernel trainingsets/*.csv --components=1000
+"""
+
+import pickle
+import time
+
+from docopt import docopt
+from joblib import Parallel, delayed
+
+from sklearn import metrics, pipeline, preprocessing, svm
+
+from uadt import config
+from uadt.analysis.approxsvm import APPROXIMATIONS, ApproximateMachine, approximate_svc
+from uadt.analysis.model import HyperparameterSearch, cross_validate_shared
+from uadt.analysis.randomforest import Forest
+from uadt.analysis.shared import SharedArrays
+from uadt.analysis.stream import peak_rss, reset_peak_rss
+from uadt.analysis.svm import Machine
+from uadt.analysis.tree import Tree
+
+
+MODELS = {
+    'svm': Machine,
+    'tree': Tree,
+    'forest': Forest,
+}
+
+
+def timed(function, *arguments):
+    """
+    Returns the result of the function and the time it took.
+    """
+
+    start = time.perf_counter()
+    result = function(*arguments)
+    return result, time.perf_counter() - start
+
+
+def measured(function, *arguments, **keywords):
+    """
+    Returns the result of the function and the peak RSS of the worker
+    running it.
+    """
+
+    reset_peak_rss()
+    result = function(*arguments, **keywords)
+    return result, peak_rss()
+
+
+def dispatch(model, candidates):
+    """
+    Evaluates the candidates passing the model to the workers with each of
+    them, and sharing the training set. Both use the plain cross validation
+    of Model, without the evaluation shortcuts of the particular models, so
+    that only the dispatch of the data differs. Returns the sizes of the
+    pickled payloads of one task, the durations and the peak RSS of the
+    workers of both.
+    """
+
+    # Fixed seeds make the success rates of both comparable
+    candidates = [dict(candidate, random_state=0) for candidate in candidates]
+
+    def evaluate(tasks):
+        results = Parallel(n_jobs=config.NUM_JOBS)(tasks)
+        return [result for result, _ in results], max(rss for _, rss in results)
+
+    # Joblib memory maps the large arrays of the model instead of sending
+    # them, the pickled size is what it sends at most
+    pickled_payload = len(pickle.dumps((model.test_parameters, candidates[0])))
+    (pickled_results, pickled_rss), pickled_time = timed(evaluate, [
+        delayed(measured)(model.test_parameters, **candidate)
+        for candidate in candidates
+    ])
+    pickled_rates = [rate for rate, _ in pickled_results]
+
+    with SharedArrays(model.X_train, model.y_train) as shared:
+        shared_payload = len(pickle.dumps(
+            (cross_validate_shared, model.classifier_cls, shared.handle,
+             candidates[0])))
+        (shared_rates, shared_rss), shared_time = timed(evaluate, [
+            delayed(measured)(cross_validate_shared, model.classifier_cls,
+                              shared.handle, candidate)
+            for candidate in candidates
+        ])
+
+    if list(pickled_rates) != list(shared_rates):
+        print("Warning: the success rates of the candidates differ")
+
+    return ((pickled_payload, pickled_time, pickled_rss),
+            (shared_payload, shared_time, shared_rss))
+
+
+def kernel(model, C, gamma, components):
+    """
+    Trains the exact SVM and the SVMs on each of the kernel approximations.
+    Returns their names, success rates and training and prediction times.
+    """
+
+    classifiers = [('exact', pipeline.make_pipeline(
+        preprocessing.StandardScaler(), svm.SVC(C=C, gamma=gamma)))]
+    classifiers.extend(
+        (method, approximate_svc(C, gamma, method, components))
+        for method in sorted(APPROXIMATIONS)
+    )
+
+    results = []
+    for name, classifier in classifiers:
+        _, train_time = timed(classifier.fit, model.X_train, model.y_train)
+        predicted, predict_time = timed(classifier.predict, model.X_test)
+        rate = metrics.accuracy_score(model.y_test, predicted)
+        results.append((name, rate, train_time, predict_time))
+
+    return results
+
+
+def main():
+    arguments = docopt(__doc__)
+
+    if arguments['kernel']:
+        C = float(arguments['-C'])
+        gamma = float(arguments['--gamma'])
+        components = int(arguments['--components'])
+
+        print("{0:<40} {1:>10} {2:>10} {3:>10} {4:>16}".format(
+            'dataset', 'kernel', 'accuracy', 'train (s)', 'predict (us)'))
+
+        for path in arguments['<dataset>']:
+            model = ApproximateMachine(path, train_size=float(arguments['--train']))
+            model.prepare_data()
+
+            for name, rate, train_time, predict_time in kernel(
+                    model, C, gamma, components):
+                print("{0:<40} {1:>10} {2:>10.4f} {3:>10.2f} {4:>16.1f}".format(
+                    path, name, rate, train_time,
+                    predict_time / len(model.X_test) * 10 ** 6))
+        return
+
+    model_cls = MODELS[arguments['--model']]
+    count = int(arguments['--candidates'])
+
+    print("{0:<40} {1:>8} {2:>14} {3:>10} {4:>14} {5:>14} {6:>10} {7:>14}".format(
+        'dataset', 'samples', 'pickled bytes', 'time (s)', 'peak RSS (MB)',
+        'shared bytes', 'time (s)', 'peak RSS (MB)'))
+
+    for path in arguments['<dataset>']:
+        model = model_cls(path, train_size=float(arguments['--train']))
+        model.prepare_data()
+
+        candidates = HyperparameterSearch(
+            model.search_space, None, len(model.X_train)).candidates()[:count]
+        pickled, shared = dispatch(model, candidates)
+
+        print("{0:<40} {1:>8} {2:>14} {3:>10.2f} {4:>14.1f} {5:>14} {6:>10.2f} "
+              "{7:>14.1f}".format(
+                  path, len(model.X_train), pickled[0], pickled[1],
+                  pickled[2] / 1024 ** 2, shared[0], shared[1],
+                  shared[2] / 1024 ** 2))
+        print("Dispatched {0:.1f} kB instead of at most {1:.1f} kB for {2} "
+              "candidates".format(shared[0] * len(candidates) / 1024,
+                                  pickled[0] * len(candidates) / 1024,
+                                  len(candidates)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+
+"""
+cache - inspect and prune the cache of parsed packet tables
+
+Usage:
+  uadt-cache info [--cache-dir=<path>]
+  uadt-cache prune [--max-size=<size>] [--cache-dir=<path>]
+  uadt-cache clear [--cache-dir=<path>]
+
+Options:
+  --cache-dir=<path>  The location of the cache (defaults to PACKET_CACHE_DIR from the config).
+  --max-size=<size>   The maximum size of the cache (in MBs, defaults to PACKET_CACHE_SIZE from the config).
+
+Examples:
+$ uadt-cache info
+$ uadt-cache prune --max-size 2048
+"""
+
+import contextlib
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy
+import pandas
+from docopt import docopt
+
+from uadt import config
+from uadt.analysis.segments import SegmentContainer, read_buffer
+from uadt.logger import LoggerMixin
+
+
+DEFAULT_DIRECTORY = os.path.join('~', '.cache', 'uadt', 'packets')
+DEFAULT_SIZE = 10 * 1024  # in MBs
+
+EXTENSION = '.npz'
+NULL_SUFFIX = '__null'
+
+
+class PacketCache(LoggerMixin):
+    """
+    A persistent cache of parsed packet tables. Each table is stored as a
+    compressed set of numpy columns, keyed by the content hash of the capture
+    file and the version of the parameter set which produced it. Least
+    recently used entries are evicted once the cache exceeds its size.
+    """
+
+    # The number of packet tables loaded from the cache by this process
+    hits = 0
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = os.path.expanduser(directory or DEFAULT_DIRECTORY)
+        self.max_size = int(max_size if max_size is not None else DEFAULT_SIZE) * 1024 ** 2
+
+    @classmethod
+    def default(cls):
+        """
+        Returns the cache configured in the config, or None if caching is
+        disabled.
+        """
+
+        directory = getattr(config, 'PACKET_CACHE_DIR', DEFAULT_DIRECTORY)
+        if not directory:
+            return None
+
+        return cls(directory, getattr(config, 'PACKET_CACHE_SIZE', DEFAULT_SIZE))
+
+    @staticmethod
+    def content_hash(path):
+        """
+        Computes the hash of the contents of the file at the given path.
+        """
+
+        digest = hashlib.sha256()
+        if SegmentContainer.locate(path) is not None:
+            digest.update(read_buffer(path))
+            return digest.hexdigest()
+
+        with open(path, 'rb') as source:
+            for block in iter(lambda: source.read(1024 ** 2), b''):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+    def entry(self, path, version):
+        """
+        Returns the path of the cache entry of the capture file at the given
+        path, produced by the given version of the parameter set.
+        """
+
+        return os.path.join(
+            self.directory,
+            '{0}-{1}{2}'.format(self.content_hash(path), version, EXTENSION)
+        )
+
+    def load(self, entry):
+        """
+        Returns the packet table stored in the given cache entry, or None if
+        it is not cached.
+        """
+
+        try:
+            with numpy.load(entry, allow_pickle=False) as stored:
+                data = self.deserialize(stored)
+        except (IOError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+        # Mark the entry as recently used
+        with contextlib.suppress(OSError):
+            os.utime(entry)
+
+        PacketCache.hits += 1
+        return data
+
+    def store(self, entry, data):
+        """
+        Stores the packet table into the given cache entry.
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write atomically, other processes might be reading the same entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory,
+                                                 suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as target:
+                numpy.savez_compressed(target, **self.serialize(data))
+            os.replace(temporary, entry)
+        except Exception:
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+            raise
+
+    @staticmethod
+    def serialize(data):
+        """
+        Converts the packet table into a dictionary of plain numpy arrays.
+        """
+
+        arrays = {'__columns__': numpy.array(list(data.columns), dtype=str)}
+        for name in data.columns:
+            values = data[name].values
+            if values.dtype.kind in 'biuf':
+                arrays[name] = values
+                continue
+
+            # Text columns, possibly with missing values
+            null = pandas.isnull(values)
+            arrays[name] = numpy.where(null, '', values).astype(str)
+            if null.any():
+                arrays[name + NULL_SUFFIX] = null
+
+        return arrays
+
+    @staticmethod
+    def deserialize(stored):
+        """
+        Reconstructs the packet table from the stored numpy arrays.
+        """
+
+        columns = {}
+        for name in stored['__columns__'].tolist():
+            values = stored[name]
+            if values.dtype.kind == 'U':
+                values = values.astype(object)
+                if name + NULL_SUFFIX in stored:
+                    values[stored[name + NULL_SUFFIX]] = None
+            columns[name] = values
+
+        return pandas.DataFrame(columns)
+
+    def entries(self):
+        """
+        Returns the list of (path, size, last use time) of all the cached
+        entries, least recently used first.
+        """
+
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+
+        for name in os.listdir(self.directory):
+            if not name.endswith(EXTENSION):
+                continue
+
+            path = os.path.join(self.directory, name)
+            with contextlib.suppress(FileNotFoundError):
+                stat = os.stat(path)
+                entries.append((path, stat.st_size, stat.st_mtime))
+
+        return sorted(entries, key=lambda e: e[2])
+
+    def prune(self, max_size=None):
+        """
+        Evicts the least recently used entries until the cache fits into the
+        given size (in bytes). Returns the number of evicted entries.
+        """
+
+        max_size = self.max_size if max_size is None else max_size
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        evicted = 0
+        for path, size, _ in entries:
+            if total <= max_size:
+                break
+
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+                evicted += 1
+            total -= size
+
+        return evicted
+
+    def clear(self):
+        """
+        Removes all the cached entries.
+        """
+
+        return self.prune(max_size=0)
+
+
+def main():
+    arguments = docopt(__doc__)
+
+    cache = PacketCache(arguments['--cache-dir'] or getattr(config, 'PACKET_CACHE_DIR', None),
+                        getattr(config, 'PACKET_CACHE_SIZE', None))
+
+    if arguments['info']:
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        print("Cache directory: {0}".format(cache.directory))
+        print("Entries: {0}".format(len(entries)))
+        print("Size: {0:.1f} MB (limit {1:.1f} MB)".format(
+            total / 1024 ** 2, cache.max_size / 1024 ** 2))
+    elif arguments['prune']:
+        max_size = arguments['--max-size']
+        evicted = cache.prune(int(max_size) * 1024 ** 2 if max_size else None)
+        print("Evicted {0} entries".format(evicted))
+    elif arguments['clear']:
+        print("Evicted {0} entries".format(cache.clear()))
+
+
+if __name__ == '__main__':
+    main()
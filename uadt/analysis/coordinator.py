@@ -0,0 +1,282 @@
+"""
+Work queue coordinating dataset generation across several hosts, using a
+directory on a filesystem shared by the hosts. Tasks are claimed by atomic
+renames, so no other communication between the coordinator and the workers
+is needed.
+
+The queue directory holds:
+  job.json    - the parameters of the job, written by the coordinator
+  pending/    - the tasks waiting for a worker, <task>.json
+  leases/     - the tasks being processed, <task>.<worker>.json
+  results/    - the results of the tasks, <task>.<worker>.json
+  done        - marks the job as finished, the workers exit
+"""
+
+import concurrent.futures
+import contextlib
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+import pebble
+
+from uadt.logger import LoggerMixin
+
+
+# Leases not renewed for this long (in seconds) expire, and their tasks are
+# given to other workers. Workers renew their leases four times as often.
+LEASE_TIMEOUT = 120
+
+# How often (in seconds) the queue is checked for new tasks or results
+POLL_INTERVAL = 1
+
+
+class LeaseQueue(LoggerMixin):
+    """
+    The shared directory of the tasks of one job.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pending = os.path.join(directory, 'pending')
+        self.leases = os.path.join(directory, 'leases')
+        self.results = os.path.join(directory, 'results')
+
+    @property
+    def finished(self):
+        return os.path.exists(os.path.join(self.directory, 'done'))
+
+    def write(self, path, content):
+        """
+        Writes the JSON content into the file atomically.
+        """
+
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as target:
+                json.dump(content, target)
+            os.rename(temporary, path)
+        except Exception:
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+            raise
+
+    @staticmethod
+    def read(path):
+        with open(path, 'r') as source:
+            return json.load(source)
+
+    def create(self, job):
+        """
+        Prepares the queue for a new job, dropping the tasks of previous
+        jobs.
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        for directory in (self.pending, self.leases, self.results):
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+
+        self.write(os.path.join(self.directory, 'job.json'), job)
+
+        # The waiting workers start once the job is no longer finished
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self.directory, 'done'))
+
+    def job(self):
+        """
+        Returns the parameters of the job, or None if there is no job yet.
+        """
+
+        try:
+            return self.read(os.path.join(self.directory, 'job.json'))
+        except (IOError, ValueError):
+            return None
+
+    def finish(self):
+        """
+        Marks the job as finished and drops the tasks left in the queue.
+        """
+
+        with open(os.path.join(self.directory, 'done'), 'w'):
+            pass
+
+        for directory in (self.pending, self.leases):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def now(self):
+        """
+        Returns the current time of the shared filesystem, which the
+        modification times of the leases are compared with, as the clocks of
+        the hosts may differ.
+        """
+
+        clock = os.path.join(self.directory, 'clock')
+        with open(clock, 'w'):
+            pass
+        return os.stat(clock).st_mtime
+
+    # Coordinator side
+
+    def publish(self, task_id, task):
+        self.write(os.path.join(self.pending, task_id + '.json'), task)
+
+    def withdraw(self, task_id):
+        """
+        Removes the task from the pending tasks, if it was given back after
+        its lease expired.
+        """
+
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self.pending, task_id + '.json'))
+
+    def collect(self):
+        """
+        Yields the task identifiers and results of the completed tasks.
+        """
+
+        for name in sorted(os.listdir(self.results)):
+            if not name.endswith('.json'):
+                continue
+
+            path = os.path.join(self.results, name)
+            result = self.read(path)
+            os.remove(path)
+            yield name.split('.')[0], result
+
+    def expire(self, timeout):
+        """
+        Gives the tasks whose leases were not renewed within the timeout
+        back to the pending tasks. Yields their identifiers.
+        """
+
+        deadline = self.now() - timeout
+        for name in os.listdir(self.leases):
+            lease = os.path.join(self.leases, name)
+            task_id, worker = name.split('.')[:2]
+
+            try:
+                if os.stat(lease).st_mtime > deadline:
+                    continue
+                os.rename(lease, os.path.join(self.pending, task_id + '.json'))
+            except FileNotFoundError:
+                # Completed in the meantime
+                continue
+
+            self.warning("Lease of task {0} held by {1} expired"
+                         .format(task_id, worker))
+            yield task_id
+
+    # Worker side
+
+    def claim(self, worker):
+        """
+        Claims one of the pending tasks. Returns the task identifier, the
+        task and the path of the lease, or None if there is no pending task.
+        """
+
+        # The tasks are dropped once the job is finished
+        try:
+            names = sorted(os.listdir(self.pending))
+        except FileNotFoundError:
+            return None
+
+        for name in names:
+            task_id = name.split('.')[0]
+            lease = os.path.join(self.leases, '{0}.{1}.json'.format(task_id, worker))
+
+            # Only one of the workers renaming the task succeeds
+            try:
+                os.rename(os.path.join(self.pending, name), lease)
+            except FileNotFoundError:
+                continue
+
+            # The rename keeps the time the task was published at, the
+            # lease starts at the time of the claim
+            self.renew(lease)
+            return task_id, self.read(lease), lease
+
+    @staticmethod
+    def renew(lease):
+        """
+        Renews the lease. Returns False if the lease expired meanwhile.
+        """
+
+        try:
+            os.utime(lease)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def release(self, task_id, lease):
+        """
+        Gives the task back to the pending tasks.
+        """
+
+        with contextlib.suppress(FileNotFoundError):
+            os.rename(lease, os.path.join(self.pending, task_id + '.json'))
+
+    def complete(self, task_id, worker, lease, result):
+        self.write(
+            os.path.join(self.results, '{0}.{1}.json'.format(task_id, worker)),
+            result
+        )
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(lease)
+
+
+def worker_name():
+    """
+    Returns the identifier of the worker process, unique across hosts.
+    """
+
+    return '{0}-{1}'.format(socket.gethostname().replace('.', '_'), os.getpid())
+
+
+def work(queue, function, worker=None, max_tasks=0, release_codes=()):
+    """
+    Processes the tasks of the queue until the job is finished. The function
+    is called with the arguments of each task in a separate process, which
+    is killed if the task times out. Tasks whose process exits with one of
+    the release codes are given back to the queue. Returns the number of
+    processed tasks.
+    """
+
+    worker = worker or worker_name()
+    job = queue.job()
+    interval = job.get('lease_timeout', LEASE_TIMEOUT) / 4
+    processed = 0
+
+    with pebble.ProcessPool(max_workers=1, max_tasks=max_tasks) as pool:
+        while not queue.finished:
+            claimed = queue.claim(worker)
+            if claimed is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            task_id, task, lease = claimed
+            LeaseQueue.info("Processing task {0}".format(task_id))
+            future = pool.schedule(function, task['arguments'],
+                                   timeout=task.get('timeout'))
+
+            while not concurrent.futures.wait([future], timeout=interval).done:
+                if not queue.renew(lease):
+                    LeaseQueue.warning("Lease of task {0} expired".format(task_id))
+
+            try:
+                result = {'result': future.result()}
+            except concurrent.futures.TimeoutError:
+                result = {'error': 'timeout'}
+            except pebble.ProcessExpired as error:
+                if error.exitcode in release_codes:
+                    queue.release(task_id, lease)
+                    continue
+                result = {'error': 'stopped'}
+
+            queue.complete(task_id, worker, lease, result)
+            processed += 1
+
+    return processed
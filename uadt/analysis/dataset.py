@@ -4,26 +4,59 @@
 Dataset - generate the dataset out of directory with pcap files.
 
 Usage:
-  dataset.py <directory> [--parallel=TRUE] [--outfile=<filename>] [--max-size=<size>]
+  dataset.py <directory> [--parallel=TRUE] [--outfile=<filename>] [--max-size=<size>] [--backend=<name>] [--no-cache] [--chunk-size=<n>] [--split=<method>] [--full] [--format=<format>] [--max-tasks=<n>] [--memory-limit=<size>] [--coordinate=<queue>] [--lease-timeout=<seconds>]
 
 Options:
-  --outfile=<name>  The name of output .csv file (defaults to <directory>.csv).
+  --outfile=<name>  The name of output file (defaults to <directory>.csv, or the extension of the format).
   --max-size=<size>  The maximum pcap file size (in MBs).
   --parallel=<value> Specify if dataset generation should leverage multiple processes [default: TRUE].
+  --backend=<name>   The packet source used to read pcap files (native, tshark or pyshark) [default: native].
+  --no-cache         Do not use the cache of parsed packet tables.
+  --chunk-size=<n>   The maximum number of small files processed at once by one worker [default: 32].
+  --split=<method>   Treat the files as session files and split them in memory using the given splitter method (marks or auto).
+  --full             Process all the files, instead of only the files that changed since the last build (see <outfile>.manifest).
+  --format=<format>  The format of the dataset: csv, or the typed columnar feather or parquet (requires pyarrow) [default: csv].
+  --max-tasks=<n>    Restart the workers after processing the given number of tasks (defaults to WORKER_MAX_TASKS from the config).
+  --memory-limit=<size>  Restart the workers whose memory grows by more than the limit over the memory of a fresh worker (in MBs, defaults to WORKER_MEMORY_LIMIT from the config).
+  --coordinate=<queue>  Publish the files in the given queue directory on a shared filesystem, to be processed by uadt-dataset-worker processes on any host.
+  --lease-timeout=<seconds>  Give the tasks of the coordinated workers which stopped responding for this long to other workers [default: 120].
 
 """
 
 
+import collections
+import itertools
 import os
 import glob
+import tempfile
+import time
+import uuid
 
-import pandas
 import pebble
-from concurrent.futures import TimeoutError
+from concurrent.futures import FIRST_COMPLETED, TimeoutError, wait
+from pebble import ProcessExpired
 from docopt import docopt
 
 from uadt import config
+from uadt.analysis.batch import FlowBatch
+from uadt.analysis.cache import PacketCache
+from uadt.analysis.coordinator import LEASE_TIMEOUT, POLL_INTERVAL, LeaseQueue
 from uadt.analysis.flow import Flow
+from uadt.analysis.formats import FORMATS, export_dataset
+from uadt.analysis.journal import DatasetJournal, format_header, format_rows
+from uadt.analysis.manifest import DatasetManifest
+from uadt.analysis import workers
+from uadt.analysis.schedule import Task, WorkScheduler
+from uadt.analysis.segments import SegmentContainer
+from uadt.analysis.splitter import Splitter
+from uadt.analysis.stream import peak_rss, reset_peak_rss
+
+
+# How often (in seconds) the journal of processed files is checkpointed
+CHECKPOINT_INTERVAL = 60
+
+# How many times a task is given to another worker after its lease expired
+MAXIMUM_ATTEMPTS = 3
 
 
 class DatasetProcessor(object):
@@ -31,17 +64,43 @@ class DatasetProcessor(object):
     A tool to for creation of data matrix from the annotated PCAP files.
     """
 
-    def __init__(self, input_directory, output_file=None, max_size=None, parallel=True):
+    def __init__(self, input_directory, output_file=None, max_size=None,
+                 parallel=True, backend=None, use_cache=True, chunk_size=32,
+                 split=None, incremental=True, format='csv', max_tasks=None,
+                 memory_limit=None, coordinate=None,
+                 lease_timeout=LEASE_TIMEOUT):
+        if format not in FORMATS:
+            raise ValueError("Unknown dataset format: {0}".format(format))
+
         self.file_queue = self.paths_to_process(input_directory, max_size)
-        self.output = self.output_filename(input_directory, output_file)
+        self.output = self.output_filename(input_directory, output_file, format)
         self.parallel = parallel
+        self.backend = backend
+        self.use_cache = use_cache
+        self.chunk_size = int(chunk_size)
+        self.split = split
+        self.incremental = incremental
+        self.format = format
+
+        # Recycling of the workers
+        if max_tasks is None:
+            max_tasks = getattr(config, 'WORKER_MAX_TASKS', 0)
+        if memory_limit is None:
+            memory_limit = getattr(config, 'WORKER_MEMORY_LIMIT', None)
+        self.max_tasks = int(max_tasks or 0)
+        self.memory_limit = int(memory_limit) * 1024 ** 2 if memory_limit else None
+
+        # Coordination of workers on other hosts
+        self.coordinate = coordinate
+        self.lease_timeout = int(lease_timeout)
 
     @staticmethod
     def paths_to_process(input_directory, max_size):
         """
         Returns a list of files that are to be processed. By default it
         searches for all the PCAP files in the given input directory, that do
-        not exceed given maximum filesize.
+        not exceed given maximum filesize. Segments stored in segment
+        containers are included as well, via their virtual paths.
         """
 
         search_string = os.path.join(input_directory, '*.pcap')
@@ -52,10 +111,15 @@ class DatasetProcessor(object):
             size = int(max_size) * 1024 ** 2
             paths = list(filter(lambda p: os.path.getsize(p) < max_size, paths))
 
+        search_string = os.path.join(input_directory, '*.segments')
+        for container_path in sorted(glob.glob(search_string)):
+            with SegmentContainer(container_path) as container:
+                paths.extend(container.paths())
+
         return paths
 
     @staticmethod
-    def output_filename(input_directory, output_file):
+    def output_filename(input_directory, output_file, format='csv'):
         """
         Determines the filename of the output file. If no particular name was
         specified at initialization, the output filename is derived from the
@@ -69,60 +133,564 @@ class DatasetProcessor(object):
             if not directory_name:
                 directory_name = os.path.dirname(input_directory)
                 directory_name = os.path.basename(directory_name)
-            return '{0}.csv'.format(directory_name)
+            return directory_name + FORMATS[format]
+
+    @property
+    def rows_file(self):
+        """
+        Returns the location of the CSV rows of the dataset. The datasets of
+        columnar formats are exported from the rows kept next to them, which
+        allows them to be updated incrementally.
+        """
+
+        if self.format == 'csv':
+            return self.output
+        return self.output + '.rows'
+
+    @property
+    def version(self):
+        return self.dataset_version(self.backend, self.split)
 
     @staticmethod
-    def process_pcap(path, path_index, files_count):
+    def dataset_version(backend=None, split=None):
         """
-        Extracts feature vector for one particular PCAP file.
+        Returns the version of the dataset, which changes whenever the
+        features or the way the files are read change.
+        """
+
+        return '{0}-{1}-{2}'.format(backend or Flow.backend, split or 'none',
+                                    Flow.plan.feature_version)
+
+    @staticmethod
+    def load_flow(path, path_index, files_count, backend=None, use_cache=True):
+        """
+        Loads the flow of one particular PCAP file. Returns None if the flow
+        is empty or could not be loaded.
         """
 
         print('[{1}/{2}] Processing: {0}'.format(path, path_index, files_count))
 
         try:
-            f = Flow.from_path(path)
+            # Measure the memory high-water mark of this file alone
+            reset_peak_rss()
+            f = Flow.from_path(path, backend=backend, use_cache=use_cache)
+            print('[{1}/{2}] Loaded: {0} ({3} packets, peak RSS {4:.1f} MB)'.format(
+                path, path_index, files_count, len(f.data), peak_rss() / 1024 ** 2))
+
             if not f.data.empty:
-                return f.features
+                return f
             else:
                 print("Warning: Flow '{0}' is empty".format(path))
         except (Exception, AttributeError) as e:
             print("Data extraction from '{0}' failed: {1}".format(path, str(e)))
 
+    @staticmethod
+    def load_session(path, path_index, files_count, split, backend=None,
+                     use_cache=True):
+        """
+        Splits the session PCAP file in memory using the given splitter
+        method. Returns the list of non-empty flows of its segments.
+        """
+
+        print('[{1}/{2}] Splitting: {0}'.format(path, path_index, files_count))
+
+        try:
+            splitter = Splitter.get_plugin(split)(None)
+            return [
+                f for _, _, _, f in splitter.split_flows(path, backend, use_cache)
+                if not f.data.empty
+            ]
+        except Exception as e:
+            print("Data extraction from '{0}' failed: {1}".format(path, str(e)))
+            return []
+
+    @staticmethod
+    def process_chunk(paths, first_index, files_count, backend=None,
+                      use_cache=True, split=None, memory_limit=None):
+        """
+        Extracts feature vectors for a chunk of PCAP files. The features of
+        all the flows in the chunk are computed at once by FlowBatch. Returns
+        the list of (path, feature vectors) pairs, one for each processed
+        file. If the worker exceeds the memory limit, the remaining files are
+        left unprocessed.
+        """
+
+        loaded = []
+        for offset, path in enumerate(paths):
+            if loaded and workers.over_limit(memory_limit):
+                print("Worker exceeded the memory limit, leaving {0} files "
+                      "for other workers".format(len(paths) - offset))
+                break
+
+            if split:
+                flows = DatasetProcessor.load_session(
+                    path, first_index + offset, files_count, split, backend,
+                    use_cache)
+            else:
+                flow = DatasetProcessor.load_flow(
+                    path, first_index + offset, files_count, backend, use_cache)
+                flows = [flow] if flow is not None else []
+            loaded.append((path, flows))
+
+        flows = [f for _, file_flows in loaded for f in file_flows]
+
+        try:
+            features = FlowBatch(flows).features
+        except Exception as e:
+            print("Batch feature extraction failed, falling back to "
+                  "individual flows: {0}".format(str(e)))
+
+            features = []
+            for f in flows:
+                try:
+                    features.append(f.features)
+                except Exception as e:
+                    print("Data extraction from '{0}' failed: {1}".format(f.path, str(e)))
+                    features.append(None)
+
+        results = []
+        offset = 0
+        for path, file_flows in loaded:
+            rows = features[offset:offset + len(file_flows)]
+            results.append((path, [row for row in rows if row is not None]))
+            offset += len(file_flows)
+
+        return results
+
     def process(self):
         """
         Processes the splitted PCAP files, extracting feature vector from each.
         The implementation leverages a pool of processes provided my the
-        pebble module.
+        pebble module, each task processing one chunk of files.
+
+        Unless asked to process all the files, only the files which are new
+        or changed since the last build are processed, the rows of the other
+        files are taken over from the existing dataset.
+
+        The results are consumed as they are completed and appended to the
+        journal, which is checkpointed periodically, so that an interrupted
+        build resumes where it stopped. Once all the files are processed, the
+        dataset is assembled out of the journal and the previous dataset.
+
+        The files are scheduled largest first, small files in batches, with
+        timeouts derived from the processing rate measured in the previous
+        run. The rate is measured only on the tasks which did not use the
+        packet cache.
+        """
+
+        manifest = DatasetManifest.load(self.output, self.version)
+        journal = DatasetJournal(self.output)
+        if not self.incremental:
+            manifest.entries.clear()
+            journal.truncate(0)
+
+        manifest.validate(self.rows_file, journal.size)
+        journal.truncate(manifest.journal)
+
+        signatures = manifest.signatures(self.file_queue)
+        pending = [
+            path for path in self.file_queue
+            if manifest.changed(path, signatures[path])
+        ]
+        # The entries of the changed files are replaced once they are
+        # processed, their content hashes are computed then
+        previous = {path: manifest.entries.pop(path, None) for path in pending}
+
+        print("Processing {0} of {1} files ({2} unchanged)".format(
+            len(pending), len(self.file_queue),
+            len(self.file_queue) - len(pending)))
+
+        # Split the files into tasks, largest first
+        scheduler = WorkScheduler(
+            {path: signatures[path][0] for path in pending},
+            config.NUM_JOBS, manifest.rate, self.chunk_size,
+            largest=manifest.largest
+        )
+        tasks = scheduler.tasks(pending)
+
+        started = time.monotonic()
+        progress = {'checkpoint': started, 'cost': 0, 'time': 0,
+                    'largest': manifest.largest or 0}
+        stats = collections.Counter()
+
+        def consume(task, elapsed, results):
+            if elapsed is not None:
+                progress['cost'] += task.cost
+                progress['time'] += elapsed
+                progress['largest'] = max(
+                    [progress['largest']]
+                    + [scheduler.cost(path) for path, _, _ in results])
+
+            for path, count, data in results:
+                offset, length = journal.append(data)
+                manifest.update(path, signatures[path], count, offset, length,
+                                previous.get(path))
+
+            if time.monotonic() - progress['checkpoint'] > CHECKPOINT_INTERVAL:
+                self.checkpoint(manifest, journal)
+                progress['checkpoint'] = time.monotonic()
+
+        if self.coordinate:
+            failed = self.run_queue(tasks, scheduler, stats, consume)
+        else:
+            failed = self.run_tasks(tasks, scheduler, stats, consume,
+                                    config.NUM_JOBS, self.max_tasks,
+                                    self.memory_limit)
+
+        # Files which made the workers exceed the memory limit are processed
+        # one at a time, in fresh workers without the limit
+        if failed:
+            print("Retrying {0} files in an isolated worker".format(len(failed)))
+            isolated = collections.Counter()
+            stopped = self.run_tasks(
+                [Task([path], scheduler.cost(path)) for path in failed],
+                scheduler, isolated, consume, max_workers=1, max_tasks=1)
+            stats['isolated'] = len(failed)
+            stats['isolated failed'] = isolated['timed out'] + len(stopped)
+
+        rate = scheduler.calibrate(progress['cost'], progress['time'])
+        self.report(scheduler, tasks, time.monotonic() - started, stats, rate)
+        if rate:
+            manifest.rate = rate
+            manifest.largest = progress['largest']
+
+        self.checkpoint(manifest, journal)
+        self.finalize(manifest, journal)
+
+        if self.format != 'csv':
+            export_dataset(self.rows_file, self.output, self.format, {
+                'version': self.version,
+                'feature_version': Flow.plan.feature_version,
+                'sources': list(manifest.entries),
+            })
+
+        # Keep the packet cache within its size limit
+        cache = PacketCache.default()
+        if self.use_cache and cache is not None:
+            cache.prune()
+
+    @staticmethod
+    def process_task(paths, first_index, files_count, backend=None,
+                     use_cache=True, split=None, memory_limit=None):
+        """
+        Processes one scheduled chunk of files. Returns the time it took,
+        or None if it read packet tables from the cache, the results - the
+        number of rows of each file and the rows formatted for the journal -
+        and the files left unprocessed. Workers which exceed the memory limit
+        are restarted before processing the task.
         """
 
-        # Determine the range of files to be processed
-        futures = []
+        workers.recycle(memory_limit)
+        workers.watch(memory_limit)
+
+        hits = PacketCache.hits
+        start = time.perf_counter()
+        results = DatasetProcessor.process_chunk(
+            paths, first_index, files_count, backend, use_cache, split,
+            memory_limit)
+        elapsed = time.perf_counter() - start
+
+        # Cached files would make the rate the timeouts derive from too high
+        if PacketCache.hits != hits:
+            elapsed = None
+
+        processed = set(path for path, _ in results)
+        remaining = [path for path in paths if path not in processed]
+        results = [
+            (path, len(rows), format_rows(rows, Flow.plan.feature_names))
+            for path, rows in results
+        ]
+        return elapsed, results, remaining
+
+    def run_tasks(self, tasks, scheduler, stats, consume, max_workers,
+                  max_tasks=0, memory_limit=None):
+        """
+        Runs the tasks in a pool of workers, passing the results to the
+        consume callback as they are completed. Tasks of restarted workers
+        and the files left unprocessed are scheduled again, the files of
+        timed out tasks one at a time, so that only the file which took too
+        long is left out. Workers are
+        restarted before they start a task, and fresh workers are never
+        restarted, so the restarts do not count against the task. Returns the
+        files of the tasks whose workers were stopped or died otherwise.
+        """
+
+        futures = {}
+        failed = []
+        files_count = sum(len(task.paths) for task in tasks)
+
+        def schedule(pool, task):
+            future = pool.schedule(
+                self.process_task,
+                (task.paths, stats['scheduled'] + 1, files_count, self.backend,
+                 self.use_cache, self.split, memory_limit),
+                timeout=scheduler.timeout(task),
+            )
+            futures[future] = task
+            stats['scheduled'] += len(task.paths)
+
+        with pebble.ProcessPool(max_workers=max_workers, max_tasks=max_tasks) as pool:
+            for task in tasks:
+                schedule(pool, task)
+
+            # Files which were not processed successfully are processed again
+            # next time
+            while futures:
+                done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = futures.pop(future)
+                    try:
+                        elapsed, results, remaining = future.result()
+                    except TimeoutError:
+                        print("Processing of {0} files ({1:.1f} MB) timed out".format(
+                            len(task.paths), task.cost / 1024 ** 2))
+                        if len(task.paths) > 1:
+                            for path in task.paths:
+                                schedule(pool, Task([path], scheduler.cost(path)))
+                        else:
+                            stats['timed out'] += 1
+                        continue
+                    except ProcessExpired as error:
+                        if error.exitcode == workers.RECYCLE_EXIT_CODE:
+                            stats['recycled'] += 1
+                            schedule(pool, task)
+                        else:
+                            stats['stopped'] += 1
+                            failed.extend(task.paths)
+                        continue
+
+                    consume(task, elapsed, results)
+                    if remaining:
+                        schedule(pool, Task(remaining, sum(
+                            scheduler.cost(path) for path in remaining)))
+
+        return failed
+
+    @staticmethod
+    def remote_task(*arguments):
+        """
+        Processes one task of the coordinated queue. The rows are passed as
+        text, as the results are stored as JSON.
+        """
+
+        elapsed, results, remaining = DatasetProcessor.process_task(*arguments)
+        results = [
+            (path, count, data.decode('utf-8')) for path, count, data in results
+        ]
+        return elapsed, results, remaining
+
+    def run_queue(self, tasks, scheduler, stats, consume):
+        """
+        Publishes the tasks in the queue directory shared with the workers
+        on other hosts, passing the results to the consume callback as they
+        are completed. Tasks whose leases expire are given to other workers,
+        at most MAXIMUM_ATTEMPTS times. The files of timed out tasks are
+        published again one at a time. As an expired task may be completed
+        by several workers, only the first result of each task is used.
+        The task identifiers are prefixed by the identifier of the job, so
+        that the results of the tasks of interrupted jobs, completed by their
+        workers only later, are dropped. Returns the files of the tasks which
+        were not completed.
+        """
+
+        job_id = uuid.uuid4().hex[:8]
+        queue = LeaseQueue(self.coordinate)
+        queue.create({
+            'id': job_id,
+            'root': os.getcwd(),
+            'version': self.version,
+            'backend': self.backend,
+            'split': self.split,
+            'max_tasks': self.max_tasks,
+            'lease_timeout': self.lease_timeout,
+        })
+
+        outstanding = {}
+        failed = []
+        files_count = sum(len(task.paths) for task in tasks)
+        identifiers = itertools.count()
+
+        def publish(task):
+            task_id = '{0}-{1:06d}'.format(job_id, next(identifiers))
+            queue.publish(task_id, {
+                'arguments': [task.paths, stats['scheduled'] + 1, files_count,
+                              self.backend, self.use_cache, self.split,
+                              self.memory_limit],
+                'timeout': scheduler.timeout(task),
+            })
+            outstanding[task_id] = (task, 0)
+            stats['scheduled'] += len(task.paths)
+
+        for task in tasks:
+            publish(task)
+
+        print("Published {0} tasks in '{1}', waiting for the workers".format(
+            len(tasks), self.coordinate))
+
+        try:
+            while outstanding:
+                for task_id, result in queue.collect():
+                    if not task_id.startswith(job_id + '-'):
+                        print("Dropping the result of task {0} of a previous "
+                              "job".format(task_id))
+                        continue
+                    if task_id not in outstanding:
+                        stats['duplicates'] += 1
+                        continue
+
+                    # Only results of the files of the task are used
+                    if not self.matches(outstanding[task_id][0], result):
+                        print("Dropping the result of task {0}, which does "
+                              "not match the task".format(task_id))
+                        continue
+
+                    # The task may have been given back after its lease
+                    # expired, while its first worker was still processing it
+                    task, attempt = outstanding.pop(task_id)
+                    queue.withdraw(task_id)
+
+                    if result.get('error') == 'timeout':
+                        print("Processing of {0} files ({1:.1f} MB) timed out".format(
+                            len(task.paths), task.cost / 1024 ** 2))
+                        if len(task.paths) > 1:
+                            for path in task.paths:
+                                publish(Task([path], scheduler.cost(path)))
+                        else:
+                            stats['timed out'] += 1
+                        continue
+                    elif 'error' in result:
+                        stats['stopped'] += 1
+                        failed.extend(task.paths)
+                        continue
+
+                    elapsed, results, remaining = result['result']
+                    consume(task, elapsed, [
+                        (path, count, data.encode('utf-8'))
+                        for path, count, data in results
+                    ])
+                    if remaining:
+                        publish(Task(remaining, sum(
+                            scheduler.cost(path) for path in remaining)))
+
+                for task_id in queue.expire(self.lease_timeout):
+                    if task_id not in outstanding:
+                        continue
+
+                    stats['expired'] += 1
+                    task, attempt = outstanding[task_id]
+                    if attempt < MAXIMUM_ATTEMPTS:
+                        outstanding[task_id] = (task, attempt + 1)
+                    else:
+                        queue.withdraw(task_id)
+                        del outstanding[task_id]
+                        failed.extend(task.paths)
+
+                time.sleep(POLL_INTERVAL)
+        finally:
+            queue.finish()
+
+        return failed
+
+    @staticmethod
+    def matches(task, result):
+        """
+        Determines whether the result of the coordinated queue covers only
+        the files of the given task.
+        """
+
+        if 'result' not in result:
+            return True
+
+        _, results, remaining = result['result']
+        paths = [path for path, _, _ in results] + remaining
+        return set(paths) <= set(task.paths)
+
+    @staticmethod
+    def report(scheduler, tasks, makespan, stats, rate=None):
+        """
+        Reports the predicted and the actual duration of processing and the
+        statistics of the workers. Without a calibrated rate, the duration is
+        predicted from the given rate measured in this run.
+        """
+
+        if not tasks:
+            return
+
+        print("Workers restarted over the memory limit: {0}, stopped: {1}, "
+              "files retried in isolation: {2} ({3} failed), timed out: {4}"
+              .format(stats['recycled'], stats['stopped'], stats['isolated'],
+                      stats['isolated failed'], stats['timed out']))
+
+        if stats['expired'] or stats['duplicates']:
+            print("Leases expired: {0}, duplicate results dropped: {1}".format(
+                stats['expired'], stats['duplicates']))
+
+        rate = scheduler.rate or rate
+        predicted = scheduler.makespan(tasks, rate)
+        if predicted is None:
+            print("Processed {0} tasks in {1:.1f} s (no calibrated rate to "
+                  "predict from)".format(len(tasks), makespan))
+        else:
+            print("Processed {0} tasks in {1:.1f} s (predicted {2:.1f} s at "
+                  "{3:.2f} MB/s per worker{4})".format(
+                      len(tasks), makespan, predicted, rate / 1024 ** 2,
+                      '' if scheduler.rate else ' measured in this run'))
+
+    @staticmethod
+    def checkpoint(manifest, journal):
+        """
+        Stores the journal and the manifest describing it.
+        """
+
+        manifest.journal = journal.checkpoint()
+        manifest.save()
+
+    def finalize(self, manifest, journal):
+        """
+        Writes the dataset atomically, copying the rows of each file from
+        either the journal or the previous dataset, in the order of the files.
+        Files removed since the last build are dropped. The previous dataset
+        is kept intact until the new one is complete.
+        """
+
+        directory = os.path.dirname(os.path.abspath(self.rows_file))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+        sources = {True: open(journal.path, 'rb')}
+        if os.path.exists(self.rows_file):
+            sources[False] = open(self.rows_file, 'rb')
+
+        entries = collections.OrderedDict()
+        try:
+            with os.fdopen(descriptor, 'wb') as target:
+                target.write(format_header(Flow.plan.feature_names))
 
-        queue_length = len(self.file_queue)
+                for path in self.file_queue:
+                    entry = manifest.entries.get(path)
+                    if entry is None:
+                        continue
 
-        with pebble.ProcessPool(max_workers=config.NUM_JOBS) as pool:
-            for counter, path in enumerate(self.file_queue):
-                future = pool.schedule(
-                    self.process_pcap,
-                    (path, counter + 1, queue_length),
-                    timeout=1800,
-                )
-                futures.append(future)
+                    source = sources[entry['journal']]
+                    source.seek(entry['offset'])
+                    data = source.read(entry['length'])
 
-        raw_data = []
-        for future in futures:
-            try:
-                result = future.result()
-                if result is not None:
-                    raw_data.append(result)
-            except TimeoutError:
-                pass
+                    entry.update(journal=False, offset=target.tell())
+                    target.write(data)
+                    entries[path] = entry
 
-        pool.close()
-        pool.join()
+            os.replace(temporary, self.rows_file)
+        except Exception:
+            os.remove(temporary)
+            raise
+        finally:
+            for source in sources.values():
+                source.close()
 
-        data = pandas.DataFrame(raw_data)
-        data.to_csv(self.output, header=True, index=False, mode='w')
+        manifest.entries = entries
+        manifest.dataset = manifest.signature(self.rows_file)
+        manifest.journal = 0
+        manifest.save()
+        journal.remove()
 
 
 def main():
@@ -131,7 +699,17 @@ def main():
         arguments['<directory>'],
         arguments['--outfile'],
         arguments['--max-size'],
-        arguments['--parallel']
+        arguments['--parallel'],
+        arguments['--backend'],
+        not arguments['--no-cache'],
+        arguments['--chunk-size'],
+        arguments['--split'],
+        not arguments['--full'],
+        arguments['--format'],
+        arguments['--max-tasks'],
+        arguments['--memory-limit'],
+        arguments['--coordinate'],
+        arguments['--lease-timeout']
     )
     processor.process()
 
@@ -1,113 +1,166 @@
 from uadt import config
 
+
+def tshark_field(name, missing=None):
+    """
+    Declares the tshark field the decorated parameter method reads. Packet
+    sources that do not dissect packets via pyshark use this declaration to
+    extract the parameter directly. The protocol of the field determines the
+    layer the packet must have for the method to be applied, packets without
+    the layer get the missing value instead.
+    """
+
+    def decorator(method):
+        method.tshark_field = name
+        method.missing_value = missing
+        return method
+
+    return decorator
+
+
+def vectorized(reduction, column=None, scope='all', value=None):
+    """
+    Declares the decorated feature method as the given reduction of the
+    parameter column over the packets of the scope (all, forward or backward
+    packets). This allows FlowBatch to compute the feature for many flows at
+    once. Supported reductions are count, sum, min, max, mean, std, var,
+    present (number of packets having the parameter, None if zero) and equal
+    (number of packets with the parameter equal to value, None if zero).
+    """
+
+    def decorator(method):
+        method.vectorized = (reduction, column, scope, value)
+        return method
+
+    return decorator
+
+
 class SizeFeatures(object):
     """
     Provides implementation of size-related features.
     """
 
     @staticmethod
+    @tshark_field('frame.cap_len')
     def parameter_size(packet):
         """
         Returns the size of the packet.
         """
         return int(packet.captured_length)
 
+    @vectorized('count', scope='forward')
     def feature_f_num(self):
         """
         Returns the number of forward packets.
         """
         return len(self.forward_packets)
 
+    @vectorized('sum', 'size', scope='forward')
     def feature_f_size_sum(self):
         """
         Returns the total size of all forward packets.
         """
         return self.forward_packets['size'].sum()
 
+    @vectorized('min', 'size', scope='forward')
     def feature_f_size_min(self):
         """
         Returns the size of the smallest forward packet.
         """
         return self.forward_packets['size'].min()
 
+    @vectorized('max', 'size', scope='forward')
     def feature_f_size_max(self):
         """
         Returns the size of the biggest forward packet.
         """
         return self.forward_packets['size'].max()
 
+    @vectorized('mean', 'size', scope='forward')
     def feature_f_size_mean(self):
         """
         Returns the mean size of the forward packets.
         """
         return self.forward_packets['size'].mean()
 
+    @vectorized('std', 'size', scope='forward')
     def feature_f_size_std(self):
         """
         Returns the mean size of the forward packets.
         """
         return self.forward_packets['size'].std()
 
+    @vectorized('count', scope='backward')
     def feature_b_num(self):
         """
         Returns the number of backward packets.
         """
         return len(self.backward_packets)
 
+    @vectorized('sum', 'size', scope='backward')
     def feature_b_size_sum(self):
         """
         Returns the total size of all backward packets.
         """
         return self.backward_packets['size'].sum()
 
+    @vectorized('min', 'size', scope='backward')
     def feature_b_size_min(self):
         """
         Returns the size of the smallest backward packet.
         """
         return self.backward_packets['size'].min()
 
+    @vectorized('max', 'size', scope='backward')
     def feature_b_size_max(self):
         """
         Returns the size of the biggest backward packet.
         """
         return self.backward_packets['size'].max()
 
+    @vectorized('mean', 'size', scope='backward')
     def feature_b_size_mean(self):
         """
         Returns the mean size of the backward packets.
         """
         return self.backward_packets['size'].mean()
 
+    @vectorized('std', 'size', scope='backward')
     def feature_b_size_std(self):
         """
         Returns the mean size of the backward packets.
         """
         return self.backward_packets['size'].std()
 
+    @vectorized('count')
     def feature_t_num(self):
         """
         Returns the number of packets.
         """
         return len(self.data)
 
+    @vectorized('min', 'size')
     def feature_t_size_min(self):
         """
         Returns the size of the smallest packet.
         """
         return self.data['size'].min()
 
+    @vectorized('max', 'size')
     def feature_t_size_max(self):
         """
         Returns the size of the biggest packet.
         """
         return self.data['size'].max()
 
+    @vectorized('mean', 'size')
     def feature_t_size_mean(self):
         """
         Returns the mean of size of all the packets.
         """
         return self.data['size'].mean()
 
+    @vectorized('var', 'size')
     def feature_t_size_var(self):
         """
         Returns the variance of size of all the packets.
@@ -121,54 +174,63 @@ class TimeGapFeatures(object):
     """
 
     @staticmethod
+    @tshark_field('frame.time_epoch')
     def parameter_timestamp(packet):
         """
         Returns the time when the packet was captured.
         """
         return float(packet.sniff_timestamp)
 
+    @vectorized('min', 'timeshift', scope='backward')
     def feature_b_time_min(self):
         """
         Returns the smallest inter time difference among backward packets.
         """
         return self.backward_packets['timeshift'].min()
 
+    @vectorized('max', 'timeshift', scope='backward')
     def feature_b_time_max(self):
         """
         Returns the biggest inter time difference among backward packets.
         """
         return self.backward_packets['timeshift'].max()
 
+    @vectorized('mean', 'timeshift', scope='backward')
     def feature_b_time_mean(self):
         """
         Returns the mean inter time difference among backward packets.
         """
         return self.backward_packets['timeshift'].mean()
 
+    @vectorized('std', 'timeshift', scope='backward')
     def feature_b_time_std(self):
         """
         Returns the std of inter time difference among backward packets.
         """
         return self.backward_packets['timeshift'].std()
 
+    @vectorized('min', 'timeshift', scope='forward')
     def feature_f_time_min(self):
         """
         Returns the smallest inter time difference among forward packets.
         """
         return self.forward_packets['timeshift'].min()
 
+    @vectorized('max', 'timeshift', scope='forward')
     def feature_f_time_max(self):
         """
         Returns the biggest inter time difference among forward packets.
         """
         return self.forward_packets['timeshift'].max()
 
+    @vectorized('mean', 'timeshift', scope='forward')
     def feature_f_time_mean(self):
         """
         Returns the mean inter time difference among forward packets.
         """
         return self.forward_packets['timeshift'].mean()
 
+    @vectorized('std', 'timeshift', scope='forward')
     def feature_f_time_std(self):
         """
         Returns the std of inter time difference among forward packets.
@@ -182,6 +244,7 @@ class IPFeatures(object):
     """
 
     @staticmethod
+    @tshark_field('ip.ttl')
     def parameter_ttl(packet):
         """
         Returns the time-to-live value of the packet.
@@ -189,6 +252,7 @@ class IPFeatures(object):
 
         return int(packet.ip.ttl)
 
+    @vectorized('mean', 'ttl', scope='forward')
     def feature_f_ttl_mean(self):
         """
         Returns the mean of TTL values in forward packets.
@@ -202,6 +266,7 @@ class TCPFeatures(object):
     """
 
     @staticmethod
+    @tshark_field('tcp.window_size')
     def parameter_tcp_window_size(packet):
         """
         Returns the window size of the TCP packet.
@@ -209,33 +274,42 @@ class TCPFeatures(object):
         return int(packet.tcp.window_size)
 
     @staticmethod
+    @tshark_field('tcp.window_size_scalefactor')
     def parameter_tcp_window_scalefactor(packet):
         """
         Returns the window size scalefactor of the TCP packet.
         """
         return int(packet.tcp.window_size_scalefactor)
 
+    @vectorized('min', 'tcp_window_size')
     def feature_tcp_window_size_min(self):
         return self.data['tcp_window_size'].min()
 
+    @vectorized('max', 'tcp_window_size')
     def feature_tcp_window_size_max(self):
         return self.data['tcp_window_size'].max()
 
+    @vectorized('mean', 'tcp_window_size')
     def feature_tcp_window_size_mean(self):
         return self.data['tcp_window_size'].mean()
 
+    @vectorized('std', 'tcp_window_size')
     def feature_tcp_window_size_std(self):
         return self.data['tcp_window_size'].std()
 
+    @vectorized('min', 'tcp_window_scalefactor')
     def feature_tcp_window_scalefactor_min(self):
         return self.data['tcp_window_scalefactor'].min()
 
+    @vectorized('max', 'tcp_window_scalefactor')
     def feature_tcp_window_scalefactor_max(self):
         return self.data['tcp_window_scalefactor'].max()
 
+    @vectorized('mean', 'tcp_window_scalefactor')
     def feature_tcp_window_scalefactor_mean(self):
         return self.data['tcp_window_scalefactor'].mean()
 
+    @vectorized('std', 'tcp_window_scalefactor')
     def feature_tcp_window_scalefactor_std(self):
         return self.data['tcp_window_scalefactor'].std()
 
@@ -246,53 +320,69 @@ class SSLFeatures(object):
     """
 
     @staticmethod
+    @tshark_field('ssl.handshake.session_id_length')
     def parameter_ssl_session_id_length(packet):
         return int(packet.ssl.handshake_session_id_length)
 
     @staticmethod
+    @tshark_field('ssl.handshake.comp_methods_length')
     def parameter_ssl_compression_methods_length(packet):
         return int(packet.ssl.handshake_comp_methods_length)
 
     @staticmethod
+    @tshark_field('ssl.handshake.extensions_length')
     def parameter_ssl_extensions_length(packet):
         return int(packet.ssl.handshake_extensions_length)
 
+    @vectorized('min', 'ssl_session_id_length')
     def feature_ssl_session_id_length_min(self):
         return self.data['ssl_session_id_length'].min()
 
+    @vectorized('max', 'ssl_session_id_length')
     def feature_ssl_session_id_length_max(self):
         return self.data['ssl_session_id_length'].max()
 
+    @vectorized('mean', 'ssl_session_id_length')
     def feature_ssl_session_id_length_mean(self):
         return self.data['ssl_session_id_length'].mean()
 
+    @vectorized('std', 'ssl_session_id_length')
     def feature_ssl_session_id_length_std(self):
         return self.data['ssl_session_id_length'].std()
 
+    @vectorized('min', 'ssl_compression_methods_length')
     def feature_ssl_compression_methods_length_min(self):
         return self.data['ssl_compression_methods_length'].min()
 
+    @vectorized('max', 'ssl_compression_methods_length')
     def feature_ssl_compression_methods_length_max(self):
         return self.data['ssl_compression_methods_length'].max()
 
+    @vectorized('mean', 'ssl_compression_methods_length')
     def feature_ssl_compression_methods_length_mean(self):
         return self.data['ssl_compression_methods_length'].mean()
 
+    @vectorized('std', 'ssl_compression_methods_length')
     def feature_ssl_compression_methods_length_std(self):
         return self.data['ssl_compression_methods_length'].std()
 
+    @vectorized('min', 'ssl_extensions_length')
     def feature_ssl_extensions_length_min(self):
         return self.data['ssl_extensions_length'].min()
 
+    @vectorized('max', 'ssl_extensions_length')
     def feature_ssl_extensions_length_max(self):
         return self.data['ssl_extensions_length'].max()
 
+    @vectorized('mean', 'ssl_extensions_length')
     def feature_ssl_extensions_length_mean(self):
         return self.data['ssl_extensions_length'].mean()
 
+    @vectorized('std', 'ssl_extensions_length')
     def feature_ssl_extensions_length_std(self):
         return self.data['ssl_extensions_length'].std()
 
+    @vectorized('present', 'ssl_session_id_length')
     def feature_ssl_num_handshakes(self):
         counts = self.data['ssl_session_id_length'].notnull().value_counts()
         return counts.get(True)
@@ -304,14 +394,17 @@ class DNSFeatures(object):
     """
 
     @staticmethod
+    @tshark_field('dns.qry.type')
     def parameter_dns_request_type(packet):
         """
         Returns the type of the TCP packet.
         """
         return int(packet.dns.qry_type)
 
+    @vectorized('equal', 'dns_request_type', value=1)
     def feature_num_dns_A_requests(self):
         return (self.data['dns_request_type'] == 1).value_counts().get(True)
 
+    @vectorized('present', 'dns_request_type')
     def feature_num_dns_requests(self):
         return self.data['dns_request_type'].notnull().value_counts().get(True)
@@ -1,38 +1,44 @@
 import datetime
 import os
 
+import numpy
 import pyshark
 import pandas
 import pprint
 
 from cached_property import cached_property
 
+from uadt.analysis.backends import PacketSource
+from uadt.analysis.cache import PacketCache
+from uadt.analysis.pcap import LAYER_BITS
+from uadt.analysis.plan import PlanMount
+from uadt.analysis.stream import ColumnBuffer, chunked
 from uadt.analysis.features import (SizeFeatures, TimeGapFeatures, TCPFeatures,
-                                    IPFeatures, SSLFeatures, DNSFeatures)
+                                    IPFeatures, SSLFeatures, DNSFeatures,
+                                    tshark_field)
 from uadt import constants
 from uadt import config
 
 
 class Flow(SizeFeatures, TimeGapFeatures, TCPFeatures, IPFeatures, SSLFeatures,
-           DNSFeatures):
+           DNSFeatures, metaclass=PlanMount):
     """
     Represents one captured session flow, which should be classified.
     Generates necessary features that will be used as inputs during classification.
+    The parameters and features are found once per class, see FeaturePlan.
     """
 
-    def __init__(self, packets, path=None):
+    # The packet source used by from_path unless specified otherwise
+    backend = 'native'
+
+    def __init__(self, packets=(), path=None, data=None):
         self.path = path
 
-        # Dynamically find all parameters
-        self.parameter_methods = [
-            ('_'.join(k.split('_')[1:]), getattr(self, k))
-            for k in dir(self)
-            if k.startswith('parameter_')
-        ]
+        # Extract basic data from the flow, unless already extracted
+        if data is None:
+            data = self.parse_packets(list(packets))
 
-        # Extract basic data from the flow
-        packet_data = [self.parse_packet(p) for p in packets]
-        self.data = pandas.DataFrame(packet_data)
+        self.data = data
 
     @property
     def interval(self):
@@ -45,28 +51,75 @@ class Flow(SizeFeatures, TimeGapFeatures, TCPFeatures, IPFeatures, SSLFeatures,
         return self.data.empty
 
     @classmethod
-    def from_path(cls, path):
-        # Parse out pcap file using pyshark
-        packets = list(pyshark.FileCapture(path))
-        return cls(packets, path=path)
+    def from_path(cls, path, backend=None, use_cache=True):
+        # Parse out pcap file using the selected packet source
+        source_cls = PacketSource.get_plugin(backend or cls.backend)
+        cache = PacketCache.default() if use_cache else None
+        return source_cls(cls).load(path, cache)
+
+    @classmethod
+    def from_packets(cls, packets, path=None, chunk_size=None):
+        """
+        Builds the flow out of an iterable of packets (i.e. a generator),
+        consuming it in chunks of the given size. Only one chunk of packets is
+        held in memory at a time.
+        """
+
+        chunk_size = chunk_size or getattr(config, 'PACKET_CHUNK_SIZE', 4096)
+
+        buffer = ColumnBuffer()
+        for chunk in chunked(packets, chunk_size):
+            buffer.append(cls.parse_packets(chunk))
+
+        return cls(path=path, data=buffer.table(cls.plan.parameter_names))
+
+    @staticmethod
+    def layer_mask(packet):
+        """
+        Returns the bitmask of the protocol layers present in the packet.
+        """
+
+        mask = 0
+        for layer in packet.layers:
+            mask |= LAYER_BITS.get(layer.layer_name, 0)
 
-    def parse_packet(self, packet):
+        return mask
+
+    @classmethod
+    def parse_packets(cls, packets):
         """
-        Compute the parameters vector by applying each parameter method
-        on the given packet. This parameter vector is then expanded to
-        a feature vector by computing various statistics of parameters.
+        Compute the parameters table by applying each parameter method on the
+        given packets. The table is then reduced to a feature vector by
+        computing various statistics of parameters.
+
+        Each parameter method is only applied on the packets having the layer
+        the parameter is read from, the remaining packets get the missing
+        value of the parameter in bulk.
         """
 
-        parameter_vector = {}
-        for key, method in self.parameter_methods:
-            try:
-                parameter_vector[key] = method(packet)
-            except AttributeError:
-                # Raised in case of trying to access fileds the packet does
-                # not have, i.e. TCP fields in UDP packet
-                parameter_vector[key] = None
+        layers = numpy.array([cls.layer_mask(p) for p in packets],
+                             dtype=numpy.int64)
+
+        columns = {}
+        for parameter in cls.plan.parameters:
+            if parameter.layer is None:
+                selected = range(len(packets))
+            else:
+                selected = numpy.flatnonzero(
+                    layers & LAYER_BITS[parameter.layer]).tolist()
+
+            values = [parameter.missing] * len(packets)
+            for index in selected:
+                try:
+                    values[index] = parameter.function(packets[index])
+                except AttributeError:
+                    # Raised in case the layer is present, but the field is
+                    # not, i.e. SSL handshake fields in application data
+                    pass
 
-        return parameter_vector
+            columns[parameter.name] = pandas.Series(values)
+
+        return pandas.DataFrame(columns)
 
     @cached_property
     def forward_packets(self):
@@ -79,6 +132,7 @@ class Flow(SizeFeatures, TimeGapFeatures, TCPFeatures, IPFeatures, SSLFeatures,
         return self.compute_time_shifts(data)
 
     @staticmethod
+    @tshark_field('ip.src', missing='backward')
     def parameter_direction(packet):
         """
         Returns the direction of the packet.
@@ -99,16 +153,10 @@ class Flow(SizeFeatures, TimeGapFeatures, TCPFeatures, IPFeatures, SSLFeatures,
 
     @property
     def features(self):
-        # Dynamically find all features
-        feature_method_names = [k for k in dir(self)
-                                if k.startswith('feature_')]
-
         # Generate a data dict with results of feature methods
         feature_data = {}
-        for method_name in feature_method_names:
-            method = getattr(self, method_name)
-            key = method_name.split('feature_')[1]
-            feature_data[key] = method()
+        for feature in self.plan.features:
+            feature_data[feature.name] = feature.function(self)
 
         return feature_data
 
@@ -0,0 +1,164 @@
+"""
+Dataset file formats. Besides CSV, datasets can be stored in typed columnar
+formats (Arrow IPC, known as Feather, and Parquet) using pyarrow, which is
+only required when these formats are used.
+"""
+
+import csv
+import json
+import os
+
+import pandas
+
+
+# The dataset formats and the extensions of their files
+FORMATS = {
+    'csv': '.csv',
+    'feather': '.feather',
+    'parquet': '.parquet',
+}
+
+# The magic bytes the files of the columnar formats start with
+MAGIC = {
+    b'ARROW1': 'feather',
+    b'PAR1': 'parquet',
+}
+
+COMPRESSION = 'zstd'
+
+# The schema metadata keys are prefixed to avoid clashes with pandas
+METADATA_PREFIX = 'uadt.'
+
+
+def import_pyarrow():
+    """
+    Imports pyarrow, which is needed for the columnar formats only.
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.compute
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("The columnar dataset formats require pyarrow, "
+                           "install it using: pip install pyarrow")
+
+    return pyarrow
+
+
+def detect_format(path):
+    """
+    Detects the format of the dataset file from its first bytes.
+    """
+
+    with open(path, 'rb') as dataset:
+        start = dataset.read(6)
+
+    for magic, name in MAGIC.items():
+        if start.startswith(magic):
+            return name
+
+    return 'csv'
+
+
+def typed_table(table):
+    """
+    Narrows the types of the columns of the table read from CSV. Feature
+    columns holding whole numbers only are stored as integers, the class as
+    a small integer.
+    """
+
+    pa = import_pyarrow()
+
+    for position, field in enumerate(table.schema):
+        column = table.column(position)
+        if field.name == 'class':
+            target = pa.int8()
+        elif (pa.types.is_floating(field.type) and column.null_count == 0
+                and len(column) and pa.compute.all(pa.compute.equal(
+                    column, pa.compute.floor(column))).as_py()):
+            target = pa.int64()
+        else:
+            continue
+
+        table = table.set_column(position, field.name, column.cast(target))
+
+    return table
+
+
+def export_dataset(csv_path, path, format, metadata=None):
+    """
+    Converts the CSV dataset into the given columnar format, storing the
+    given metadata in the schema. The file is written atomically.
+    """
+
+    pa = import_pyarrow()
+
+    # The features are read as floats, as integral columns may contain
+    # missing values, and narrowed afterwards
+    with open(csv_path, 'r') as dataset:
+        names = next(csv.reader(dataset))
+
+    column_types = {name: pa.float64() for name in names}
+    table = pa.csv.read_csv(
+        csv_path,
+        convert_options=pa.csv.ConvertOptions(column_types=column_types),
+    )
+    table = typed_table(table)
+
+    table = table.replace_schema_metadata({
+        (METADATA_PREFIX + key).encode(): json.dumps(value).encode()
+        for key, value in (metadata or {}).items()
+    })
+
+    partial = path + '.part'
+    if format == 'feather':
+        pa.feather.write_feather(table, partial, compression=COMPRESSION)
+    elif format == 'parquet':
+        pa.parquet.write_table(table, partial, compression=COMPRESSION)
+    else:
+        raise ValueError("Unknown dataset format: {0}".format(format))
+
+    os.replace(partial, path)
+
+
+def read_metadata(path):
+    """
+    Returns the metadata stored in the schema of the columnar dataset file.
+    """
+
+    pa = import_pyarrow()
+
+    if detect_format(path) == 'feather':
+        with pa.memory_map(path) as source:
+            schema = pa.ipc.open_file(source).schema
+    else:
+        schema = pa.parquet.read_schema(path)
+
+    return {
+        key.decode()[len(METADATA_PREFIX):]: json.loads(value.decode())
+        for key, value in (schema.metadata or {}).items()
+        if key.decode().startswith(METADATA_PREFIX)
+    }
+
+
+def read_dataset(path):
+    """
+    Reads the dataset file of any of the formats into a data frame. The
+    columnar formats are memory mapped instead of being read and parsed.
+    """
+
+    format = detect_format(path)
+    if format == 'csv':
+        return pandas.read_csv(path)
+
+    pa = import_pyarrow()
+    if format == 'feather':
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    else:
+        table = pa.parquet.read_table(path, memory_map=True)
+
+    return table.to_pandas()
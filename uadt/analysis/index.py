@@ -0,0 +1,187 @@
+"""
+Timestamp index of session capture files, stored next to the capture file
+(like the .marks file) and used to seek to the packets of a time range
+without reading the whole capture.
+"""
+
+import contextlib
+import os
+import tempfile
+import zipfile
+
+import numpy
+
+from uadt.analysis.pcap import CaptureFile, CaptureFormatError
+from uadt.logger import LoggerMixin
+
+
+EXTENSION = '.index'
+VERSION = 1
+
+# One sample is taken every STRIDE packets
+STRIDE = 1024
+
+
+class PacketIndex(LoggerMixin):
+    """
+    A sparse index of a capture file. Every STRIDE-th packet record is
+    sampled as (timestamp, byte offset, packet number), splitting the file
+    into blocks of consecutive records. The minimum and maximum timestamp of
+    each block is stored as well, so that the blocks of a time range can be
+    found by binary search even if the packets are not stored in
+    chronological order.
+    """
+
+    def __init__(self, samples, minimum, maximum, packets, size, mtime):
+        self.samples = samples
+        self.minimum = minimum
+        self.maximum = maximum
+        self.packets = packets
+        self.size = size
+        self.mtime = mtime
+
+        # Monotonic envelopes of the block bounds
+        self.reach = numpy.maximum.accumulate(maximum) if len(maximum) else maximum
+        self.floor = numpy.minimum.accumulate(minimum[::-1])[::-1] if len(minimum) else minimum
+
+    def __len__(self):
+        return self.packets
+
+    @staticmethod
+    def location(path):
+        """
+        Returns the location of the index of the capture file at the given
+        path.
+        """
+
+        return '.'.join(path.split('.')[:-1]) + EXTENSION
+
+    @staticmethod
+    def signature(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def build(cls, path, stride=STRIDE):
+        """
+        Builds the index of the capture file at the given path. Raises
+        CaptureFormatError for capture files whose records cannot be read
+        starting at an arbitrary record.
+        """
+
+        size, mtime = cls.signature(path)
+        capture = CaptureFile.open(path)
+        records = next(capture.chunks())
+        capture.header()
+
+        starts = numpy.arange(0, len(records), stride)
+        samples = numpy.column_stack([
+            records[starts, 4], records[starts, 0], starts
+        ]).astype(numpy.int64).reshape(-1, 3)
+
+        if len(records):
+            minimum = numpy.minimum.reduceat(records[:, 4], starts)
+            maximum = numpy.maximum.reduceat(records[:, 4], starts)
+        else:
+            minimum = maximum = numpy.zeros(0, dtype=numpy.int64)
+
+        return cls(samples, minimum, maximum, len(records), size, mtime)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads the index of the capture file at the given path. Returns None if
+        the index does not exist or is out of date.
+        """
+
+        try:
+            with numpy.load(cls.location(path), allow_pickle=False) as stored:
+                version, packets, size, mtime = stored['meta'].tolist()
+                index = cls(stored['samples'], stored['minimum'],
+                            stored['maximum'], packets, size, mtime)
+        except (IOError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+        if version != VERSION or (size, mtime) != cls.signature(path):
+            return None
+
+        return index
+
+    def save(self, path):
+        """
+        Stores the index next to the capture file at the given path.
+        """
+
+        location = self.location(path)
+        directory = os.path.dirname(os.path.abspath(location))
+
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as target:
+                numpy.savez(
+                    target,
+                    meta=numpy.array([VERSION, self.packets, self.size, self.mtime]),
+                    samples=self.samples,
+                    minimum=self.minimum,
+                    maximum=self.maximum,
+                )
+            os.replace(temporary, location)
+        except Exception:
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+            raise
+
+    @classmethod
+    def for_path(cls, path):
+        """
+        Returns the index of the capture file at the given path, building and
+        storing it on first use. Returns None if the capture file cannot be
+        indexed.
+        """
+
+        index = cls.load(path)
+        if index is not None:
+            return index
+
+        try:
+            index = cls.build(path)
+        except (CaptureFormatError, OSError) as exc:
+            cls.warning("Unable to index '{0}': {1}".format(path, exc))
+            return None
+
+        try:
+            index.save(path)
+        except OSError as exc:
+            cls.warning("Unable to store index of '{0}': {1}".format(path, exc))
+
+        return index
+
+    def byte_range(self, start_ns, end_ns):
+        """
+        Returns the (start, stop) byte offsets of the blocks which may contain
+        packets with timestamps in the given inclusive range. The stop offset
+        is None for the end of file. Returns None if no block does.
+        """
+
+        first = numpy.searchsorted(self.reach, start_ns, 'left')
+        last = numpy.searchsorted(self.floor, end_ns, 'right') - 1
+
+        if first >= len(self.samples) or last < first:
+            return None
+
+        stop = self.samples[last + 1, 1] if last + 1 < len(self.samples) else None
+        return int(self.samples[first, 1]), (None if stop is None else int(stop))
+
+    def select(self, capture, start_ns, end_ns):
+        """
+        Returns the array of packet records of the capture file with
+        timestamps in the given inclusive range, in file order.
+        """
+
+        bounds = self.byte_range(start_ns, end_ns)
+        if bounds is None:
+            return numpy.zeros((0, 6), dtype=numpy.int64)
+
+        records = next(capture.chunks(None, *bounds))
+        timestamps = records[:, 4]
+        return records[(timestamps >= start_ns) & (timestamps <= end_ns)]
@@ -0,0 +1,108 @@
+"""
+Journal of the dataset rows produced so far by an unfinished dataset build,
+allowing interrupted builds to be resumed.
+"""
+
+import csv
+import io
+import math
+import os
+
+import numpy
+
+from uadt.logger import LoggerMixin
+
+
+EXTENSION = '.journal'
+
+
+def format_value(value):
+    """
+    Formats a feature value the way pandas writes it into a CSV file, but
+    independently of the other values in the column.
+    """
+
+    if value is None:
+        return ''
+    if isinstance(value, (float, numpy.floating)):
+        return '' if math.isnan(value) else repr(float(value))
+    if isinstance(value, (numpy.integer, numpy.bool_)):
+        return str(value.item())
+    return str(value)
+
+
+def format_lines(lines):
+    """
+    Returns the CSV lines of the given lists of values, as bytes.
+    """
+
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator='\n')
+    writer.writerows(lines)
+    return text.getvalue().encode('utf-8')
+
+
+def format_header(columns):
+    return format_lines([columns])
+
+
+def format_rows(rows, columns):
+    """
+    Returns the CSV lines of the given feature dictionaries, as bytes.
+    """
+
+    return format_lines(
+        [format_value(row.get(column)) for column in columns] for row in rows
+    )
+
+
+class DatasetJournal(LoggerMixin):
+    """
+    An append-only file holding the CSV rows of the processed files, in the
+    order the files were processed. The rows of each file occupy a
+    contiguous byte range, recorded in the manifest. Only the part of the
+    journal up to the last checkpoint is considered valid.
+    """
+
+    def __init__(self, output):
+        self.path = output + EXTENSION
+        self.file = open(self.path, 'ab')
+
+    @property
+    def size(self):
+        return self.file.tell()
+
+    def truncate(self, size):
+        """
+        Drops the rows written after the given checkpointed size.
+        """
+
+        if self.size > size:
+            self.info("Dropping {0} bytes of '{1}' written after the last "
+                      "checkpoint".format(self.size - size, self.path))
+            self.file.truncate(size)
+            self.file.seek(size)
+
+    def append(self, data):
+        """
+        Appends the formatted rows of one file. Returns their offset and
+        length.
+        """
+
+        offset = self.size
+        self.file.write(data)
+        return offset, len(data)
+
+    def checkpoint(self):
+        """
+        Makes sure the rows written so far are stored on the disk. Returns the
+        size of the journal.
+        """
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.size
+
+    def remove(self):
+        self.file.close()
+        os.remove(self.path)
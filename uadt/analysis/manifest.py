@@ -0,0 +1,201 @@
+"""
+Manifest of the capture files a dataset was built from, stored next to the
+dataset, so that rebuilding the dataset only processes new or changed files.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import tempfile
+
+from uadt.analysis.cache import PacketCache
+from uadt.analysis.segments import SegmentContainer
+from uadt.logger import LoggerMixin
+
+
+EXTENSION = '.manifest'
+VERSION = 2
+
+
+class DatasetManifest(LoggerMixin):
+    """
+    Maps each capture file of the dataset to its signature - the size and
+    modification time of the file (the length and offset of segments stored
+    in segment containers), and its content hash once it changed - and to the
+    byte range of the rows it produced, either in the dataset or in the
+    journal of an unfinished build. The manifest is tied to the version of
+    the feature set, so the whole dataset is rebuilt whenever the features
+    change, to the signature of the dataset file and to the size of the
+    journal at the last checkpoint.
+    """
+
+    def __init__(self, path, version, entries=None, dataset=None, journal=0,
+                 rate=None, largest=None):
+        self.path = path
+        self.version = version
+        self.entries = entries or collections.OrderedDict()
+        self.dataset = dataset
+        self.journal = journal
+
+        # The processing rate (bytes per second of one worker) measured in
+        # the last build, and the cost of the largest file it was measured on
+        self.rate = rate
+        self.largest = largest
+
+    @staticmethod
+    def location(output):
+        """
+        Returns the location of the manifest of the given dataset file.
+        """
+
+        return output + EXTENSION
+
+    @classmethod
+    def load(cls, output, version):
+        """
+        Loads the manifest of the given dataset file. Returns an empty
+        manifest if there is none, or if it was built by a different version
+        of the feature set.
+        """
+
+        path = cls.location(output)
+        try:
+            with open(path, 'r') as manifest_file:
+                stored = json.load(manifest_file)
+        except (IOError, ValueError):
+            return cls(path, version)
+
+        if stored.get('format') != VERSION or stored.get('version') != version:
+            cls.info("Manifest '{0}' is out of date".format(path))
+            return cls(path, version)
+
+        entries = collections.OrderedDict(
+            (entry['path'], entry) for entry in stored['entries']
+        )
+        return cls(path, version, entries, stored.get('dataset'),
+                   stored.get('journal', 0), stored.get('rate'),
+                   stored.get('largest'))
+
+    def save(self):
+        """
+        Stores the manifest atomically.
+        """
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as target:
+                json.dump({
+                    'format': VERSION,
+                    'version': self.version,
+                    'dataset': self.dataset,
+                    'journal': self.journal,
+                    'rate': self.rate,
+                    'largest': self.largest,
+                    'entries': list(self.entries.values()),
+                }, target, indent=1)
+            os.replace(temporary, self.path)
+        except Exception:
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+            raise
+
+    @staticmethod
+    def signature(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    @classmethod
+    def signatures(cls, paths):
+        """
+        Returns the (size, mtime) signatures of the given capture files. The
+        segments of segment containers are identified by their length and
+        offset instead, as the container changes whenever segments are
+        appended.
+        """
+
+        signatures = {}
+        containers = collections.defaultdict(list)
+
+        for path in paths:
+            located = SegmentContainer.locate(path)
+            if located is not None:
+                containers[located[0]].append((path, located[1]))
+                continue
+
+            signatures[path] = cls.signature(path)
+
+        for container_path, members in containers.items():
+            with SegmentContainer(container_path) as container:
+                for path, name in members:
+                    segment = container.segments[name]
+                    signatures[path] = [segment.length, segment.offset]
+
+        return signatures
+
+    def changed(self, path, signature):
+        """
+        Determines whether the capture file changed since it was processed.
+        Files with a different signature are compared by their content hash,
+        so that files which were only touched or copied are not processed
+        again.
+        """
+
+        entry = self.entries.get(path)
+        if entry is None:
+            return True
+
+        if entry['signature'] == signature:
+            return False
+
+        if entry.get('hash') and entry['hash'] == PacketCache.content_hash(path):
+            entry['signature'] = signature
+            return False
+
+        return True
+
+    def update(self, path, signature, rows, offset, length, previous=None):
+        """
+        Records the byte range of the rows the capture file produced in the
+        journal. The content hash is computed only for files whose signature
+        differs from their previous entry, to avoid reading every file on
+        the first build.
+        """
+
+        content_hash = previous.get('hash') if previous is not None else None
+        if previous is not None and previous['signature'] != signature:
+            content_hash = PacketCache.content_hash(path)
+
+        self.entries[path] = {
+            'path': path,
+            'signature': signature,
+            'hash': content_hash,
+            'rows': rows,
+            'journal': True,
+            'offset': offset,
+            'length': length,
+        }
+
+    def validate(self, output, journal_size):
+        """
+        Drops the entries whose rows are no longer available - the rows in a
+        dataset that changed since it was built, or the rows in a journal
+        that is shorter than at the last checkpoint.
+        """
+
+        dataset_valid = (
+            os.path.exists(output) and self.dataset == self.signature(output)
+        )
+        journal_valid = journal_size >= self.journal
+
+        if not dataset_valid and any(not e['journal'] for e in self.entries.values()):
+            self.warning("Dataset '{0}' does not match its manifest".format(output))
+        if not journal_valid:
+            self.warning("Journal of '{0}' is incomplete".format(output))
+            self.journal = 0
+
+        self.entries = collections.OrderedDict(
+            (path, entry) for path, entry in self.entries.items()
+            if (journal_valid if entry['journal'] else dataset_valid)
+        )
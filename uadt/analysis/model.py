@@ -1,22 +1,223 @@
 #!/usr/bin/python3
 
 import abc
+import functools
 import joblib
-import pandas
+import math
 import numpy
 import itertools
+import time
+from joblib import Parallel, delayed
 from matplotlib import pyplot as plt
 from sklearn import model_selection, preprocessing
 from sklearn import metrics
 
 from uadt import config
 from uadt import constants
+from uadt.analysis.formats import read_dataset
+from uadt.analysis.shared import SharedArrays, attach
+
+
+# The number of folds of the cross validation of the candidates
+FOLDS = 5
+
+# Successive halving keeps the best 1/HALVING_RATE of the candidates at each
+# rung, evaluated on a HALVING_RATE times larger budget
+HALVING_RATE = 3
+
+# Candidates are never evaluated on fewer training samples than this
+MINIMUM_SAMPLES = 100
+
+SEARCH_METHODS = ('grid', 'halving', 'hyperband')
+
+
+def cross_validate(classifier_cls, X, y, hyperparameters, samples=None,
+                   folds=FOLDS):
+    """
+    Performs a 5-Fold cross validation of the classifier with the given
+    hyperparameters. Optionally, only the given number of samples and the
+    first given number of the folds are used.
+    """
+
+    fold_success_rates = []
+    five_fold = model_selection.KFold(n_splits=FOLDS)
+
+    X = X[:samples]
+    y = y[:samples]
+    splits = itertools.islice(five_fold.split(X, y), folds)
+
+    for fold_train, fold_test in splits:
+        X_train = X[fold_train]
+        X_test  = X[fold_test]
+        y_train = y[fold_train]
+        y_test  = y[fold_test]
+
+        fold_classifier = classifier_cls(**hyperparameters)
+        model = fold_classifier.fit(X_train, y_train)
+        rate = model.score(X_test, y_test)
+
+        fold_success_rates.append(rate)
+
+    return numpy.average(fold_success_rates)
+
+
+def cross_validate_shared(classifier_cls, handle, hyperparameters,
+                          samples=None, folds=FOLDS):
+    """
+    Cross validates the classifier on the training set shared under the
+    given handle. Runs in the workers, which receive only the handle.
+    """
+
+    X, y = attach(handle)
+    return cross_validate(classifier_cls, X, y, hyperparameters, samples, folds)
+
+
+class HyperparameterSearch(object):
+    """
+    Searches the space of hyperparameters for the candidate with the best
+    cross validated success rate. The grid search evaluates each candidate
+    on the whole training set. Successive halving evaluates the candidates
+    on a small budget - a subset of the folds and of the training samples -
+    first, and only the best of them on larger budgets. Hyperband runs
+    successive halving in several brackets, from many candidates on a small
+    initial budget to a few candidates on the full budget.
+
+    The evaluate callback is called with the list of candidates, the number
+    of training samples and the number of folds, and returns their success
+    rates. Models evaluating each candidate on a fixed number of folds
+    regardless of the budget (such as out-of-bag scoring) give it as folds.
+    """
+
+    def __init__(self, space, evaluate, samples, rate=HALVING_RATE, seed=None,
+                 folds=None):
+        self.space = space
+        self.evaluate = evaluate
+        self.samples = samples
+        self.rate = rate
+        self.random = numpy.random.RandomState(seed)
+        self.folds = folds
+
+        # The number of fitted folds and their cost, relative to a fold of
+        # the whole training set
+        self.evaluations = 0
+        self.cost = 0.0
+
+    def candidates(self):
+        """
+        Returns all the combinations of the hyperparameters.
+        """
+
+        names = list(self.space)
+        return [
+            dict(zip(names, values))
+            for values in itertools.product(*(self.space[name] for name in names))
+        ]
+
+    def budget(self, fraction):
+        """
+        Returns the number of samples and folds of the given fraction of the
+        full budget.
+        """
+
+        samples = max(min(MINIMUM_SAMPLES, self.samples),
+                      int(round(self.samples * fraction)))
+        folds = self.folds or max(1, int(math.ceil(FOLDS * fraction)))
+        return samples, folds
+
+    def run(self, candidates, fraction):
+        """
+        Evaluates the candidates on the given fraction of the full budget.
+        Returns the (rate, candidate) pairs, best first.
+        """
+
+        samples, folds = self.budget(fraction)
+        rates = self.evaluate(candidates, samples, folds)
+
+        self.evaluations += len(candidates) * folds
+        self.cost += len(candidates) * folds * samples / self.samples
+
+        # The order of the candidates breaks the ties, as in the grid search
+        order = sorted(range(len(candidates)), key=lambda i: -rates[i])
+        return [(rates[i], candidates[i]) for i in order]
+
+    def rungs(self, count):
+        """
+        Returns the number of rungs needed to narrow the given number of
+        candidates down to a few, limited by the minimal number of samples.
+        """
+
+        rungs = 1
+        while (self.rate ** rungs < count
+               and self.samples / self.rate ** rungs >= MINIMUM_SAMPLES):
+            rungs += 1
+        return rungs
+
+    def grid(self):
+        return self.run(self.candidates(), 1.0)[0]
+
+    def halving(self, candidates=None, rungs=None):
+        """
+        Evaluates the candidates on increasing budgets, keeping the best
+        part of them for the next rung. The last rung uses the full budget.
+        """
+
+        candidates = candidates or self.candidates()
+        rungs = rungs or self.rungs(len(candidates))
+
+        for rung in range(rungs):
+            ranked = self.run(candidates, float(self.rate) ** (rung + 1 - rungs))
+            keep = int(math.ceil(len(candidates) / float(self.rate)))
+            candidates = [candidate for _, candidate in ranked[:keep]]
+
+        return ranked[0]
+
+    def hyperband(self):
+        """
+        Runs successive halving in brackets of decreasing aggressiveness,
+        each on a random sample of the candidates.
+        """
+
+        candidates = self.candidates()
+        brackets = self.rungs(len(candidates))
+        best = None
+
+        for bracket in reversed(range(brackets)):
+            count = int(math.ceil(float(brackets) / (bracket + 1)
+                                  * self.rate ** bracket))
+            count = min(len(candidates), count)
+            chosen = sorted(self.random.choice(len(candidates), count, replace=False))
+
+            result = self.halving([candidates[i] for i in chosen], bracket + 1)
+            if best is None or result[0] > best[0]:
+                best = result
+
+        return best
+
+    def report(self, elapsed):
+        """
+        Reports the cost of the search compared to the full grid search.
+        """
+
+        grid = len(self.candidates()) * (self.folds or FOLDS)
+        print("Search took {0:.1f} s and {1} fold evaluations, instead of {2} "
+              "evaluations of the full grid ({3:.1%} of its cost, estimated "
+              "{4:.1f} s)".format(elapsed, self.evaluations, grid,
+                                  self.cost / grid,
+                                  elapsed * grid / self.cost if self.cost else 0))
+
 
 class Model(object):
 
     scale_data = False
     classifier_cls = None
 
+    # The candidate values of the hyperparameters searched for by
+    # optimize_paramters
+    search_space = {}
+
+    # The fixed number of folds each candidate is evaluated on, if any
+    search_folds = None
+
     def __init__(self, path, train_size, hyperparameters=None):
         """
         Initialize model giving it the dataset at path to crunch.
@@ -32,13 +233,14 @@ class Model(object):
         """
         Reads, randomizes data from the given dataset and splits it into test
         and training sets. Test data set is not used during training or
-        parameter optimization.
+        parameter optimization. The format of the dataset (CSV or a columnar
+        format) is detected automatically.
         """
 
-        data = pandas.read_csv(self.path).fillna(0)
+        data = read_dataset(self.path).fillna(0)
         print("The size of data {0}".format(data.shape))
 
-        X = data.drop('class', 1)
+        X = data.drop('class', axis=1)
         y = data['class']
 
         # Remember the columns for later usage
@@ -46,8 +248,8 @@ class Model(object):
 
         # Convert to numpy arrays and scale inputs
         splitted = model_selection.train_test_split(
-                X.as_matrix(),
-                y.as_matrix(),
+                X.values,
+                y.values,
                 train_size=self.train_size
         )
 
@@ -81,23 +283,72 @@ class Model(object):
         training set.
         """
 
-        fold_success_rates = []
-        five_fold = model_selection.KFold(n_splits=5)
+        success_rate = cross_validate(self.classifier_cls, self.X_train,
+                                      self.y_train, hyperparameters)
+        return (success_rate, hyperparameters)
+
+    @staticmethod
+    def group_key(candidate, name):
+        """
+        Returns the hyperparameters of the candidate other than the given
+        one, as a hashable key.
+        """
+
+        return tuple(sorted(
+            (other, value) for other, value in candidate.items()
+            if other != name
+        ))
 
-        for fold_train, fold_test in five_fold.split(self.X_train, self.y_train):
-            X_train = self.X_train[fold_train]
-            X_test  = self.X_train[fold_test]
-            y_train = self.y_train[fold_train]
-            y_test  = self.y_train[fold_test]
+    @staticmethod
+    def group_candidates(candidates, name):
+        """
+        Groups the candidates differing only in the value of the given
+        hyperparameter. Returns the values of the hyperparameter in each
+        group, by the group keys.
+        """
 
-            fold_classifier = self.classifier_cls(**hyperparameters)
-            model = fold_classifier.fit(X_train, y_train)
-            rate = model.score(X_test, y_test)
+        groups = {}
+        for candidate in candidates:
+            key = Model.group_key(candidate, name)
+            groups.setdefault(key, set()).add(candidate[name])
+        return groups
 
-            fold_success_rates.append(rate)
+    def test_candidates(self, handle, candidates, samples=None, folds=FOLDS):
+        """
+        Cross validates the candidate hyperparameters in parallel, on the
+        training set shared under the given handle.
+        """
 
-        success_rate = numpy.average(fold_success_rates)
-        return (success_rate, hyperparameters)
+        return Parallel(n_jobs=config.NUM_JOBS)(
+            delayed(cross_validate_shared)(
+                self.classifier_cls, handle, candidate, samples, folds)
+            for candidate in candidates
+        )
+
+    def optimize_paramters(self, method='grid'):
+        """
+        Searches the hyperparameters declared in the search space for the
+        best ones, using the given search method (see SEARCH_METHODS). The
+        training set is shared with the workers instead of being sent with
+        each candidate.
+        """
+
+        if method not in SEARCH_METHODS:
+            raise ValueError("Unknown search method: {0}".format(method))
+
+        with SharedArrays(self.X_train, self.y_train) as shared:
+            search = HyperparameterSearch(
+                self.search_space,
+                functools.partial(self.test_candidates, shared.handle),
+                len(self.X_train),
+                folds=self.search_folds
+            )
+
+            start = time.perf_counter()
+            rate, self.hyperparameters = getattr(search, method)()
+            search.report(time.perf_counter() - start)
+
+        print("Best cross validated success rate: {0}".format(rate))
 
     def plot_confusion_matrix(self, normalize=False):
         """
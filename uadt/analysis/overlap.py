@@ -0,0 +1,108 @@
+"""
+Interval overlap engine assigning intervals to the events they overlap the
+most.
+"""
+
+import bisect
+
+
+class PrefixMaximum(object):
+    """
+    A Fenwick tree maintaining maxima of keys inserted at positions
+    0..size-1, answering the maximum over the positions below a bound.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [None] * (size + 1)
+
+    def insert(self, position, key):
+        position += 1
+        while position <= self.size:
+            if self.tree[position] is None or key > self.tree[position]:
+                self.tree[position] = key
+            position += position & -position
+
+    def maximum(self, bound):
+        """
+        Returns the maximal key at positions below the bound, or None.
+        """
+
+        best = None
+        while bound > 0:
+            key = self.tree[bound]
+            if key is not None and (best is None or key > best):
+                best = key
+            bound -= bound & -bound
+        return best
+
+
+def assign_events(events, intervals):
+    """
+    Returns for each of the (start, end) intervals the index of the event
+    with the biggest overlap, min(event end, end) - max(event start, start).
+    The overlap is negative for disjoint events, so the nearest event is
+    chosen if there is no overlapping one. Ties are resolved in favour of
+    the first event, as max() over the events would.
+
+    Each event falls into one of four cases relative to the interval,
+    depending on whether it starts before (or at) the start of the interval
+    and whether it ends after (or at) its end. The best event of each case
+    is found by a sweep over the starts combined with a Fenwick tree over
+    the ends, so the assignment takes O((n + m) log m) time for n intervals
+    and m events.
+    """
+
+    if not events:
+        raise ValueError("No events to assign the intervals to")
+
+    ends = sorted(set(end for _, end in events))
+    end_position = [bisect.bisect_left(ends, end) for _, end in events]
+    size = len(ends)
+
+    by_start = sorted(range(len(events)), key=lambda i: events[i][0])
+    queries = sorted(range(len(intervals)), key=lambda q: intervals[q][0])
+    candidates = [[] for _ in intervals]
+
+    # Events starting before or at the start of the interval
+    containing = PrefixMaximum(size)   # ending after, over reversed ends
+    preceding = PrefixMaximum(size)    # ending before
+    inserted = 0
+    for query in queries:
+        start, end = intervals[query]
+        while inserted < len(by_start) and events[by_start[inserted]][0] <= start:
+            index = by_start[inserted]
+            containing.insert(size - 1 - end_position[index], -index)
+            preceding.insert(end_position[index], (events[index][1], -index))
+            inserted += 1
+
+        bound = bisect.bisect_left(ends, end)
+        key = containing.maximum(size - bound)
+        if key is not None:
+            candidates[query].append((end - start, key))
+        key = preceding.maximum(bound)
+        if key is not None:
+            candidates[query].append((key[0] - start, key[1]))
+
+    # Events starting after the start of the interval
+    following = PrefixMaximum(size)    # ending after, over reversed ends
+    contained = PrefixMaximum(size)    # ending before
+    inserted = len(by_start) - 1
+    for query in reversed(queries):
+        start, end = intervals[query]
+        while inserted >= 0 and events[by_start[inserted]][0] > start:
+            index = by_start[inserted]
+            event_start, event_end = events[index]
+            following.insert(size - 1 - end_position[index], (-event_start, -index))
+            contained.insert(end_position[index], (event_end - event_start, -index))
+            inserted -= 1
+
+        bound = bisect.bisect_left(ends, end)
+        key = following.maximum(size - bound)
+        if key is not None:
+            candidates[query].append((end + key[0], key[1]))
+        key = contained.maximum(bound)
+        if key is not None:
+            candidates[query].append(key)
+
+    return [-max(options)[1] for options in candidates]
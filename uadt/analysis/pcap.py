@@ -0,0 +1,870 @@
+"""
+Native reader of libpcap and pcapng capture files. The file is memory mapped
+and the link, network and transport layer headers are decoded directly into
+numpy columns, named after the tshark fields they correspond to.
+"""
+
+import collections
+import mmap
+import socket
+import struct
+
+import numpy
+
+from uadt.analysis.segments import read_buffer
+
+
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1000),
+    b'\xa1\xb2\xc3\xd4': ('>', 1000),
+    b'\x4d\x3c\xb2\xa1': ('<', 1),
+    b'\xa1\xb2\x3c\x4d': ('>', 1),
+}
+
+PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+PCAPNG_INTERFACE_DESCRIPTION = 0x00000001
+PCAPNG_ENHANCED_PACKET = 0x00000006
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = (12, 14, 101, 228, 229)
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8, 0x9100)
+
+PROTOCOL_TCP = 6
+PROTOCOL_UDP = 17
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT_HEADER = 44
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+
+DNS_PORT = 53
+
+# Protocol layers tracked in the layer-presence bitmask, named as in tshark
+LAYERS = ('arp', 'ip', 'ipv6', 'tcp', 'udp', 'ssl', 'dns')
+LAYER_BITS = {name: 1 << index for index, name in enumerate(LAYERS)}
+
+ETHERTYPE_ARP = 0x0806
+TLS_CONTENT_TYPES = (20, 21, 22, 23)
+
+# The order of the columns in the record arrays produced by CaptureFile
+Record = collections.namedtuple('Record', [
+    'offset', 'length', 'data_offset', 'captured_length', 'timestamp_ns',
+    'linktype'
+])
+
+INTEGER_FIELDS = (
+    'frame.cap_len', 'ip.ttl', 'tcp.window_size',
+    'tcp.window_size_scalefactor', 'ssl.handshake.session_id_length',
+    'ssl.handshake.comp_methods_length', 'ssl.handshake.extensions_length',
+    'dns.qry.type',
+)
+
+FIELDS = INTEGER_FIELDS + ('frame.time_epoch', 'ip.src')
+
+
+class CaptureFormatError(ValueError):
+    """
+    Raised when the capture file is not in a format the reader understands.
+    """
+    pass
+
+
+class CaptureFile(object):
+    """
+    Represents a libpcap or pcapng capture file held in a (memory mapped)
+    buffer.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.array = numpy.frombuffer(buffer, dtype=numpy.uint8)
+
+        magic = bytes(buffer[:4])
+        if magic in PCAP_MAGIC:
+            self.format = 'pcap'
+            self.endian, self.fraction_ns = PCAP_MAGIC[magic]
+            if len(buffer) < 24:
+                raise CaptureFormatError("Truncated pcap file header")
+            self.linktype = struct.unpack_from(self.endian + 'I', buffer, 20)[0]
+            self.header_length = 24
+        elif len(buffer) >= 12 and struct.unpack_from('<I', buffer, 0)[0] == PCAPNG_SECTION_HEADER:
+            self.format = 'pcapng'
+            self.header_length = None
+            self.late_headers = False
+        else:
+            raise CaptureFormatError("Unknown capture file format")
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory maps the capture file at the given path, which can also be a
+        virtual path of a segment stored in a segment container.
+        """
+
+        return cls(read_buffer(path))
+
+    def records(self, start=None, stop=None):
+        """
+        Iterates over the packet records of the capture file. If given, the
+        iteration starts at the record at the 'start' offset and stops before
+        the 'stop' offset.
+        """
+
+        if self.format == 'pcap':
+            return self._pcap_records(start, stop)
+        else:
+            return self._pcapng_records(start, stop)
+
+    def _pcap_records(self, start, stop):
+        unpack = struct.Struct(self.endian + 'IIII').unpack_from
+        size = len(self.buffer) if stop is None else min(stop, len(self.buffer))
+        offset = max(self.header_length, start or 0)
+
+        while offset + 16 <= size:
+            seconds, fraction, captured, _ = unpack(self.buffer, offset)
+            if offset + 16 + captured > size:
+                break
+
+            yield Record(
+                offset, 16 + captured, offset + 16, captured,
+                seconds * 1000000000 + fraction * self.fraction_ns,
+                self.linktype
+            )
+            offset += 16 + captured
+
+    def _pcapng_records(self, start, stop):
+        size = len(self.buffer) if stop is None else min(stop, len(self.buffer))
+        offset = 0
+        endian = '<'
+        interfaces = []
+
+        while offset + 12 <= size:
+            block_type, block_length = struct.unpack_from(
+                endian + 'II', self.buffer, offset)
+
+            if block_type == PCAPNG_SECTION_HEADER:
+                order = bytes(self.buffer[offset + 8:offset + 12])
+                endian = '<' if order == b'\x4d\x3c\x2b\x1a' else '>'
+                block_length = struct.unpack_from(
+                    endian + 'I', self.buffer, offset + 4)[0]
+                interfaces = []
+
+            if block_length < 12 or offset + block_length > size:
+                break
+
+            if block_type in (PCAPNG_SECTION_HEADER, PCAPNG_INTERFACE_DESCRIPTION) \
+                    and self.header_length is not None:
+                self.late_headers = True
+
+            if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+                interfaces.append(
+                    self._pcapng_interface(endian, offset, block_length))
+            elif block_type == PCAPNG_ENHANCED_PACKET:
+                if self.header_length is None:
+                    self.header_length = offset
+
+                # The interfaces are described, skip to the requested record
+                if start is not None and offset < start:
+                    offset = start
+                    continue
+
+                interface, high, low, captured, _ = struct.unpack_from(
+                    endian + 'IIIII', self.buffer, offset + 8)
+                linktype, resolution = interfaces[interface]
+                ticks = (high << 32) | low
+
+                yield Record(
+                    offset, block_length, offset + 28, captured,
+                    resolution(ticks), linktype
+                )
+
+            offset += block_length
+
+    def _pcapng_interface(self, endian, offset, block_length):
+        """
+        Returns the link type and the timestamp conversion function of the
+        interface description block at the given offset.
+        """
+
+        linktype = struct.unpack_from(endian + 'H', self.buffer, offset + 8)[0]
+        exponent, binary = 6, False
+
+        # Look for the if_tsresol option
+        position = offset + 16
+        end = offset + block_length - 4
+        while position + 4 <= end:
+            code, length = struct.unpack_from(endian + 'HH', self.buffer, position)
+            if code == 0:
+                break
+            if code == 9 and length == 1:
+                value = self.buffer[position + 4]
+                exponent, binary = value & 0x7F, bool(value & 0x80)
+            position += 4 + (length + 3) // 4 * 4
+
+        if binary:
+            return linktype, lambda ticks: (ticks * 1000000000) >> exponent
+        elif exponent <= 9:
+            factor = 10 ** (9 - exponent)
+            return linktype, lambda ticks: ticks * factor
+        else:
+            divisor = 10 ** (exponent - 9)
+            return linktype, lambda ticks: ticks // divisor
+
+    def chunks(self, size=None, start=None, stop=None):
+        """
+        Iterates over the packet records in arrays of at most 'size' records.
+        Each array has one row per record and one column per Record field.
+        """
+
+        chunk = []
+        for record in self.records(start, stop):
+            chunk.append(record)
+            if size and len(chunk) >= size:
+                yield numpy.array(chunk, dtype=numpy.int64)
+                chunk = []
+
+        if chunk or size is None:
+            yield numpy.array(chunk, dtype=numpy.int64).reshape(-1, len(Record._fields))
+
+    def header(self):
+        """
+        Returns the bytes preceding the first packet record, i.e. the pcap
+        file header or the pcapng section header and interface description
+        blocks. Packet records copied verbatim after the header form a valid
+        capture file. Interfaces described after the first packet are only
+        detected if the records were read before.
+        """
+
+        if self.format == 'pcapng' and self.late_headers:
+            raise CaptureFormatError("Interfaces or sections described after "
+                                     "the first packet are not supported")
+
+        # The header ends at the first packet record
+        if self.header_length is None:
+            next(self.records(), None)
+
+        length = self.header_length
+        if length is None:
+            length = len(self.buffer)
+
+        return bytes(self.buffer[:length])
+
+    def copy_records(self, records, target):
+        """
+        Writes the given packet records verbatim into the target file object.
+        Records adjacent in the capture file are copied at once.
+        """
+
+        if not len(records):
+            return
+
+        starts = records[:, 0]
+        ends = starts + records[:, 1]
+        breaks = numpy.flatnonzero(starts[1:] != ends[:-1]) + 1
+
+        view = memoryview(self.buffer)
+        for start, end in zip(starts[numpy.r_[0, breaks]],
+                              ends[numpy.r_[breaks - 1, len(ends) - 1]]):
+            target.write(view[start:end])
+
+    def read_columns(self):
+        """
+        Decodes all the packets of the capture file into columns.
+        """
+
+        return self.decode(next(self.chunks()))
+
+    def stream_columns(self, size):
+        """
+        Decodes the packets of the capture file in chunks of at most 'size'
+        packets, yielding a dictionary of columns for each chunk. Pages of
+        the mapping which were already decoded are released, so that the
+        memory used does not grow with the size of the file.
+        """
+
+        tracker = TCPWindowTracker()
+        for records in self.chunks(size):
+            columns = self.decode(records, tracker)
+            if len(records):
+                self.release(int(records[-1, 0]))
+            yield columns
+
+    def release(self, offset):
+        """
+        Drops the mapped pages preceding the given offset from memory. They
+        are read from the file again if accessed later.
+        """
+
+        if not hasattr(self.buffer, 'madvise') or not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+
+        offset -= offset % mmap.PAGESIZE
+        if offset > 0:
+            self.buffer.madvise(mmap.MADV_DONTNEED, 0, offset)
+
+    def decode(self, records, tracker=None):
+        """
+        Decodes the given record array into a dictionary of numpy columns.
+        The TCP window tracker carries the window scaling state between
+        consecutive calls.
+        """
+
+        return PacketDecoder(self.array, records, tracker or TCPWindowTracker()).columns
+
+
+class PacketDecoder(object):
+    """
+    Decodes the protocol headers of a batch of packet records held in one
+    buffer. The header fields are gathered for all the packets of each layer
+    at once, the variable-length TCP options, DNS names and TLS records are
+    walked for all the packets together, one element per step.
+    """
+
+    def __init__(self, array, records, tracker):
+        self.array = array
+        self.count = len(records)
+        self.tracker = tracker
+
+        self.start = records[:, 2]
+        self.end = records[:, 2] + records[:, 3]
+        self.linktype = records[:, 5]
+
+        self.columns = {
+            'frame.cap_len': records[:, 3].astype(numpy.float64),
+            'frame.time_ns': records[:, 4].copy(),
+            'frame.time_epoch': numpy.array(
+                [ns / 1000000000 for ns in records[:, 4].tolist()],
+                dtype=numpy.float64
+            ),
+        }
+
+        self.layers = numpy.zeros(self.count, dtype=numpy.int64)
+
+        self.decode_link()
+        self.decode_network()
+        self.decode_transport()
+        self.decode_application()
+
+        self.columns['layers'] = self.layers
+
+    # Low level helpers gathering big-endian values at given positions
+    def u8(self, positions):
+        return self.array[positions].astype(numpy.int64)
+
+    def u16(self, positions):
+        return (self.u8(positions) << 8) | self.u8(positions + 1)
+
+    def u32(self, positions):
+        return (self.u16(positions) << 16) | self.u16(positions + 2)
+
+    def bytes_at(self, positions, width):
+        return self.array[positions[:, None] + numpy.arange(width)]
+
+    def missing(self):
+        return numpy.full(self.count, numpy.nan)
+
+    def decode_link(self):
+        """
+        Determines the ethertype and offset of the network layer header.
+        """
+
+        self.ethertype = numpy.zeros(self.count, dtype=numpy.int64)
+        self.l3 = numpy.zeros(self.count, dtype=numpy.int64)
+
+        ethernet = (self.linktype == LINKTYPE_ETHERNET) & (self.start + 14 <= self.end)
+        self.ethertype[ethernet] = self.u16(self.start[ethernet] + 12)
+        self.l3[ethernet] = self.start[ethernet] + 14
+
+        # Strip up to two VLAN tags
+        for _ in range(2):
+            vlan = (ethernet & numpy.isin(self.ethertype, ETHERTYPE_VLAN)
+                    & (self.l3 + 4 <= self.end))
+            self.ethertype[vlan] = self.u16(self.l3[vlan] + 2)
+            self.l3[vlan] += 4
+
+        sll = (self.linktype == LINKTYPE_LINUX_SLL) & (self.start + 16 <= self.end)
+        self.ethertype[sll] = self.u16(self.start[sll] + 14)
+        self.l3[sll] = self.start[sll] + 16
+
+        sll2 = (self.linktype == LINKTYPE_LINUX_SLL2) & (self.start + 20 <= self.end)
+        self.ethertype[sll2] = self.u16(self.start[sll2])
+        self.l3[sll2] = self.start[sll2] + 20
+
+        null = (self.linktype == LINKTYPE_NULL) & (self.start + 5 <= self.end)
+        self.l3[null] = self.start[null] + 4
+
+        raw = numpy.isin(self.linktype, LINKTYPE_RAW) & (self.start < self.end)
+        self.l3[raw] = self.start[raw]
+
+        self.layers[self.ethertype == ETHERTYPE_ARP] |= LAYER_BITS['arp']
+
+        # Raw and loopback captures carry no ethertype, use the IP version
+        versionless = raw | null
+        version = self.u8(self.l3[versionless]) >> 4
+        self.ethertype[versionless] = numpy.select(
+            [version == 4, version == 6],
+            [ETHERTYPE_IPV4, ETHERTYPE_IPV6],
+            0
+        )
+
+    def decode_network(self):
+        """
+        Decodes the IPv4 and IPv6 headers, determining the transport protocol
+        and the offset of its header.
+        """
+
+        self.protocol = numpy.full(self.count, -1, dtype=numpy.int64)
+        self.l4 = numpy.zeros(self.count, dtype=numpy.int64)
+        self.ip_end = self.end.copy()
+        self.ip_length_end = self.end.copy()
+        self.address_offset = numpy.zeros(self.count, dtype=numpy.int64)
+        self.address_length = numpy.zeros(self.count, dtype=numpy.int64)
+
+        ttl = self.missing()
+        source = numpy.full(self.count, None, dtype=object)
+
+        # IPv4
+        ipv4 = numpy.flatnonzero(
+            (self.ethertype == ETHERTYPE_IPV4) & (self.l3 + 20 <= self.end)
+        )
+        ipv4 = ipv4[self.u8(self.l3[ipv4]) >> 4 == 4]
+        l3 = self.l3[ipv4]
+
+        self.layers[ipv4] |= LAYER_BITS['ip']
+        ttl[ipv4] = self.u8(l3 + 8)
+        total_length = self.u16(l3 + 2)
+        first_fragment = (self.u16(l3 + 6) & 0x1FFF) == 0
+
+        self.protocol[ipv4] = numpy.where(first_fragment, self.u8(l3 + 9), -1)
+        self.l4[ipv4] = l3 + (self.u8(l3) & 0x0F) * 4
+        self.ip_end[ipv4] = numpy.where(
+            total_length > 0,
+            numpy.minimum(l3 + total_length, self.end[ipv4]),
+            self.end[ipv4]
+        )
+        self.ip_length_end[ipv4] = numpy.where(
+            total_length > 0, l3 + total_length, self.end[ipv4])
+        self.address_offset[ipv4] = l3 + 12
+        self.address_length[ipv4] = 4
+
+        # Only the (few) distinct source addresses are formatted
+        addresses, inverse = numpy.unique(self.u32(l3 + 12), return_inverse=True)
+        formatted = numpy.array(
+            [socket.inet_ntoa(struct.pack('>I', a)) for a in addresses.tolist()],
+            dtype=object
+        )
+        source[ipv4] = formatted[inverse.ravel()]
+
+        # IPv6, skipping over the extension headers
+        ipv6 = numpy.flatnonzero(
+            (self.ethertype == ETHERTYPE_IPV6) & (self.l3 + 40 <= self.end)
+        )
+        ipv6 = ipv6[self.u8(self.l3[ipv6]) >> 4 == 6]
+        l3 = self.l3[ipv6]
+
+        self.layers[ipv6] |= LAYER_BITS['ipv6']
+        next_header = self.u8(l3 + 6)
+        l4 = l3 + 40
+        for _ in range(4):
+            readable = l4 + 8 <= self.end[ipv6]
+            extension = numpy.isin(next_header, IPV6_EXTENSION_HEADERS) & readable
+            fragment = (next_header == IPV6_FRAGMENT_HEADER) & readable
+            skipped = extension | fragment
+            if not skipped.any():
+                break
+
+            header = l4[skipped]
+            fragment = fragment[skipped]
+            length = numpy.where(fragment, 8, (self.u8(header + 1) + 1) * 8)
+            later_fragment = fragment & ((self.u16(header + 2) >> 3) != 0)
+
+            next_header[skipped] = numpy.where(later_fragment, -1, self.u8(header))
+            l4[skipped] = header + length
+
+        self.protocol[ipv6] = next_header
+        self.l4[ipv6] = l4
+        self.ip_end[ipv6] = numpy.minimum(l3 + 40 + self.u16(l3 + 4), self.end[ipv6])
+        self.ip_length_end[ipv6] = l3 + 40 + self.u16(l3 + 4)
+        self.address_offset[ipv6] = l3 + 8
+        self.address_length[ipv6] = 16
+
+        self.columns['ip.ttl'] = ttl
+        self.columns['ip.src'] = source
+
+    def decode_transport(self):
+        """
+        Decodes the TCP and UDP headers and locates their payload.
+        """
+
+        self.payload = numpy.zeros(self.count, dtype=numpy.int64)
+        self.source_port = numpy.full(self.count, -1, dtype=numpy.int64)
+        self.destination_port = numpy.full(self.count, -1, dtype=numpy.int64)
+
+        window = self.missing()
+        scalefactor = self.missing()
+
+        # TCP
+        self.tcp = numpy.flatnonzero(
+            (self.protocol == PROTOCOL_TCP) & (self.l4 + 20 <= self.ip_end)
+        )
+        self.layers[self.tcp] |= LAYER_BITS['tcp']
+        l4 = self.l4[self.tcp]
+        flags = self.u8(l4 + 13)
+        header_length = (self.u8(l4 + 12) >> 4) * 4
+
+        self.source_port[self.tcp] = self.u16(l4)
+        self.destination_port[self.tcp] = self.u16(l4 + 2)
+        self.payload[self.tcp] = l4 + header_length
+
+        # Window scaling is negotiated in the SYN segments
+        syn = (flags & TCP_SYN) != 0
+        shifts = numpy.full(len(self.tcp), -1, dtype=numpy.int64)
+        shifts[syn] = self.window_scale_options(l4[syn], l4[syn] + header_length[syn])
+
+        keys = self.conversation_keys(self.tcp)
+        shift = self.tracker.resolve(keys, syn, (flags & TCP_ACK) != 0, shifts)
+        value = self.u16(l4 + 14)
+
+        # The window of the SYN segments themselves is never scaled
+        scaled = ~syn & (shift >= 0)
+        window[self.tcp] = numpy.where(scaled, value << numpy.maximum(shift, 0), value)
+        scalefactor[self.tcp] = numpy.where(
+            syn, numpy.nan, numpy.where(shift >= 0, 2.0 ** shift, shift))
+
+        # Sequence numbers and segment lengths (according to the IP header,
+        # even if the capture is truncated)
+        sequence = self.missing()
+        length = self.missing()
+        tcp_flags = self.missing()
+        sequence[self.tcp] = self.u32(l4 + 4)
+        length[self.tcp] = numpy.maximum(
+            self.ip_length_end[self.tcp] - (l4 + header_length), 0)
+        tcp_flags[self.tcp] = flags
+
+        conversation = numpy.zeros(self.count, dtype=numpy.int64)
+        conversation[self.tcp] = self.key_hash(keys)
+
+        # UDP
+        self.udp = numpy.flatnonzero(
+            (self.protocol == PROTOCOL_UDP) & (self.l4 + 8 <= self.ip_end)
+        )
+        self.layers[self.udp] |= LAYER_BITS['udp']
+        l4 = self.l4[self.udp]
+        self.source_port[self.udp] = self.u16(l4)
+        self.destination_port[self.udp] = self.u16(l4 + 2)
+        self.payload[self.udp] = l4 + 8
+
+        self.columns['tcp.window_size'] = window
+        self.columns['tcp.window_size_scalefactor'] = scalefactor
+        self.columns['tcp.seq_raw'] = sequence
+        self.columns['tcp.len'] = length
+        self.columns['tcp.flags'] = tcp_flags
+        self.columns['conversation'] = conversation
+
+    def conversation_keys(self, indices):
+        """
+        Returns the (source address, destination address, source port,
+        destination port) keys of the given packets as opaque byte strings.
+        """
+
+        width = 16
+        keys = numpy.zeros((len(indices), 2 * width + 4), dtype=numpy.uint8)
+        offsets = self.address_offset[indices]
+        lengths = self.address_length[indices]
+
+        for length in (4, 16):
+            selected = lengths == length
+            positions = offsets[selected]
+            keys[selected, 0:length] = self.bytes_at(positions, length)
+            keys[selected, width:width + length] = self.bytes_at(positions + length, length)
+
+        l4 = self.l4[indices]
+        keys[:, 2 * width:] = self.bytes_at(l4, 4)
+
+        return keys
+
+    @staticmethod
+    def key_hash(keys):
+        """
+        Returns 64-bit hashes of the directed conversation keys, stable
+        across batches. Zero is reserved for packets without a key.
+        """
+
+        words = numpy.ascontiguousarray(keys).view('>u4').astype(numpy.uint64)
+        digest = numpy.full(len(keys), 0xCBF29CE484222325, dtype=numpy.uint64)
+        for column in range(words.shape[1]):
+            digest = (digest ^ words[:, column]) * numpy.uint64(0x100000001B3)
+
+        return (digest | numpy.uint64(1)).view(numpy.int64)
+
+    def window_scale_options(self, start, end):
+        """
+        Returns the shift counts of the TCP window scale options of the TCP
+        headers between the given offsets, or -1 if the option is not
+        present. The options of all the headers are walked at once, one
+        option per step.
+        """
+
+        shifts = numpy.full(len(start), -1, dtype=numpy.int64)
+        position = start + 20
+
+        active = numpy.arange(len(start))
+        while len(active):
+            active = active[position[active] < end[active]]
+            kind = self.u8(position[active])
+
+            # Options other than the end of the list and no-operation carry
+            # their length
+            nop = kind == 1
+            option = (kind != 0) & ~nop & (position[active] + 1 < end[active])
+            length = numpy.zeros(len(active), dtype=numpy.int64)
+            length[option] = self.u8(position[active[option]] + 1)
+
+            scale = (option & (kind == 3) & (length == 3)
+                     & (position[active] + 2 < end[active]))
+            shifts[active[scale]] = numpy.minimum(
+                self.u8(position[active[scale]] + 2), 14)
+
+            advance = nop | (option & ~scale & (length >= 2))
+            position[active[advance]] += numpy.where(nop, 1, length)[advance]
+            active = active[advance]
+
+        return shifts
+
+    def decode_application(self):
+        """
+        Decodes the DNS question types and TLS hello lengths. Only the
+        packets which look like DNS or TLS handshake traffic, according to
+        the layer-presence bitmask, are inspected.
+        """
+
+        dns_type = self.missing()
+        session_id_length = self.missing()
+        compression_methods_length = self.missing()
+        extensions_length = self.missing()
+
+        transport = numpy.concatenate([self.tcp, self.udp])
+        dns = transport[
+            ((self.source_port[transport] == DNS_PORT)
+             | (self.destination_port[transport] == DNS_PORT))
+            & (self.payload[transport] < self.ip_end[transport])
+        ]
+        self.layers[dns] |= LAYER_BITS['dns']
+
+        # DNS over TCP is prefixed by the message length
+        dns = numpy.flatnonzero(self.layers & LAYER_BITS['dns'])
+        over_tcp = (self.layers[dns] & LAYER_BITS['tcp']) != 0
+        dns_type[dns] = self.dns_question_types(
+            self.payload[dns] + numpy.where(over_tcp, 2, 0), self.ip_end[dns])
+
+        # TLS records start with the content type and the major version
+        payload = self.payload[self.tcp]
+        readable = payload + 6 <= self.ip_end[self.tcp]
+        content_type = numpy.where(readable, self.u8(numpy.where(readable, payload, 0)), 0)
+        version = numpy.where(readable, self.u8(numpy.where(readable, payload + 1, 0)), 0)
+        tls = readable & numpy.isin(content_type, TLS_CONTENT_TYPES) & (version == 0x03)
+        self.layers[self.tcp[tls]] |= LAYER_BITS['ssl']
+
+        hello = self.tcp[tls & (content_type == 0x16)]
+        lengths = self.tls_hello_lengths(self.payload[hello], self.ip_end[hello])
+        session_id_length[hello] = lengths[0]
+        compression_methods_length[hello] = lengths[1]
+        extensions_length[hello] = lengths[2]
+
+        self.columns['dns.qry.type'] = dns_type
+        self.columns['ssl.handshake.session_id_length'] = session_id_length
+        self.columns['ssl.handshake.comp_methods_length'] = compression_methods_length
+        self.columns['ssl.handshake.extensions_length'] = extensions_length
+
+    def dns_question_types(self, start, end):
+        """
+        Returns the types of the first questions in the DNS messages between
+        the given offsets. The labels of the names of all the messages are
+        skipped at once, one label per step.
+        """
+
+        types = numpy.full(len(start), numpy.nan)
+
+        valid = numpy.flatnonzero(end - start >= 12)
+        valid = valid[self.u16(start[valid] + 4) != 0]
+        position = start + 12
+
+        active = valid
+        while len(active):
+            active = active[position[active] < end[active]]
+            length = self.u8(position[active])
+
+            # The name ends with the root label or a compression pointer
+            position[active[length == 0]] += 1
+            position[active[(length & 0xC0) == 0xC0]] += 2
+
+            label = (length != 0) & ((length & 0xC0) != 0xC0)
+            active = active[label]
+            position[active] += length[label] + 1
+
+        valid = valid[position[valid] + 2 <= end[valid]]
+        types[valid] = self.u16(position[valid])
+        return types
+
+    def tls_hello_lengths(self, start, end):
+        """
+        Returns the session id, compression methods and extensions lengths
+        of the first Client or Server Hello messages in the TCP payloads
+        between the given offsets. The records of all the payloads are
+        walked at once, one record per step.
+        """
+
+        count = len(start)
+        body = numpy.zeros(count, dtype=numpy.int64)
+        body_end = numpy.zeros(count, dtype=numpy.int64)
+        client = numpy.zeros(count, dtype=bool)
+        found = numpy.zeros(count, dtype=bool)
+
+        position = start.copy()
+        active = numpy.arange(count)
+        while len(active):
+            active = active[position[active] + 5 <= end[active]]
+            content_type = self.u8(position[active])
+            record = position[active] + 5
+            length = self.u16(position[active] + 3)
+            record_end = numpy.minimum(record + length, end[active])
+            position[active] = record + length
+
+            handshake = (content_type == 0x16) & (record_end - record >= 4)
+            handshake_type = numpy.zeros(len(active), dtype=numpy.int64)
+            handshake_type[handshake] = self.u8(record[handshake])
+            hello = handshake & numpy.isin(handshake_type, (1, 2))
+
+            selected = active[hello]
+            body[selected] = record[hello] + 4
+            body_end[selected] = record_end[hello]
+            client[selected] = handshake_type[hello] == 1
+            found[selected] = True
+            active = active[~hello]
+
+        return self.hello_lengths(body, body_end, client, found)
+
+    def hello_lengths(self, body, end, client, found):
+        """
+        Parses the lengths out of the bodies of the Hello messages between
+        the given offsets.
+        """
+
+        session_id = numpy.full(len(body), numpy.nan)
+        compression = numpy.full(len(body), numpy.nan)
+        extensions = numpy.full(len(body), numpy.nan)
+
+        # Skip version and random
+        position = body + 34
+        readable = found & (position < end)
+        session_id[readable] = length = self.u8(position[readable])
+        position[readable] += 1 + length
+
+        suites = client & found & (position + 2 <= end)
+        position[suites] += 2 + self.u16(position[suites])
+        readable = client & found & (position < end)
+        compression[readable] = length = self.u8(position[readable])
+        position[readable] += 1 + length
+
+        # Cipher suite and compression method
+        position[~client] += 3
+
+        readable = found & (position + 2 <= end)
+        extensions[readable] = self.u16(position[readable])
+
+        return session_id, compression, extensions
+
+
+class TCPWindowTracker(object):
+    """
+    Follows the TCP window scale negotiation of the conversations in the
+    capture, the same way tshark does. Each packet gets a shift count,
+    -1 if the scaling is unknown or -2 if no window scaling is used.
+    """
+
+    def __init__(self):
+        # Maps conversation key to tuple of (client key, client shift,
+        # server shift, whether SYN-ACK was seen)
+        self.conversations = {}
+
+    @staticmethod
+    def reverse(key):
+        return key[16:32] + key[0:16] + key[34:36] + key[32:34]
+
+    @staticmethod
+    def shift(state, key):
+        if state is None:
+            return -1
+
+        client, client_shift, server_shift, synack = state
+        if synack:
+            if client_shift >= 0 and server_shift >= 0:
+                return client_shift if key == client else server_shift
+            return -2
+
+        if key == client and client_shift >= 0:
+            return client_shift
+
+        return -1
+
+    def resolve(self, keys, syn, ack, shifts):
+        """
+        Returns the shift count for each of the packets given by their keys,
+        SYN and ACK flags and the window scale options of the SYN packets.
+        """
+
+        result = numpy.full(len(keys), -1, dtype=numpy.int64)
+        if not len(keys):
+            return result
+
+        keys = numpy.ascontiguousarray(keys).view('V{0}'.format(keys.shape[1])).ravel()
+        unique, inverse = numpy.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+        unique_keys = [u.tobytes() for u in unique]
+        conversations = [min(k, self.reverse(k)) for k in unique_keys]
+
+        # Replay the handshakes in this batch, remembering the states
+        events = {}
+        for position in numpy.flatnonzero(syn).tolist():
+            key = unique_keys[inverse[position]]
+            conversation = conversations[inverse[position]]
+            state = self.conversations.get(conversation)
+            history = events.setdefault(conversation, ([], [state]))
+
+            if not ack[position]:
+                state = (key, int(shifts[position]), -1, False)
+            elif state is None:
+                state = (self.reverse(key), -1, int(shifts[position]), True)
+            else:
+                state = (state[0], state[1], int(shifts[position]), True)
+
+            self.conversations[conversation] = state
+            history[0].append(position)
+            history[1].append(state)
+
+        # Assign shifts to packets, grouped by their directed key
+        order = numpy.argsort(inverse, kind='stable')
+        bounds = numpy.searchsorted(inverse[order], numpy.arange(len(unique) + 1))
+        for index, key in enumerate(unique_keys):
+            positions = order[bounds[index]:bounds[index + 1]]
+            conversation = conversations[index]
+
+            if conversation not in events:
+                result[positions] = self.shift(
+                    self.conversations.get(conversation), key)
+                continue
+
+            changes, states = events[conversation]
+            current = numpy.searchsorted(changes, positions, side='right')
+            for state_index in numpy.unique(current).tolist():
+                result[positions[current == state_index]] = self.shift(
+                    states[state_index], key)
+
+        return result
@@ -0,0 +1,190 @@
+"""
+Feature plans - the registry of parameter extractors and feature reducers of
+a Flow class, built once per class.
+"""
+
+import collections
+import hashlib
+import inspect
+import time
+
+import pandas
+
+from uadt.analysis.pcap import LAYER_BITS
+
+
+Parameter = collections.namedtuple('Parameter', [
+    'name', 'function', 'field', 'layer', 'missing'
+])
+
+Feature = collections.namedtuple('Feature', [
+    'name', 'function', 'vectorized', 'dependencies', 'cost'
+])
+
+# Relative cost of the vectorized reductions, in units of one pass over the
+# packet table of the flow
+REDUCTION_COSTS = {
+    'count': 1,
+    'sum': 1,
+    'min': 1,
+    'max': 1,
+    'mean': 1,
+    'present': 1,
+    'equal': 1,
+    'std': 2,
+    'var': 2,
+}
+
+
+class FeaturePlan(object):
+    """
+    Represents the ordered plan of parameter extractors and feature reducers
+    of a Flow class. Both are ordered by their name, which determines the
+    order of columns in the packet table and in the generated datasets.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+
+        self.parameters = [
+            self.build_parameter(key.split('parameter_', 1)[1], getattr(cls, key))
+            for key in sorted(dir(cls))
+            if key.startswith('parameter_')
+        ]
+
+        self.features = [
+            self.build_feature(key.split('feature_', 1)[1], getattr(cls, key))
+            for key in sorted(dir(cls))
+            if key.startswith('feature_')
+        ]
+
+        self.parameter_version = self.compute_parameter_version()
+        self.feature_version = self.compute_feature_version()
+
+    @staticmethod
+    def build_parameter(name, function):
+        """
+        Determines the tshark field the parameter reads and the protocol
+        layer the packets need to have for the parameter to be extracted.
+        Parameters reading fields of other protocols (i.e. frame) are
+        extracted from every packet.
+        """
+
+        field = getattr(function, 'tshark_field', None)
+        protocol = field.split('.')[0] if field else None
+
+        return Parameter(
+            name=name,
+            function=function,
+            field=field,
+            layer=protocol if protocol in LAYER_BITS else None,
+            missing=getattr(function, 'missing_value', None),
+        )
+
+    @staticmethod
+    def build_feature(name, function):
+        """
+        Determines the parameter columns the feature depends on and its
+        estimated cost from the vectorized declaration, if available.
+        """
+
+        spec = getattr(function, 'vectorized', None)
+        if spec is None:
+            return Feature(name, function, None, None, None)
+
+        reduction, column, scope, _ = spec
+        dependencies = set()
+        cost = REDUCTION_COSTS.get(reduction, 1)
+
+        if column == 'timeshift':
+            dependencies.add('timestamp')
+            cost += 1
+        elif column is not None:
+            dependencies.add(column)
+
+        if scope != 'all':
+            dependencies.add('direction')
+            cost += 1
+
+        return Feature(name, function, spec, tuple(sorted(dependencies)), cost)
+
+    def compute_parameter_version(self):
+        """
+        Returns the version of the parameter set, which changes whenever any
+        of the parameter methods changes.
+        """
+
+        digest = hashlib.sha1()
+        for parameter in self.parameters:
+            try:
+                source = inspect.getsource(parameter.function)
+            except (OSError, TypeError):
+                source = None
+            digest.update(repr((parameter.name, parameter.field, source)).encode())
+
+        return digest.hexdigest()[:16]
+
+    def compute_feature_version(self):
+        """
+        Returns the version of the feature set, which changes whenever any of
+        the parameter or feature methods changes.
+        """
+
+        digest = hashlib.sha1(self.parameter_version.encode())
+        for feature in self.features:
+            try:
+                source = inspect.getsource(feature.function)
+            except (OSError, TypeError):
+                source = None
+            digest.update(repr((feature.name, feature.vectorized, source)).encode())
+
+        return digest.hexdigest()[:16]
+
+    @property
+    def parameter_names(self):
+        return [parameter.name for parameter in self.parameters]
+
+    @property
+    def feature_names(self):
+        return [feature.name for feature in self.features]
+
+    def describe(self):
+        """
+        Returns a table describing the features of the plan.
+        """
+
+        return pandas.DataFrame([
+            {
+                'name': feature.name,
+                'vectorized': feature.vectorized is not None,
+                'dependencies': ', '.join(feature.dependencies or ()),
+                'cost': feature.cost,
+            }
+            for feature in self.features
+        ], columns=['name', 'vectorized', 'dependencies', 'cost'])
+
+    def profile(self, flows):
+        """
+        Measures the average time (in seconds) each feature method takes on
+        the given flows.
+        """
+
+        timings = {}
+        for feature in self.features:
+            start = time.perf_counter()
+            for flow in flows:
+                feature.function(flow)
+            timings[feature.name] = (time.perf_counter() - start) / max(len(flows), 1)
+
+        return timings
+
+
+class PlanMount(type):
+    """
+    Builds the feature plan for each Flow class, so that flows of the class do
+    not need to perform reflection on their own.
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super(PlanMount, cls).__init__(name, bases, attrs)
+        cls.plan = FeaturePlan(cls)
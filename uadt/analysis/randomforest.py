@@ -4,9 +4,12 @@
 Forest - train and evaluate support vector machine on a given dataset.
 
 Usage:
-  forest.py <dataset> [--optimize] [--train=<fraction>] [--confusion] [--outfile=<path>]
+  forest.py <dataset> [--optimize] [--search=<method>] [--oob] [--train=<fraction>] [--confusion] [--outfile=<path>]
 
 Options:
+  --optimize          Search for the optimal parameters of the forest.
+  --search=<method>   The search method of --optimize: grid, or the faster halving or hyperband [default: grid].
+  --oob               Score the candidates on their out-of-bag samples instead of 5-fold cross validation.
   --train=<fraction>  Specifies the portion of the data set that should be used for training [default: 0.7].
   --confusion         Displays the confusion matrix.
   --outfile=<path>    Save the trained model at the given path.
@@ -16,12 +19,63 @@ $ python tree.py data1000.csv
 $ python tree.py data1000.csv --train=0.8
 """
 
+import itertools
+
+import numpy
 from docopt import docopt
-from sklearn import ensemble
 from joblib import Parallel, delayed
+from sklearn import ensemble, model_selection
 
 from uadt import config
-from uadt.analysis.model import Model
+from uadt.analysis.model import FOLDS, Model
+from uadt.analysis.shared import attach
+
+
+def grow_forest(handle, hyperparameters, n_estimators, samples=None,
+                folds=FOLDS, oob=False):
+    """
+    Grows one forest per fold of the cross validation, adding trees to it
+    until each of the given numbers of trees is reached, instead of growing
+    a separate forest for each of them. Returns the success rates for the
+    numbers of trees, averaged over the folds. With oob, the forest is
+    grown on the whole training set and scored on the out-of-bag samples.
+    The forests are seeded by RANDOM_STATE from the config, unless the
+    hyperparameters specify the seed.
+    """
+
+    hyperparameters = dict(hyperparameters)
+    hyperparameters.setdefault('random_state', getattr(config, 'RANDOM_STATE', 0))
+
+    X, y = attach(handle)
+    X = X[:samples]
+    y = y[:samples]
+
+    if oob:
+        splits = [(numpy.arange(len(y)), None)]
+    else:
+        five_fold = model_selection.KFold(n_splits=FOLDS)
+        splits = list(itertools.islice(five_fold.split(X, y), folds))
+
+    counts = sorted(n_estimators)
+    rates = numpy.zeros(len(counts))
+
+    for fold_train, fold_test in splits:
+        X_train = X[fold_train]
+        y_train = y[fold_train]
+
+        forest = ensemble.RandomForestClassifier(
+            warm_start=True, oob_score=oob, **hyperparameters)
+
+        for position, count in enumerate(counts):
+            forest.set_params(n_estimators=count)
+            forest.fit(X_train, y_train)
+
+            if oob:
+                rates[position] += forest.oob_score_
+            else:
+                rates[position] += forest.score(X[fold_test], y[fold_test])
+
+    return dict(zip(counts, rates / len(splits)))
 
 
 class Forest(Model):
@@ -31,25 +85,41 @@ class Forest(Model):
 
     classifier_cls = ensemble.RandomForestClassifier
 
-    def optimize_paramters(self):
+    # Score the candidates on the out-of-bag samples
+    oob = False
+
+    @property
+    def search_folds(self):
+        # The out-of-bag score is a single evaluation of each candidate
+        return 1 if self.oob else None
+
+    search_space = {
+        'n_estimators': [10*2**n for n in range(8,10)],
+        'max_features': [0.05 * n for n in range(1, 21)],
+        'min_samples_leaf': [
+            1,2,3,4,6,8,10,12,15,18,21,25,30,35,40,45,50
+        ],
+    }
+
+    def test_candidates(self, handle, candidates, samples=None, folds=FOLDS):
         """
-        Optimizes parameters of the random forest.
+        Cross validates the candidates differing only in the number of
+        trees using a single growing forest per fold.
         """
 
-        n_estimators_candidates = [10*2**n for n in range(8,10)]
-        max_features_candidates = [0.05 * n for n in range(1, 21)]
-        min_samples_leaf_candidates = [
-            1,2,3,4,6,8,10,12,15,18,21,25,30,35,40,45,50
-        ]
+        groups = self.group_candidates(candidates, 'n_estimators')
 
-        rates = Parallel(n_jobs=config.NUM_JOBS)(
-            delayed(self.test_parameters)(n_estimators=n_estimators, max_features=max_features, min_samples_leaf=min_samples_leaf)
-            for n_estimators in n_estimators_candidates
-            for max_features in max_features_candidates
-            for min_samples_leaf in min_samples_leaf_candidates
+        results = Parallel(n_jobs=config.NUM_JOBS)(
+            delayed(grow_forest)(handle, dict(key), n_estimators, samples,
+                                 folds, self.oob)
+            for key, n_estimators in groups.items()
         )
+        rates = dict(zip(groups, results))
 
-        _, self.hyperparameters = max(rates, key=lambda x: x[0])
+        return [
+            rates[self.group_key(candidate, 'n_estimators')][candidate['n_estimators']]
+            for candidate in candidates
+        ]
 
 
 def main():
@@ -57,10 +127,11 @@ def main():
 
     machine = Forest(arguments['<dataset>'],
                    train_size=float(arguments['--train']))
+    machine.oob = arguments['--oob']
     machine.prepare_data()
 
     if arguments.get('--optimize'):
-        machine.optimize_paramters()
+        machine.optimize_paramters(arguments['--search'])
 
     machine.initialize_classifier()
 
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+"""
+remote - process the dataset files published by a coordinating uadt-dataset
+
+Usage:
+  uadt-dataset-worker <queue> [--worker-id=<id>] [--root=<path>]
+
+Options:
+  --worker-id=<id>  The identifier of the worker in the queue (defaults to <hostname>-<pid>).
+  --root=<path>     The directory the paths of the files are relative to (defaults to the working directory of the coordinator).
+
+Examples:
+$ uadt-dataset sessions --coordinate /shared/queue
+$ uadt-dataset-worker /shared/queue
+
+Several workers on one host stand in for the nodes when testing:
+$ uadt-dataset sessions --coordinate /tmp/queue --lease-timeout 5 &
+$ uadt-dataset-worker /tmp/queue --worker-id node1 &
+$ uadt-dataset-worker /tmp/queue --worker-id node2
+"""
+
+import os
+import time
+
+from docopt import docopt
+
+from uadt.analysis import workers
+from uadt.analysis.coordinator import POLL_INTERVAL, LeaseQueue, work
+from uadt.analysis.dataset import DatasetProcessor
+
+
+def main():
+    arguments = docopt(__doc__)
+    queue = LeaseQueue(arguments['<queue>'])
+
+    job = queue.job()
+    while job is None or queue.finished:
+        time.sleep(POLL_INTERVAL)
+        job = queue.job()
+
+    # The features computed by all the workers must be the same
+    version = DatasetProcessor.dataset_version(job['backend'], job['split'])
+    if version != job['version']:
+        raise SystemExit("Dataset version {0} differs from the version {1} of "
+                         "the coordinator".format(version, job['version']))
+
+    os.chdir(arguments['--root'] or job['root'])
+
+    processed = work(queue, DatasetProcessor.remote_task,
+                     arguments['--worker-id'], job['max_tasks'],
+                     release_codes=(workers.RECYCLE_EXIT_CODE,))
+    print("Processed {0} tasks".format(processed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Size-aware scheduling of the files processed by a pool of workers.
+"""
+
+import collections
+import heapq
+
+
+# Files smaller than this (in bytes) are packed together into one task
+BATCH_SIZE = 32 * 1024 ** 2
+
+# The fixed cost of processing a file, expressed in bytes
+FILE_COST = 64 * 1024
+
+# Timeouts of the tasks, relative to their predicted duration (in seconds).
+# Without a calibrated rate, each file gets the flat timeout, as do the files
+# larger than any file the rate was measured on.
+TIMEOUT_FACTOR = 10
+TIMEOUT_MINIMUM = 60
+TIMEOUT_FLAT = 1800
+
+Task = collections.namedtuple('Task', ['paths', 'cost'])
+
+
+class WorkScheduler(object):
+    """
+    Splits the files into tasks and orders them largest first, so that the
+    large files do not end up at the tail of the run, occupying a few workers
+    while the others are idle. Small files are packed into batches, to cut
+    the overhead of tasks. The durations of the tasks are predicted from the
+    processing rate (bytes per second of one worker) measured previously, on
+    files of up to the given largest cost.
+    """
+
+    def __init__(self, sizes, workers, rate=None, batch_files=32,
+                 batch_size=BATCH_SIZE, largest=None):
+        self.sizes = sizes
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.batch_files = max(1, batch_files)
+        self.batch_size = batch_size
+        self.largest = largest
+
+    def cost(self, path):
+        return self.sizes[path] + FILE_COST
+
+    def tasks(self, paths):
+        """
+        Returns the tasks processing the given files, largest first.
+        """
+
+        paths = sorted(paths, key=self.cost, reverse=True)
+
+        tasks = []
+        batch = []
+        batch_cost = 0
+
+        for path in paths:
+            cost = self.cost(path)
+            if cost >= self.batch_size:
+                tasks.append(Task([path], cost))
+                continue
+
+            if batch and (batch_cost + cost > self.batch_size
+                          or len(batch) >= self.batch_files):
+                tasks.append(Task(batch, batch_cost))
+                batch, batch_cost = [], 0
+
+            batch.append(path)
+            batch_cost += cost
+
+        if batch:
+            tasks.append(Task(batch, batch_cost))
+
+        return sorted(tasks, key=lambda task: task.cost, reverse=True)
+
+    def duration(self, task, rate=None):
+        """
+        Returns the predicted duration of the task (in seconds) at the given
+        rate, the calibrated one by default, or None if the rate is not known.
+        """
+
+        rate = rate or self.rate
+        if not rate:
+            return None
+        return task.cost / rate
+
+    def timeout(self, task):
+        duration = self.duration(task)
+        if duration is None:
+            return TIMEOUT_FLAT * len(task.paths)
+
+        # The rate tells little about the files larger than those it was
+        # measured on, these are not killed sooner than without it
+        unknown = sum(
+            1 for path in task.paths
+            if self.largest is None or self.cost(path) > self.largest
+        )
+        return max(TIMEOUT_MINIMUM, TIMEOUT_FACTOR * duration,
+                   TIMEOUT_FLAT * unknown)
+
+    def makespan(self, tasks, rate=None):
+        """
+        Predicts the time the workers need to process the tasks at the given
+        rate, the calibrated one by default, assigning each task to the first
+        worker to become idle. Returns None if the rate is not known.
+        """
+
+        rate = rate or self.rate
+        if not rate:
+            return None
+
+        finish = [0.0] * self.workers
+        for task in tasks:
+            heapq.heapreplace(finish, finish[0] + self.duration(task, rate))
+
+        return max(finish)
+
+    @staticmethod
+    def calibrate(cost, elapsed):
+        """
+        Returns the processing rate measured on the tasks of the given total
+        cost, which took the given total time of the workers.
+        """
+
+        if cost <= 0 or elapsed <= 0:
+            return None
+        return cost / elapsed
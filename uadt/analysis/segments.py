@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+
+"""
+segments - inspect segment containers and export their segments
+
+Usage:
+  uadt-segments list <container>...
+  uadt-segments export [--output-dir=<output_dir>] <container> [<segment>...]
+
+Options:
+  --output-dir=<value>   The directory where to export the segments [default: .].
+
+Examples:
+$ uadt-segments list data_split/*.segments
+$ uadt-segments export data_split/session.segments send_gif-20170101_101010.pcap
+"""
+
+import collections
+import contextlib
+import itertools
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from docopt import docopt
+
+from uadt.logger import LoggerMixin
+
+
+EXTENSION = '.segments'
+
+MAGIC = b'UADTSEG1'
+
+# The magic, followed by the offset and the length of the index
+HEADER = struct.Struct('<8sQQ')
+
+# How many read-only containers are kept open by each process
+OPEN_CONTAINERS = 8
+
+Segment = collections.namedtuple('Segment', [
+    'name', 'event', 'end', 'offset', 'length'
+])
+
+
+class ContainerFormatError(ValueError):
+    """
+    Raised when the file is not a valid segment container.
+    """
+    pass
+
+
+class SegmentContainer(LoggerMixin):
+    """
+    A single file holding all the segments split out of one session file.
+    Each segment is stored as a complete capture file, appended after the
+    previous ones. The header points to the index of the segments - their
+    names, event names, end timestamps (in nanoseconds), offsets and lengths.
+
+    The file is only ever appended to. New segments are written after the
+    current index and a new index is appended once writing is finished, after
+    which the header is updated to point to it. An interrupted write leaves
+    the previous index in place. Segments are addressed by virtual paths of
+    the form <container>.segments/<segment name>.
+    """
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        self.modified = False
+        self.buffer = None
+
+        # The names of the segments written since the container was opened
+        self.written = set()
+
+        if writable and not os.path.exists(path):
+            with open(path, 'wb') as container:
+                container.write(HEADER.pack(MAGIC, 0, 0))
+
+        self.file = open(path, 'r+b' if writable else 'rb')
+        self.read_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.segments
+
+    def __iter__(self):
+        return iter(self.segments.values())
+
+    def __len__(self):
+        return len(self.segments)
+
+    def read_index(self):
+        magic, offset, length = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ContainerFormatError("'{0}' is not a segment container".format(self.path))
+
+        index = {'metadata': {}, 'segments': []}
+        if length:
+            self.file.seek(offset)
+            index = json.loads(self.file.read(length).decode('utf-8'))
+
+        self.metadata = index['metadata']
+        self.segments = collections.OrderedDict(
+            (entry[0], Segment(*entry)) for entry in index['segments']
+        )
+
+    def write_index(self):
+        """
+        Appends the index and points the header to it.
+        """
+
+        index = json.dumps({
+            'metadata': self.metadata,
+            'segments': [list(segment) for segment in self.segments.values()],
+        }).encode('utf-8')
+
+        offset = self.file.seek(0, os.SEEK_END)
+        self.file.write(index)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, offset, len(index)))
+        self.file.flush()
+
+    @contextlib.contextmanager
+    def writer(self, name, event, end):
+        """
+        Yields the file object the segment of the given name is to be written
+        into. The segment is added to the index once written. Segments of
+        the same name written before replace the previous ones, but the
+        names repeated while the container is open are made unique.
+        """
+
+        if not self.writable:
+            raise ValueError("Container '{0}' is not writable".format(self.path))
+
+        if name in self.written:
+            base, extension = os.path.splitext(name)
+            name = next(
+                candidate for candidate in (
+                    '{0}-{1}{2}'.format(base, number, extension)
+                    for number in itertools.count(1)
+                )
+                if candidate not in self.written
+            )
+            self.warning("Duplicate segment name, writing it as '{0}'".format(name))
+        self.written.add(name)
+
+        # The mapping does not cover the appended data
+        self.buffer = None
+
+        offset = self.file.seek(0, os.SEEK_END)
+        yield self.file
+
+        length = self.file.seek(0, os.SEEK_END) - offset
+        self.segments[name] = Segment(name, event, end, offset, length)
+        self.modified = True
+
+    def extend(self, other):
+        """
+        Appends all the segments of the other container.
+        """
+
+        for segment in other:
+            with self.writer(segment.name, segment.event, segment.end) as target:
+                target.write(other.read(segment.name))
+
+    def read(self, name):
+        """
+        Returns the memory mapped contents of the given segment.
+        """
+
+        segment = self.segments[name]
+        if self.buffer is None:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return memoryview(self.buffer)[segment.offset:segment.offset + segment.length]
+
+    def export(self, name, path):
+        """
+        Writes the given segment into a standalone capture file.
+        """
+
+        with open(path, 'wb') as target:
+            target.write(self.read(name))
+
+    def close(self):
+        if self.modified:
+            self.write_index()
+            self.modified = False
+
+        # Memory views of the segments may still be in use, leave the mapping
+        # to the garbage collector
+        self.buffer = None
+        self.file.close()
+
+    def paths(self):
+        """
+        Returns the virtual paths of all the segments.
+        """
+
+        return [os.path.join(self.path, name) for name in self.segments]
+
+    @staticmethod
+    def locate(path):
+        """
+        Splits the virtual path of a segment into the path of its container
+        and the name of the segment. Returns None for other paths.
+        """
+
+        container, name = os.path.split(path)
+        if container.endswith(EXTENSION) and os.path.isfile(container):
+            return container, name
+
+
+# The containers opened by open_container, by their paths, with the size and
+# modification time they were opened at, least recently used first
+_opened = collections.OrderedDict()
+
+
+def open_container(path):
+    """
+    Returns the read-only container at the given path. The containers are
+    opened and their indexes parsed once per process, until they change, as
+    their segments are read one at a time.
+    """
+
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+
+    cached = _opened.pop(path, None)
+    if cached is not None and cached[0] != key:
+        cached[1].close()
+        cached = None
+    if cached is None:
+        cached = (key, SegmentContainer(path))
+    _opened[path] = cached
+
+    # Close the least recently used containers
+    while len(_opened) > OPEN_CONTAINERS:
+        _opened.popitem(last=False)[1][1].close()
+
+    return cached[1]
+
+
+def read_buffer(path):
+    """
+    Returns the memory mapped contents of the capture file at the given path,
+    which can also be a virtual path of a segment.
+    """
+
+    located = SegmentContainer.locate(path)
+    if located is not None:
+        container, name = located
+        return open_container(container).read(name)
+
+    with open(path, 'rb') as capture:
+        try:
+            return mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be memory mapped
+            return b''
+
+
+@contextlib.contextmanager
+def materialized(path):
+    """
+    Yields a path of a standalone file with the contents of the capture file
+    at the given path, exporting segments into temporary files for the tools
+    which need them (i.e. tshark).
+    """
+
+    located = SegmentContainer.locate(path)
+    if located is None:
+        yield path
+        return
+
+    container, name = located
+    with tempfile.TemporaryDirectory() as directory:
+        exported = os.path.join(directory, name)
+        open_container(container).export(name, exported)
+        yield exported
+
+
+def main():
+    arguments = docopt(__doc__)
+
+    if arguments['list']:
+        for path in arguments['<container>']:
+            with SegmentContainer(path) as container:
+                print("{0}: {1} segments".format(path, len(container)))
+                for segment in container:
+                    print("  {0} ({1} bytes)".format(segment.name, segment.length))
+    elif arguments['export']:
+        output_dir = arguments['--output-dir']
+        with SegmentContainer(arguments['<container>'][0]) as container:
+            names = arguments['<segment>'] or [s.name for s in container]
+            for name in names:
+                if name not in container:
+                    print("Segment '{0}' not found".format(name))
+                    continue
+                container.export(name, os.path.join(output_dir, name))
+                print("Exported {0}".format(name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Training data shared by the worker processes of the hyperparameter search.
+The arrays are stored once in memory-mapped files, preferably in shared
+memory, and the workers receive only their paths.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy
+
+
+# The location of the shared arrays, if the platform provides one
+SHARED_MEMORY_DIR = '/dev/shm'
+
+# The handle and the arrays attached by the current process. Only the arrays
+# of the latest handle are kept, so that the files of the finished searches
+# are unmapped and their memory released once they are removed.
+_attached = (None, None)
+
+
+class SharedArrays(object):
+    """
+    Stores the given arrays in memory-mapped .npy files for the time of the
+    with block. The handle identifies the arrays in the workers.
+    """
+
+    def __init__(self, *arrays):
+        self.arrays = arrays
+        self.directory = None
+        self.handle = None
+
+    def __enter__(self):
+        location = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None
+        self.directory = tempfile.mkdtemp(prefix='uadt-', dir=location)
+
+        paths = []
+        for position, array in enumerate(self.arrays):
+            path = os.path.join(self.directory, '{0}.npy'.format(position))
+            numpy.save(path, numpy.ascontiguousarray(array))
+            paths.append(path)
+
+        self.handle = tuple(paths)
+        return self
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def attach(handle):
+    """
+    Returns the read-only arrays identified by the handle. The arrays are
+    mapped only once per process, the arrays of the previous handle are
+    released.
+    """
+
+    global _attached
+
+    if _attached[0] != handle:
+        # Unmap the previous arrays before mapping the new ones
+        _attached = (None, None)
+        _attached = (handle, [numpy.load(path, mmap_mode='r') for path in handle])
+
+    return _attached[1]
@@ -4,50 +4,93 @@
 splitter - split a session PCAP file using different methods
 
 Usage:
-  splitter.py --method=<method> [--parallel=TRUE] [--output-dir=<output_dir>] <file>...
+  splitter.py --method=<method> [--parallel=TRUE] [--output-dir=<output_dir>] [--engine=<engine>] [--container] [--gap=<seconds>] [--adaptive] <file>...
 
 Options:
   --method=<method>      Specify what method should be used to split the PCAP file.
   --output-dir=<value>   The directory where to create splitted PCAP file segments [default: data_split].
-  --parallel=<value>     Whether use multiple processes to split files [default: TRUE].
+  --parallel=<value>     Whether use multiple processes to split files (or shards of a single large file, with the native engine) [default: TRUE].
+  --engine=<engine>      How the segments are extracted: tshark (one process per segment, writes pcapng) or native (single pass over the file, writes the format of the session file) [default: tshark].
+  --container            Store the segments of each session in a single segment container (<session>.segments) instead of separate files.
+  --gap=<seconds>        The gap in the traffic separating two events, used by the auto method [default: 2].
+  --adaptive             Derive the gap from the inter-arrival times of each session, used by the auto method.
 
 Examples:
 $ ./splitter.py --method marks data/*.pcap
 $ ./splitter.py --method auto --output-dir data_split data/*.pcap
+$ ./splitter.py --method auto --adaptive data/*.pcap
+$ ./splitter.py --method marks --engine native data/*.pcap
+$ ./splitter.py --method marks --container data/*.pcap
 """
 
 import abc
+import calendar
 import datetime
 import glob
 import json
+import shutil
 import subprocess
 import os
+import tempfile
 
 import docopt
-import pyshark
+import numpy
 from joblib import Parallel, delayed
 
 from uadt import config, constants
+from uadt.analysis.backends import NativeSource, PacketSource
+from uadt.analysis.flow import Flow
+from uadt.analysis.index import PacketIndex
+from uadt.analysis.overlap import assign_events
+from uadt.analysis.pcap import (CaptureFile, CaptureFormatError,
+                                INTEGER_FIELDS, LAYER_BITS, TCP_FIN, TCP_SYN)
+from uadt.analysis.segments import EXTENSION, SegmentContainer
+from uadt.analysis.stream import retype
 from uadt.plugins import PluginBase, PluginMount
 
 
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# The number of packets decoded at once when looking for gaps
+CHUNK_SIZE = 65536
+
+# Session files smaller than this (in bytes) are split in a single process
+SHARD_MINIMUM_SIZE = 64 * 1024 ** 2
+
+# The default gap (in seconds) separating two events
+DEFAULT_GAP = 2
+
+# The adaptive gap needs enough inter-arrival times to be estimated and is
+# never shorter than ADAPTIVE_MINIMUM_GAP seconds
+ADAPTIVE_MINIMUM_GAPS = 16
+ADAPTIVE_MINIMUM_GAP = 0.5
+ADAPTIVE_DEVIATIONS = 3
+
+
 class Splitter(PluginBase, metaclass=PluginMount):
     """
     An object that represents a mechanism for splitting a session PCAP file.
     """
 
     identifier = None
+    engines = ('native', 'tshark')
 
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, engine='tshark', jobs=1, container=False):
         if not self.identifier:
             raise ValueError("Method idenfitier must be specified")
 
+        if engine not in self.engines:
+            raise ValueError("Unknown splitting engine: {0}".format(engine))
+
         self.output_dir = output_dir
+        self.engine = engine
+        self.jobs = jobs
+        self.container = container
 
-    def execute(self, pcap_filename):
+    def load_metadata(self, pcap_filename):
         """
-        Wraps the splitting method with common error handling and metadata
-        loading.
+        Loads the marks file of the session file. Returns False if the
+        session file cannot be split.
         """
 
         self.info("Processing: '{}'".format(pcap_filename))
@@ -55,7 +98,7 @@ class Splitter(PluginBase, metaclass=PluginMount):
         if not pcap_filename.endswith('.pcap'):
             self.error('File "{}" is not a PCAP file. Skipping.'
                        .format(pcap_filename))
-            return
+            return False
 
         marks_path = '.'.join(pcap_filename.split('.')[:-1]) + '.marks'
 
@@ -66,7 +109,7 @@ class Splitter(PluginBase, metaclass=PluginMount):
         except FileNotFoundError:
             self.warning("Marks file '{0}' not found. Skipping."
                          .format(marks_path))
-            return
+            return False
 
 
         # Convert timestamps into datetime objects
@@ -80,30 +123,273 @@ class Splitter(PluginBase, metaclass=PluginMount):
                 constants.MARKS_TIMESTAMP
             )
 
+        return True
+
+    def segment_filename(self, event_name, end):
+        """
+        Generates the name of the segment file of the given event.
+        """
+
+        return os.path.join(
+            self.output_dir or '',
+            ''.join([
+                event_name,
+                '-',
+                end.strftime('%Y%m%d_%H%M%S') + '.pcap'
+            ])
+        )
+
+    def container_filename(self, pcap_filename):
+        """
+        Generates the name of the segment container of the session file.
+        """
+
+        basename = os.path.basename(pcap_filename)
+        return os.path.join(
+            self.output_dir or '',
+            '.'.join(basename.split('.')[:-1]) + EXTENSION
+        )
+
+    def existing_segments(self, pcap_filename):
+        """
+        Returns the names of the segments already stored in the segment
+        container of the session file.
+        """
+
+        container_filename = self.container_filename(pcap_filename)
+        if not self.container or not os.path.exists(container_filename):
+            return set()
+
+        with SegmentContainer(container_filename) as container:
+            return set(segment.name for segment in container)
+
+    def execute(self, pcap_filename):
+        """
+        Wraps the splitting method with common error handling and metadata
+        loading.
+        """
+
+        if not self.load_metadata(pcap_filename):
+            return
+
+        existing = self.existing_segments(pcap_filename)
+
         # Generate a separate file for each split interval
-        for query, event_name, event_end in self.split_intervals(pcap_filename):
+        segments = []
+        for event_name, start, end in self.split_intervals(pcap_filename):
 
             # Generate the name for the output file
-            output_filename = os.path.join(
-                self.output_dir,
-                ''.join([
-                    event_name,
-                    '-',
-                    event_end.strftime('%Y%m%d_%H%M%S') + '.pcap'
-                ])
-            )
+            output_filename = self.segment_filename(event_name, end)
 
             # Skip already generated files
-            if os.path.exists(output_filename):
+            if self.container:
+                generated = os.path.basename(output_filename) in existing
+            else:
+                generated = os.path.exists(output_filename)
+
+            if generated:
                 self.warning('File "{}" already exists. Skipping.'
                           .format(output_filename))
                 continue
             else:
                 self.debug('Splitting out "{}"'.format(output_filename))
 
-            # Perform the extraction
-            env = os.environ.copy()
-            env['TZ'] = 'UTC'
+            segments.append((event_name, start, end, output_filename))
+
+        if segments:
+            getattr(self, 'extract_' + self.engine)(pcap_filename, segments)
+
+    def split_flows(self, pcap_filename, backend=None, use_cache=True):
+        """
+        Splits the session file in memory, without writing any segment files.
+        Yields the event name, start, end and flow of each segment. The flows
+        carry the name the segment file would have as their path.
+
+        With the native packet source, the packet records of the session are
+        read once and the records of each segment are decoded from memory,
+        yielding the same flows as the segment files would. Otherwise the
+        session is parsed once and each flow holds the rows of the session
+        packet table (the TCP window scaling then reflects the whole
+        session).
+        """
+
+        if not self.load_metadata(pcap_filename):
+            return
+
+        source = PacketSource.get_plugin(backend or Flow.backend)(Flow)
+        capture = records = None
+
+        if isinstance(source, NativeSource) and not source.unsupported:
+            try:
+                capture = CaptureFile.open(pcap_filename)
+                records = next(capture.chunks())
+            except CaptureFormatError as exc:
+                self.warning("Unable to read '{0}' natively ({1})"
+                             .format(pcap_filename, exc))
+
+        if records is not None:
+            timestamps = records[:, 4]
+        else:
+            session = Flow.from_path(pcap_filename, backend=backend,
+                                     use_cache=use_cache)
+            # Epoch seconds as floats are precise to microseconds, the default
+            # resolution of the captures
+            timestamps = numpy.round(
+                session.data['timestamp'].values.astype(float) * 1e6
+            ).astype(numpy.int64) * 1000
+            integral = [p.name for p in Flow.plan.parameters
+                        if p.field in INTEGER_FIELDS]
+
+        # Packets are not guaranteed to be stored in chronological order
+        order = numpy.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+
+        for event_name, start, end in self.split_intervals(pcap_filename):
+            low = numpy.searchsorted(timestamps, self.timestamp_ns(start), 'left')
+            high = numpy.searchsorted(timestamps, self.timestamp_ns(end), 'right')
+            rows = numpy.sort(order[low:high])
+            path = self.segment_filename(event_name, end)
+
+            if records is not None:
+                flow = source.read_records(path, capture, records[rows])
+            else:
+                data = session.data.iloc[rows].reset_index(drop=True)
+                flow = Flow(path=path, data=retype(data, integral))
+
+            yield event_name, start, end, flow
+
+    @staticmethod
+    def timestamp_ns(moment):
+        """
+        Converts the datetime into nanoseconds since the epoch. Naive
+        datetimes are considered to be in UTC, as are the marks.
+        """
+
+        seconds = calendar.timegm(moment.utctimetuple())
+        return seconds * 1000000000 + moment.microsecond * 1000
+
+    def extract_native(self, pcap_filename, segments):
+        """
+        Extracts all the segments without running tshark. The packet index of
+        the session file (built on first use) is used to read only the part
+        of the file around each segment. Packet records with timestamps
+        within the (inclusive) bounds of each segment are copied verbatim
+        after the header of the session file, preserving their order.
+        """
+
+        index = PacketIndex.for_path(pcap_filename)
+        if index is None:
+            self.warning("Unable to split '{0}' natively, using tshark"
+                         .format(pcap_filename))
+            return self.extract_tshark(pcap_filename, segments)
+
+        bounds = [
+            (self.timestamp_ns(start), self.timestamp_ns(end), output_filename, event_name)
+            for event_name, start, end, output_filename in segments
+        ]
+
+        container = None
+        if self.container:
+            container = self.container_filename(pcap_filename)
+
+        shards = self.shards(index, bounds)
+        if len(shards) == 1:
+            write_segments(pcap_filename, bounds, index, container)
+            return
+
+        # Each shard writes its own container, these are merged afterwards
+        parts = [None] * len(shards)
+        if container:
+            parts = [
+                '{0}.{1}.part'.format(container, number)
+                for number in range(len(shards))
+            ]
+
+        self.debug("Splitting '{0}' in {1} shards".format(pcap_filename, len(shards)))
+        Parallel(n_jobs=len(shards))(
+            delayed(write_segments)(pcap_filename, shard, None, part)
+            for shard, part in zip(shards, parts)
+        )
+
+        if container:
+            with SegmentContainer(container, writable=True) as target:
+                for part in parts:
+                    with SegmentContainer(part) as source:
+                        target.metadata.update(source.metadata)
+                        target.extend(source)
+                    os.remove(part)
+
+    def shards(self, index, bounds):
+        """
+        Partitions the segments into groups of consecutive events, one for
+        each job, reading roughly the same amount of data of the session file.
+        Small session files are not partitioned.
+        """
+
+        if self.jobs <= 1 or len(bounds) < 2 or index.size < SHARD_MINIMUM_SIZE:
+            return [bounds]
+
+        bounds = sorted(bounds)
+        weights = []
+        for start, end, _, _ in bounds:
+            byte_range = index.byte_range(start, end)
+            if byte_range is None:
+                weights.append(0)
+            else:
+                weights.append((byte_range[1] or index.size) - byte_range[0])
+
+        # Cut the cumulative amount of data into equal parts
+        cumulative = numpy.cumsum(weights)
+        jobs = min(self.jobs, len(bounds))
+        cuts = numpy.searchsorted(
+            cumulative, cumulative[-1] * numpy.arange(1, jobs) / jobs, 'right')
+        cuts = numpy.unique(numpy.clip(cuts, 1, len(bounds) - 1))
+
+        shards = [
+            [bounds[i] for i in group.tolist()]
+            for group in numpy.split(numpy.arange(len(bounds)), cuts)
+        ]
+        return [shard for shard in shards if shard]
+
+    def extract_tshark(self, pcap_filename, segments):
+        """
+        Extracts each segment using a separate tshark process. Segments of a
+        segment container are extracted into temporary files first.
+        """
+
+        if not self.container:
+            return self.run_tshark(pcap_filename, segments)
+
+        with tempfile.TemporaryDirectory() as directory:
+            segments = [
+                (event_name, start, end,
+                 os.path.join(directory, os.path.basename(output_filename)))
+                for event_name, start, end, output_filename in segments
+            ]
+            self.run_tshark(pcap_filename, segments)
+
+            container = self.container_filename(pcap_filename)
+            with SegmentContainer(container, writable=True) as target:
+                target.metadata['session'] = pcap_filename
+                for event_name, _, end, output_filename in segments:
+                    if not os.path.exists(output_filename):
+                        continue
+
+                    name = os.path.basename(output_filename)
+                    with open(output_filename, 'rb') as source:
+                        with target.writer(name, event_name, self.timestamp_ns(end)) as segment:
+                            shutil.copyfileobj(source, segment)
+
+    def run_tshark(self, pcap_filename, segments):
+        env = os.environ.copy()
+        env['TZ'] = 'UTC'
+
+        for event_name, start, end, output_filename in segments:
+            query = 'frame.time >= "{0}" and frame.time <= "{1}"'.format(
+                start.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                end.strftime("%Y-%m-%d %H:%M:%S.%f")
+            )
+
             try:
                 subprocess.run(
                     [
@@ -131,15 +417,33 @@ class Splitter(PluginBase, metaclass=PluginMount):
             - associate the event interval which has biggest overlap
         """
 
-        def determine_overlap(e):
-            return min(e['end'], interval_end) - max(e['start'], interval_start)
+        return self.get_intervals_allegiance([(interval_start, interval_end)])[0]
+
+    def get_intervals_allegiance(self, intervals):
+        """
+        Determines the most likely events associated with the given
+        (start, end) intervals at once, see assign_events.
+        """
+
+        events = [
+            (self.timestamp_ns(e['start']), self.timestamp_ns(e['end']))
+            for e in self.metadata['events']
+        ]
+        intervals = [
+            (self.timestamp_ns(start), self.timestamp_ns(end))
+            for start, end in intervals
+        ]
 
-        return max(self.metadata['events'], key=determine_overlap)['name']
+        return [
+            self.metadata['events'][index]['name']
+            for index in assign_events(events, intervals)
+        ]
 
     @abc.abstractmethod
     def split_intervals(self, filename):
         """
-        Splits the session file into multiple segments.
+        Splits the session file into multiple segments. Yields the event name,
+        start and end of each segment.
         """
         pass
 
@@ -155,85 +459,205 @@ class MarkSplitter(Splitter):
     def split_intervals(self, *args, **kwargs):
         # Process each event separately
         for event in self.metadata['events']:
-            query = 'frame.time >= "{0}" and frame.time <= "{1}"'.format(
-                event['start'].strftime("%Y-%m-%d %H:%M:%S.%f"),
-                event['end'].strftime("%Y-%m-%d %H:%M:%S.%f")
-            )
-
-            yield query, event['name'], event['end']
+            yield event['name'], event['start'], event['end']
 
 
 class AutoSplitter(Splitter):
     """
     Splits the session file according to smart heuristics that detect the
     beggining and end of a possible event in the PCAP session file.
+
+    Events are separated by gaps in the traffic longer than the configured
+    threshold. In adaptive mode, the threshold is derived from the
+    distribution of the inter-arrival times of each session instead.
     """
 
     identifier = 'auto'
 
-    def split_intervals(self, pcap_filename):
-        # Ignore retrasmissions
-        packets = pyshark.FileCapture(
-            pcap_filename,
-            display_filter='not tcp.analysis.retransmission and '
-                           'not tcp.analysis.fast_retransmission and '
-                           'not arp'
-        )
+    def __init__(self, output_dir, engine='tshark', jobs=1, container=False,
+                 gap=DEFAULT_GAP, adaptive=False):
+        super(AutoSplitter, self).__init__(output_dir, engine, jobs, container)
+        self.gap = float(gap)
+        self.adaptive = adaptive
 
-        current = None
-        previous = None
-        interval_splits = []
-        for current in packets:
-            if not interval_splits:
-                interval_splits.append(current.sniff_time)
+    @staticmethod
+    def read_timestamps(pcap_filename):
+        """
+        Returns the timestamps (in nanoseconds, in file order) of the packets
+        relevant for detecting events. ARP packets and TCP retransmissions
+        are left out.
+        """
 
-            try:
-                sni = current.ssl.handshake_Extensions_server_name
-            except AttributeError:
-                sni = None
+        names = ('frame.time_ns', 'layers', 'conversation', 'tcp.seq_raw',
+                 'tcp.len', 'tcp.flags')
+        columns = {name: [] for name in names}
 
-            try:
-                dns = current.dns.qry_name if current.udp.dstport == 53 else None
-            except AttributeError:
-                dns = None
+        capture = CaptureFile.open(pcap_filename)
+        for decoded in capture.stream_columns(CHUNK_SIZE):
+            for name in names:
+                columns[name].append(decoded[name])
+
+        columns = {
+            name: numpy.concatenate(chunks) if chunks else numpy.zeros(0)
+            for name, chunks in columns.items()
+        }
 
-            if previous is not None:
-                time_gap = current.sniff_time - previous.sniff_time
-                if time_gap.total_seconds() > 2:
-                    self.debug(
-                        "Identified interval split: {}".format(
-                        previous.sniff_time.strftime("%Y-%m-%d %H:%M:%S.%f")
-                    ))
-                    interval_splits.append(previous.sniff_time)
+        arp = (columns['layers'].astype(numpy.int64) & LAYER_BITS['arp']) != 0
+        retransmission = AutoSplitter.retransmissions(
+            columns['conversation'], columns['tcp.seq_raw'],
+            columns['tcp.len'], columns['tcp.flags'])
 
-            previous = current
+        keep = ~arp & ~retransmission
+        return columns['frame.time_ns'][keep].astype(numpy.int64)
+
+    @staticmethod
+    def retransmissions(conversation, sequence, length, flags):
+        """
+        Returns the mask of the TCP segments which carry only data (or SYN
+        and FIN flags) already sent in the same direction of the
+        conversation, i.e. retransmissions and fast retransmissions.
+        """
+
+        mask = numpy.zeros(len(conversation), dtype=bool)
+
+        flags = numpy.nan_to_num(flags).astype(numpy.int64)
+        length = numpy.nan_to_num(length).astype(numpy.int64)
+        control = ((flags & (TCP_SYN | TCP_FIN)) != 0).astype(numpy.int64)
+
+        index = numpy.flatnonzero((conversation != 0) & ((length > 0) | (control > 0)))
+        if not len(index):
+            return mask
+
+        # Group the segments by the direction of the conversation
+        index = index[numpy.argsort(conversation[index], kind='stable')]
+        groups = conversation[index]
+        first = numpy.r_[True, groups[1:] != groups[:-1]]
+        group = numpy.cumsum(first) - 1
+
+        # Sequence numbers relative to the first segment, unwrapped across
+        # the wraparounds: consecutive segments of one direction are less
+        # than 2**31 apart, ahead or behind (RFC 1982)
+        sequence = numpy.nan_to_num(sequence[index]).astype(numpy.int64)
+        step = numpy.r_[0, (numpy.diff(sequence) + 2 ** 31) % 2 ** 32 - 2 ** 31]
+        step[first] = 0
+        relative = numpy.cumsum(step)
+        relative -= relative[first][group]
+        end = relative + length[index] + control[index]
+
+        # The highest sequence number sent so far within each group. The
+        # ranks of the sequence numbers are compared, so that the groups can
+        # be offset from each other without overflowing.
+        _, rank = numpy.unique(end, return_inverse=True)
+        offset = group * len(rank)
+        sent = numpy.maximum.accumulate(rank + offset) - offset
+        previous = numpy.r_[-1, sent[:-1]]
+        previous[first] = -1
+
+        mask[index] = rank <= previous
+        return mask
+
+    def threshold(self, gaps):
+        """
+        Returns the gap (in nanoseconds) separating the events. In adaptive
+        mode, gaps which are outliers of the inter-arrival times of the
+        session separate the events: those exceeding the median by more than
+        ADAPTIVE_DEVIATIONS robust standard deviations (on a log scale).
+        """
+
+        positive = gaps[gaps > 0]
+        if not self.adaptive or len(positive) < ADAPTIVE_MINIMUM_GAPS:
+            return self.gap * 1e9
+
+        logs = numpy.log(positive.astype(numpy.float64))
+        median = numpy.median(logs)
+        deviation = 1.4826 * numpy.median(numpy.abs(logs - median))
+        threshold = numpy.exp(median + ADAPTIVE_DEVIATIONS * deviation)
+
+        self.debug("Adaptive gap threshold: {0:.3f}s".format(threshold / 1e9))
+        return max(threshold, ADAPTIVE_MINIMUM_GAP * 1e9)
+
+    @staticmethod
+    def to_datetime(timestamp):
+        """
+        Converts the timestamp (in nanoseconds) into a naive UTC datetime, as
+        used by the marks.
+        """
+
+        microseconds = (int(timestamp) + 500) // 1000
+        return EPOCH + datetime.timedelta(microseconds=microseconds)
+
+    def split_intervals(self, pcap_filename):
+        try:
+            timestamps = self.read_timestamps(pcap_filename)
+        except CaptureFormatError as exc:
+            self.error("Unable to read '{0}': {1}".format(pcap_filename, exc))
+            return
 
         # Check if we inspected at least something
-        if current is None:
+        if not len(timestamps):
             self.warning("PCAP file '{0}' contains no non-trivial "
                          "packets".format(pcap_filename))
             return
 
+        # Intervals are delimited by the last packets before the gaps
+        gaps = numpy.diff(timestamps)
+        before_gap = numpy.flatnonzero(gaps > self.threshold(gaps))
+        interval_splits = numpy.concatenate([
+            timestamps[:1], timestamps[before_gap], timestamps[-1:]
+        ])
 
-        interval_splits.append(current.sniff_time)
-
-        intervals = []
-        for index in range(len(interval_splits) - 1):
-            intervals.append((interval_splits[index], interval_splits[index+1]))
+        for split in interval_splits[1:-1].tolist():
+            self.debug("Identified interval split: {}".format(
+                self.to_datetime(split).strftime("%Y-%m-%d %H:%M:%S.%f")))
 
-        for interval_start, interval_end in intervals:
-            event_name = self.get_interval_allegiance(interval_start, interval_end)
+        intervals = [
+            (self.to_datetime(start), self.to_datetime(end))
+            for start, end in zip(interval_splits[:-1].tolist(),
+                                  interval_splits[1:].tolist())
+        ]
+        event_names = self.get_intervals_allegiance(intervals)
 
-            query = 'frame.time >= "{0}" and frame.time <= "{1}"'.format(
-                interval_start.strftime('%Y-%m-%d %H:%M:%S.%f'),
-                interval_end.strftime('%Y-%m-%d %H:%M:%S.%f')
-            )
+        for event_name, (interval_start, interval_end) in zip(event_names, intervals):
+            yield event_name, interval_start, interval_end
 
-            yield query, event_name, interval_end
 
+def write_segments(pcap_filename, segments, index=None, container=None):
+    """
+    Writes the segments of the session file, given by their (inclusive) start
+    and end timestamps in nanoseconds, output filenames and event names. Only
+    the parts of the session file around the segments are read, using its
+    packet index. If the segment container is given, the segments are
+    appended to it instead of being written into separate files.
+    """
 
-def process_file(cls, output_dir, path):
-    splitter = cls(output_dir)
+    index = index or PacketIndex.for_path(pcap_filename)
+    capture = CaptureFile.open(pcap_filename)
+    header = capture.header()
+
+    if container:
+        with SegmentContainer(container, writable=True) as target:
+            target.metadata['session'] = pcap_filename
+            for start, end, output_filename, event_name in segments:
+                selected = index.select(capture, start, end)
+                name = os.path.basename(output_filename)
+                with target.writer(name, event_name, end) as segment:
+                    segment.write(header)
+                    capture.copy_records(selected, segment)
+        return
+
+    for start, end, output_filename, _ in segments:
+        selected = index.select(capture, start, end)
+
+        # Write atomically, existing segments are not generated again
+        partial = output_filename + '.part'
+        with open(partial, 'wb') as segment:
+            segment.write(header)
+            capture.copy_records(selected, segment)
+        os.replace(partial, output_filename)
+
+
+def process_file(cls, output_dir, path, engine='tshark', options=None):
+    splitter = cls(output_dir, engine, **(options or {}))
     splitter.execute(path)
 
 
@@ -244,6 +668,13 @@ def main():
     method = arguments['--method']
     filepaths = arguments['<file>']
     parallel = arguments['--parallel']
+    engine = arguments['--engine']
+
+    options = {'container': arguments['--container']}
+
+    # Options of the automatic splitting
+    if method == 'auto':
+        options.update(gap=arguments['--gap'], adaptive=arguments['--adaptive'])
 
     # Setup logging
     Splitter.setup_logging()
@@ -255,14 +686,20 @@ def main():
     if not os.path.isdir(output_dir):
         os.mkdir(output_dir)
 
+    # A single file is split in shards using all the cores. Several files are
+    # split in parallel, each by one process, as the shards of files split in
+    # the joblib workers could not use processes of their own.
+    if parallel and len(filepaths) == 1:
+        options['jobs'] = config.NUM_JOBS
+
     # Split each input file
-    if parallel:
+    if parallel and len(filepaths) > 1:
         Parallel(n_jobs=config.NUM_JOBS)(
-            delayed(process_file)(splitter_cls, output_dir, path)
+            delayed(process_file)(splitter_cls, output_dir, path, engine, options)
             for path in filepaths
         )
     else:
-        splitter = splitter_cls(output_dir)
+        splitter = splitter_cls(output_dir, engine, **options)
         for filepath in filepaths:
             splitter.execute(filepath)
 
@@ -0,0 +1,194 @@
+"""
+Helpers for building packet tables from streams of packets in bounded memory.
+"""
+
+import itertools
+import resource
+
+import numpy
+import pandas
+
+
+def chunked(iterable, size):
+    """
+    Splits the iterable into lists of at most 'size' items, consuming it
+    lazily.
+    """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ColumnBuffer(object):
+    """
+    Accumulates packet tables chunk by chunk into preallocated column arrays,
+    which grow geometrically as needed. Numeric parameters are kept as
+    floats and text parameters as objects. The final table has the same
+    column types as a table built from all the packets at once: integer
+    columns without missing values are integers, and columns with no values
+    at all hold None.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.size = 0
+        self.columns = {}
+        self.integral = {}
+        self.seen = {}
+
+    def reserve(self, size):
+        """
+        Makes sure the buffer can hold the given number of rows.
+        """
+
+        if size <= self.capacity:
+            return
+
+        while self.capacity < size:
+            self.capacity *= 2
+
+        for name, values in self.columns.items():
+            grown = self.allocate(values.dtype, self.capacity)
+            grown[:self.size] = values[:self.size]
+            self.columns[name] = grown
+
+    @staticmethod
+    def allocate(dtype, capacity):
+        if dtype == object:
+            return numpy.full(capacity, None, dtype=object)
+        return numpy.full(capacity, numpy.nan)
+
+    def append(self, chunk):
+        """
+        Appends the packet table of one chunk of packets.
+        """
+
+        start, end = self.size, self.size + len(chunk)
+        self.reserve(end)
+
+        for name in chunk.columns:
+            values = chunk[name].values
+            null = pandas.isnull(values)
+            numeric = values.dtype.kind in 'biuf'
+
+            if name not in self.columns:
+                self.columns[name] = self.allocate(numpy.float64, self.capacity)
+                self.integral[name] = True
+                self.seen[name] = False
+
+            column = self.columns[name]
+            if not numeric and not null.all() and column.dtype != object:
+                # First text values of the column, convert the storage
+                converted = self.allocate(object, self.capacity)
+                converted[:start] = numpy.where(
+                    numpy.isnan(column[:start]), None, column[:start])
+                self.columns[name] = column = converted
+
+            if column.dtype == object:
+                # Share one object per distinct value, packets mostly repeat
+                # the same few (i.e. directions)
+                present = ~null
+                uniques, inverse = numpy.unique(
+                    numpy.asarray(values[present], dtype=str), return_inverse=True)
+                target = column[start:end]
+                target[null] = None
+                target[present] = uniques.astype(object)[inverse]
+            elif numeric:
+                column[start:end] = values
+                self.integral[name] &= values.dtype.kind in 'biu'
+
+            self.seen[name] |= not null.all()
+
+        self.size = end
+
+    def table(self, columns=None):
+        """
+        Returns the accumulated packet table. The buffer is emptied column by
+        column while the table is built, so that the memory is not held twice.
+        """
+
+        data = pandas.DataFrame(index=pandas.RangeIndex(self.size))
+        for name in list(columns or self.columns):
+            values = self.columns.pop(name, None)
+            if not self.seen.get(name):
+                data[name] = numpy.full(self.size, None, dtype=object)
+                continue
+
+            values = values[:self.size]
+            if values.dtype != object and self.integral[name] \
+                    and not numpy.isnan(values).any():
+                values = values.astype(numpy.int64)
+            data[name] = values
+            del values
+
+        self.columns.clear()
+        self.size = 0
+        return data
+
+
+def retype(table, integral):
+    """
+    Restores the column types of a table holding a subset of the rows of a
+    larger packet table, as ColumnBuffer would determine them for the subset
+    alone. The integral columns are those of parameters holding integers.
+    """
+
+    for name in table.columns:
+        values = table[name].values
+        null = pandas.isnull(values)
+        if null.all():
+            table[name] = numpy.full(len(table), None, dtype=object)
+        elif name in integral and values.dtype.kind == 'f' and not null.any():
+            table[name] = values.astype(numpy.int64)
+
+    return table
+
+
+def reset_peak_rss():
+    """
+    Resets the peak resident set size of the current process, if supported
+    by the platform (Linux 4.0+).
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size (in bytes) of the current process
+    since the last reset.
+    """
+
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # Kilobytes on Linux, not resettable
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss():
+    """
+    Returns the current resident set size (in bytes) of the current process,
+    or None if it cannot be determined.
+    """
+
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
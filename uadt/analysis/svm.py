@@ -4,10 +4,11 @@
 SVM - train and evaluate support vector machine on a given dataset.
 
 Usage:
-  svm.py <dataset> (--optimize | -C=<value> --gamma=<value>) [--train=<fraction>] [--confusion] [--outfile=<path>]
+  svm.py <dataset> (--optimize | -C=<value> --gamma=<value>) [--train=<fraction>] [--confusion] [--outfile=<path>] [--search=<method>]
 
 Options:
   --optimize          Specify that SVM should find optimal parameters for C and gamma.
+  --search=<method>   The search method of --optimize: grid, or the faster halving or hyperband [default: grid].
   -C=<value>          Manual value for C (must be used together with --gamma)
   --gamma=<value>     Manual value for gamma (must be used together with -C)
   --train=<fraction>  Specifies the portion of the data set that should be used for training [default: 0.7].
@@ -16,17 +17,93 @@ Options:
 
 Examples:
 $ python svm.py data1000.csv --optimize --train=0.8
+$ python svm.py data1000.csv --optimize --search=halving
 $ python svm.py data1000.csv -C 512 --gamma 0.5
 """
 
+import contextlib
+import itertools
+import os
+import tempfile
+
 import pandas
 import numpy
 from docopt import docopt
-from sklearn import svm, model_selection, preprocessing
 from joblib import Parallel, delayed
+from sklearn import svm, model_selection, preprocessing
+from sklearn.metrics.pairwise import rbf_kernel
 
 from uadt import config
-from uadt.analysis.model import Model
+from uadt.analysis.model import FOLDS, Model
+from uadt.analysis.shared import attach
+
+
+# Kernel matrices larger than this (in bytes) are kept in memory-mapped files
+KERNEL_MEMORY_LIMIT = 256 * 1024 ** 2
+
+# The number of rows of the kernel matrix computed at once
+KERNEL_BLOCK_ROWS = 1024
+
+
+@contextlib.contextmanager
+def kernel_matrix(X, Y, gamma):
+    """
+    Computes the RBF kernel matrix of the rows of X against the rows of Y,
+    block by block. Large matrices are written into a temporary memory-mapped
+    file, removed when the with block ends.
+    """
+
+    shape = (len(X), len(Y))
+    if shape[0] * shape[1] * 8 <= KERNEL_MEMORY_LIMIT:
+        yield rbf_kernel(X, Y, gamma=gamma)
+        return
+
+    descriptor, path = tempfile.mkstemp(prefix='uadt-kernel-', suffix='.dat')
+    os.close(descriptor)
+    try:
+        matrix = numpy.memmap(path, dtype=numpy.float64, mode='w+', shape=shape)
+        for start in range(0, shape[0], KERNEL_BLOCK_ROWS):
+            end = start + KERNEL_BLOCK_ROWS
+            matrix[start:end] = rbf_kernel(X[start:end], Y, gamma=gamma)
+        yield matrix
+        del matrix
+    finally:
+        os.remove(path)
+
+
+def fit_kernel(handle, hyperparameters, C_values, samples=None, folds=FOLDS):
+    """
+    Cross validates the SVM with the given gamma for each of the given
+    values of C. The kernel matrices of each fold are computed once and
+    shared by the fits of all the C values. Returns the success rates for
+    the values of C, averaged over the folds.
+    """
+
+    X, y = attach(handle)
+    X = X[:samples]
+    y = y[:samples]
+
+    hyperparameters = dict(hyperparameters)
+    gamma = hyperparameters.pop('gamma')
+
+    five_fold = model_selection.KFold(n_splits=FOLDS)
+    splits = list(itertools.islice(five_fold.split(X, y), folds))
+
+    C_values = sorted(C_values)
+    rates = numpy.zeros(len(C_values))
+
+    for fold_train, fold_test in splits:
+        X_train = X[fold_train]
+        y_train = y[fold_train]
+
+        with kernel_matrix(X_train, X_train, gamma) as train_kernel, \
+                kernel_matrix(X[fold_test], X_train, gamma) as test_kernel:
+            for position, C in enumerate(C_values):
+                classifier = svm.SVC(kernel='precomputed', C=C, **hyperparameters)
+                model = classifier.fit(train_kernel, y_train)
+                rates[position] += model.score(test_kernel, y[fold_test])
+
+    return dict(zip(C_values, rates / len(splits)))
 
 
 class Machine(Model):
@@ -34,21 +111,39 @@ class Machine(Model):
     scale_data = True
     classifier_cls = svm.SVC
 
-    def optimize_paramters(self):
+    search_space = {
+        'C': [2.0**(2*p-1) for p in range(-2, 9)],
+        'gamma': [2.0**(2*p-1) for p in range(-8, 3)],
+        'decision_function_shape': ['ovr'],
+    }
+
+    # Fit the candidates against kernel matrices computed once per gamma
+    precompute_kernel = True
+
+    def test_candidates(self, handle, candidates, samples=None, folds=FOLDS):
         """
-        Optimizes C and gamma parameters.
+        Cross validates the candidates differing only in C against the same
+        precomputed RBF kernel matrices. The final classifier still uses the
+        RBF kernel directly.
         """
 
-        C_candidates = [2.0**(2*p-1) for p in range(-2, 9)]
-        gamma_candidates = [2.0**(2*p-1) for p in range(-8, 3)]
+        if not self.precompute_kernel or any(
+                candidate.get('kernel', 'rbf') != 'rbf' for candidate in candidates):
+            return super(Machine, self).test_candidates(
+                handle, candidates, samples, folds)
+
+        groups = self.group_candidates(candidates, 'C')
 
-        rates = Parallel(n_jobs=config.NUM_JOBS)(
-            delayed(self.test_parameters)(C=C, gamma=gamma, decision_function_shape='ovr')
-            for C in C_candidates
-            for gamma in gamma_candidates
+        results = Parallel(n_jobs=config.NUM_JOBS)(
+            delayed(fit_kernel)(handle, dict(key), C_values, samples, folds)
+            for key, C_values in groups.items()
         )
+        rates = dict(zip(groups, results))
 
-        _, self.hyperparameters = max(rates, key=lambda x: x[0])
+        return [
+            rates[self.group_key(candidate, 'C')][candidate['C']]
+            for candidate in candidates
+        ]
 
 
 def main():
@@ -60,7 +155,7 @@ def main():
 
     if arguments.get('--optimize'):
         print("Searching for optimal parameters..")
-        machine.optimize_paramters()
+        machine.optimize_paramters(arguments['--search'])
     elif arguments.get('-C') and arguments.get('--gamma'):
         machine.hyperparameters = {
             'C': float(arguments.get('-C')),
@@ -8,14 +8,13 @@ Usage:
 
 Options:
   --threshold=<value>  The edit distance above which timeline should notify about the session [default: 0.5].
+
+The session files can also be segment containers of already split sessions.
 """
 
 import datetime
-import glob
 import json
-import os
 import pprint
-import tempfile
 
 import editdistance
 import pandas
@@ -24,8 +23,9 @@ import joblib
 from docopt import docopt
 
 from uadt import config, constants
-from uadt.analysis.splitter import Splitter
 from uadt.analysis.flow import Flow
+from uadt.analysis.segments import EXTENSION, SegmentContainer
+from uadt.analysis.splitter import Splitter
 
 
 NOISE = [
@@ -114,41 +114,40 @@ class TimelineExtractor(object):
 
         predictions = []
 
+        # Segment containers record the session file they were split from
+        session_path = session_file
+        if session_file.endswith(EXTENSION):
+            with SegmentContainer(session_file) as container:
+                session_path = container.metadata.get('session', session_file)
+
         # First check if the marks file is available
         try:
-            marks_filepath = '.'.join(session_file.split('.')[:-1]) + '.marks'
+            marks_filepath = '.'.join(session_path.split('.')[:-1]) + '.marks'
             ground_truth = Timeline.from_marks_file(marks_filepath)
         except FileNotFoundError:
             return None
 
-        # Generate temporary output dir to store the splitted PCAPs
-        with tempfile.TemporaryDirectory() as temp_output_dir:
-            splitter = Splitter.get_plugin('auto')(temp_output_dir)
-            splitter.execute(session_file)
-
-            splitted_files = glob.glob(os.path.join(temp_output_dir, '*.pcap'))
-            for splitted_file in splitted_files:
-                flow = Flow.from_path(splitted_file)
+        for flow in self.flows(session_file):
 
-                # If the flow contains no data, let's skip
-                if flow.empty:
-                    continue
+            # If the flow contains no data, let's skip
+            if flow.empty:
+                continue
 
-                event = {
-                    'start': flow.interval[0],
-                    'end': flow.interval[1]
-                }
+            event = {
+                'start': flow.interval[0],
+                'end': flow.interval[1]
+            }
 
-                features = flow.features
-                features.pop('class')
-                data = pandas.DataFrame([features]).fillna(0).as_matrix()
+            features = flow.features
+            features.pop('class')
+            data = pandas.DataFrame([features]).fillna(0).as_matrix()
 
-                event_id = self.evaluate(data)
-                for key, value in constants.CLASSES.items():
-                    if value == event_id:
-                        event['name'] = key
+            event_id = self.evaluate(data)
+            for key, value in constants.CLASSES.items():
+                if value == event_id:
+                    event['name'] = key
 
-                predictions.append(event)
+            predictions.append(event)
 
 
         predicted = Timeline(predictions)
@@ -162,6 +161,26 @@ class TimelineExtractor(object):
 
         return distance
 
+    @staticmethod
+    def flows(session_file):
+        """
+        Yields the flows of the segments of the session file. Sessions are
+        split in memory (parsed only once), segment containers are read
+        segment by segment.
+        """
+
+        if session_file.endswith(EXTENSION):
+            with SegmentContainer(session_file) as container:
+                paths = container.paths()
+
+            for path in paths:
+                yield Flow.from_path(path)
+            return
+
+        splitter = Splitter.get_plugin('auto')(None)
+        for _, _, _, flow in splitter.split_flows(session_file):
+            yield flow
+
     def evaluate(self, X):
         """
         Evaluates the model on the unseen data.
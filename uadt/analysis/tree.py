@@ -4,10 +4,12 @@
 Tree - train and evaluate support vector machine on a given dataset.
 
 Usage:
-  tree.py <dataset> [--train=<fraction>] [--optimize] [--confusion] [--outfile=<path>]
+  tree.py <dataset> [--train=<fraction>] [--optimize] [--search=<method>] [--confusion] [--outfile=<path>]
 
 Options:
   --train=<fraction>  Specifies the portion of the data set that should be used for training [default: 0.7].
+  --optimize          Search for the optimal depth of the tree.
+  --search=<method>   The search method of --optimize: grid, or the faster halving or hyperband [default: grid].
   --confusion         Displays the confusion matrix.
   --outfile=<path>    Save the trained model at the given path.
 
@@ -18,9 +20,7 @@ $ python tree.py data1000.csv --train=0.8
 
 from docopt import docopt
 from sklearn import tree
-from joblib import Parallel, delayed
 
-from uadt import config
 from uadt.analysis.model import Model
 
 
@@ -31,19 +31,10 @@ class Tree(Model):
 
     classifier_cls = tree.DecisionTreeClassifier
 
-    def optimize_paramters(self):
-        """
-        Optimizes tree depth.
-        """
+    search_space = {
+        'max_depth': list(range(3, 20)),
+    }
 
-        max_depth_candidates = range(3, 20)
-
-        rates = Parallel(n_jobs=config.NUM_JOBS)(
-            delayed(self.test_parameters)(max_depth=depth)
-            for depth in max_depth_candidates
-        )
-
-        _, self.hyperparameters = max(rates, key=lambda x: x[0])
 
 def main():
     arguments = docopt(__doc__)
@@ -54,7 +45,7 @@ def main():
 
     if arguments.get('--optimize'):
         print("Searching for optimal parameters..")
-        machine.optimize_paramters()
+        machine.optimize_paramters(arguments['--search'])
 
     machine.initialize_classifier()
 
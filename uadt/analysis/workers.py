@@ -0,0 +1,89 @@
+"""
+Memory control of the worker processes of long dataset runs. Workers exceed
+their memory ceiling either by slowly leaking memory over many files, in
+which case they are restarted once they finish the current file, or by
+processing a single file which needs too much memory, in which case they are
+stopped before the machine starts swapping.
+"""
+
+import os
+import threading
+import time
+
+from uadt.analysis.stream import current_rss
+
+
+# Exit codes of the workers stopped by the memory control
+RECYCLE_EXIT_CODE = 75
+OVERSIZED_EXIT_CODE = 76
+
+# Workers exceeding the ceiling by this factor while processing a file are
+# stopped immediately
+HARD_LIMIT_FACTOR = 1.5
+
+# How often (in seconds) the watchdog checks the memory of the worker
+WATCHDOG_INTERVAL = 1
+
+_watchdog = None
+
+# The memory of the worker when it started, the limits apply to the memory
+# used on top of it
+_baseline = None
+
+
+def measure_baseline():
+    """
+    Records the memory of the fresh worker, once.
+    """
+
+    global _baseline
+
+    if _baseline is None:
+        _baseline = current_rss() or 0
+
+
+def over_limit(limit):
+    """
+    Determines whether the memory of the worker grew by more than the given
+    limit (in bytes, None for no limit) since it started.
+    """
+
+    if not limit:
+        return False
+
+    rss = current_rss()
+    return rss is not None and rss - (_baseline or 0) > limit
+
+
+def recycle(limit):
+    """
+    Restarts the worker if it exceeds the memory limit. Called at the start
+    of each task, the task is then scheduled again. The first call in a
+    fresh worker measures its baseline memory, so that limits below it do
+    not restart every worker before it does any work.
+    """
+
+    measure_baseline()
+    if over_limit(limit):
+        os._exit(RECYCLE_EXIT_CODE)
+
+
+def watch(limit):
+    """
+    Starts the watchdog stopping the worker once it exceeds the hard memory
+    limit, derived from the given ceiling (in bytes).
+    """
+
+    global _watchdog
+
+    if not limit or _watchdog is not None:
+        return
+
+    def watchdog():
+        while True:
+            if over_limit(limit * HARD_LIMIT_FACTOR):
+                os._exit(OVERSIZED_EXIT_CODE)
+            time.sleep(WATCHDOG_INTERVAL)
+
+    _watchdog = threading.Thread(target=watchdog, daemon=True)
+    _watchdog.start()
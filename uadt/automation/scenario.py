@@ -11,6 +11,7 @@ import json
 from selenium.common.exceptions import StaleElementReferenceException
 
 from uadt import config, constants
+from uadt.analysis.index import PacketIndex
 from uadt.plugins import PluginBase, PluginMount
 from uadt.automation.generator import DataGenerator
 from uadt.automation.driver import ImageRecognitionDriver
@@ -253,6 +254,10 @@ class Scenario(PluginBase, metaclass=PluginMount):
             # action has time to happen
             time.sleep(timeout)
             p.terminate()
+            p.wait()
+
+        # Index the session file, so that events can be extracted quickly
+        PacketIndex.for_path(filename)
 
     def execute(self):
         """